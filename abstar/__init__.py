@@ -1,20 +1,35 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from .core.abstar import run, run_standalone, main, parse_arguments, validate_args
+import sys
+
+from .core.abstar import run, stream, reannotate, run_standalone, main, parse_arguments, validate_args
 from .preprocess import fastqc, adapter_trim, quality_trim
 
-from pkg_resources import get_distribution, DistributionNotFound
-import os.path
-
-try:
-    _dist = get_distribution('abstar')
-    # Normalize case for Windows systems
-    dist_loc = os.path.normcase(_dist.location)
-    here = os.path.normcase(__file__)
-    if not here.startswith(os.path.join(dist_loc, 'abstar')):
-        # not installed, but there is another version that *is*
-        raise DistributionNotFound
-except DistributionNotFound:
-    __version__ = 'Please install AbStar before checking the version'
-else:
-    __version__ = _dist.version
+
+# The version lookup and the server and asyncio interfaces aren't needed by most
+# AbStar runs, so on Python 3.7+ they're loaded on first access (PEP 562).
+def _get_version():
+    from .version import get_version
+    version = get_version()
+    if version is None:
+        return 'Please install AbStar before checking the version'
+    return version
+
+
+def __getattr__(name):
+    if name == '__version__':
+        return _get_version()
+    if name == 'run_remote':
+        from .core.server import run_remote
+        return run_remote
+    if name == 'run_async' and sys.version_info >= (3, 5):
+        from .core.aio import run_async
+        return run_async
+    raise AttributeError("module 'abstar' has no attribute '{}'".format(name))
+
+
+if sys.version_info < (3, 7):
+    __version__ = _get_version()
+    from .core.server import run_remote
+    if sys.version_info >= (3, 5):
+        from .core.aio import run_async
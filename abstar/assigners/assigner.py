@@ -71,6 +71,11 @@ class BaseAssigner(object):
                       information contained in these ``VDJ`` objects will be logged
                       (even if AbStar was not run in debug mode).
 
+      - ``stats``: a dict of run statistics (integer counts, keyed by name) that
+                 the Assigner would like to report, like the number of sequences
+                 processed by each of several assignment methods. Stats are summed
+                 over all jobs and reported at the end of the run. Optional.
+
       - ``germline_directory``: path to the directory containing germline databases.
                               Germline DBs are heirarchically grouped into separate folders
                               first by species, then by the Assigner for which they were
@@ -110,6 +115,10 @@ class BaseAssigner(object):
     the ``species`` argument. The simplest was to do this is by using ``super()``, like this:
     ``super(MyAssigner, self).__init__(species)``, where ``MyAssigner`` is your assigner class.
 
+    Your assigner may also accept keyword arguments for assigner-specific options. Options are
+    provided at runtime with ``--assigner-option KEY=VALUE`` and are passed to ``__init__()``
+    as keyword arguments (values are converted to ``int``, ``float`` or ``bool`` if possible).
+
 
     Implementing the ``__call__()`` method
     --------------------------------------
@@ -197,7 +206,8 @@ class BaseAssigner(object):
     IMGT format, like 'IGHV3-23*01') and the species. Several other optional arguments can be included
     at instantiation. ``score`` is the assignment score, typically an ``int`` or ``float``. ``strand``
     indicates the strand orientation of the input sequence (``'+'`` or ``'-'``). ``others`` is a list
-    of additional high scoring ``GermlineSegment`` objects. ``assigner_name`` is the name of the custom
+    of additional high scoring germline genes, as ``GermlineHit`` objects (lightweight
+    ``(full, assigner_score)`` named tuples). ``assigner_name`` is the name of the custom
     Assigner (as a ``str``), and will be converted to lowercase before recording in AbStar output.
 
     ``GermlineSegment`` objects also provide a few additional public attributes that may be desirable
@@ -227,7 +237,7 @@ class BaseAssigner(object):
 
         from abstar.assigners.assigner import BaseAssigner
         from abstar.core.vdj import VDJ
-        from abstar.core.germline import GermlineSegment
+        from abstar.core.germline import GermlineHit, GermlineSegment
 
         from Bio import SeqIO
 
@@ -283,7 +293,7 @@ class BaseAssigner(object):
                     vdj.log('{}-ASSIGNMENT ERROR:'.format(segment),
                             'Score ({}) is too low'.format(germs[0].score))
                     return None
-                others = [GermlineSegment(germ.name, self.species, score=germ.score) for germ in germs[1:6]]
+                others = [GermlineHit(germ.name, germ.score) for germ in germs[1:6]]
                 return GermlineSegment(germs[0].name, self.species, score=germs[0].score, others=others)
 
     """
@@ -296,6 +306,7 @@ class BaseAssigner(object):
         self.species = species
         self._assigned = None
         self._unassigned = None
+        self._stats = None
         self._germline_directory = None
         self._binary_directory = None
 
@@ -342,3 +353,13 @@ class BaseAssigner(object):
     @unassigned.setter
     def unassigned(self, unassigned):
         self._unassigned = unassigned
+
+    @property
+    def stats(self):
+        if self._stats is None:
+            self._stats = {}
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats):
+        self._stats = stats
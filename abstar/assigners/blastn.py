@@ -26,16 +26,13 @@ import platform
 from tempfile import NamedTemporaryFile
 import traceback
 
-from Bio import SeqIO
-from Bio.Blast.Applications import NcbiblastnCommandline
-from Bio.Blast import NCBIXML
-
 from abutils.core.sequence import Sequence
 from abutils.utils.alignment import local_alignment
 
 from .assigner import BaseAssigner
-from ..core.germline import GermlineSegment
+from ..core.germline import GermlineHit, GermlineSegment, get_ungapped_germline_sequences
 from ..core.vdj import VDJ
+from ..utils.prefilter import CHAINS, get_kmer_index
 
 
 
@@ -49,33 +46,80 @@ class Blastn(BaseAssigner):
 
 
     def __call__(self, sequence_file, file_format):
+        seqs = self.read_input(sequence_file, file_format)
+
+        # assign V-genes. Queries are oriented before BLASTing, so only the plus strand
+        # of the germline database is searched (unless the orientation is uncertain).
+        oriented, strands = self.orient_queries(seqs)
+        vchains = self.route_queries(oriented)
+        vquery_file = sequence_file if all([o is s for o, s in zip(oriented, seqs)]) else None
+        vblast_records = self.blast_by_chain(oriented, 'V', vchains, strands=strands, seq_file=vquery_file)
+        vdjs, jquery_seqs = self.assign_vgenes(seqs, vblast_records, oriented=oriented)
+        if not vdjs:
+            return
+
+        # assign J-genes (using the chain of the assigned V-gene). J-gene queries
+        # are taken from the oriented sequence, so only the plus strand is searched.
+        jchains = [vdj.v.chain for vdj in vdjs]
+        jblast_records = self.blast_by_chain(jquery_seqs, 'J', jchains)
+        vdjs, dquery_seqs = self.assign_jgenes(vdjs, jquery_seqs, jblast_records)
+
+        # assign D-genes
+        self.assigned = self.assign_dgenes(vdjs, dquery_seqs)
+
+
+    # @property
+    # def name(self):
+    #     return 'blastn'
+
+
+    @staticmethod
+    def read_input(sequence_file, file_format):
+        '''
+        Reads the input sequences. If the input file is FASTQ-formatted, it will be
+        re-written in FASTA format, since BLASTn can't read FASTQ files.
+        '''
+        from Bio import SeqIO
         with open(sequence_file, 'r') as sequence_handle:
             seqs = [Sequence(s) for s in SeqIO.parse(sequence_handle, file_format)]
-        vdjs = []
-
         # if the input file is FASTQ-formatted, need to convert it to FASTA for BLASTn to work
         if file_format == 'fastq':
             with open(sequence_file, 'w') as handle:
                 handle.write('\n'.join(s.fasta for s in seqs))
+        return seqs
 
-        # assign V-genes
-        vblast_records = self.blast(sequence_file, self.species, 'V')
+
+    def assign_vgenes(self, seqs, vblast_records, oriented=None):
+        '''
+        Assigns V-genes using V-gene BLASTn records.
+
+        V-gene BLASTn records must be from the oriented queries (see ``orient_queries()``),
+        which should be provided as ``oriented`` if any of them differ from ``seqs``. Queries
+        with an uncertain orientation are re-oriented using their BLASTn alignment.
+
+        Returns a list of VDJ objects and a list containing the J-gene query
+        sequence for each of the VDJ objects. Sequences that couldn't be
+        assigned are added to ``self.unassigned``.
+        '''
+        vdjs = []
+        jquery_seqs = []
         # if there aren't any vblast_records, that means that none of the
         # sequences in the input file contained sequences with a significant
         # match to any germline V-gene. These are likely all non-antibody sequences.
         if not vblast_records:
-            vdjs = [VDJ(seq) for seq in seqs]
-            for vdj in vdjs:
+            for seq in seqs:
+                vdj = VDJ(seq)
                 vdj.log('V-GENE ASSIGNMENT ERROR:',
                         'No variable gene was found.',
                         'Query sequence does not appear to contain a rearranged antibody.')
-            self.unassigned = vdjs
-            return
-        jquery_seqs = []
-        for seq, vbr in zip(seqs, vblast_records):
+                self.unassigned.append(vdj)
+            return vdjs, jquery_seqs
+        for i, (seq, vbr) in enumerate(zip(seqs, vblast_records)):
             try:
                 germ = self.process_blast_record(vbr, self.species)
                 vdj = VDJ(seq, v=germ)
+                if oriented is not None:
+                    vdj.oriented = oriented[i]
                 self.orient_query(vdj, vbr)
                 jquery = self.get_jquery_sequence(vdj.oriented, vbr)
                 # only try to find J-genes if there's a minimum of 10 nucleotides
@@ -100,12 +144,19 @@ class Blastn(BaseAssigner):
                 vdj = VDJ(seq)
                 vdj.exception('V-GENE ASSIGNMENT ERROR', traceback.format_exc())
                 self.unassigned.append(vdj)
+        return vdjs, jquery_seqs
 
-        # assign J-genes
+
+    def assign_jgenes(self, vdjs, jquery_seqs, jblast_records):
+        '''
+        Assigns J-genes using J-gene BLASTn records.
+
+        Returns a list of VDJ objects with J-gene assignments and a list containing
+        the D-gene query sequence for each of the VDJ objects. Sequences that couldn't
+        be assigned are added to ``self.unassigned``.
+        '''
         _vdjs = []
         dquery_seqs = []
-        jblast_infile = self.build_jblast_input(jquery_seqs)
-        jblast_records = self.blast(jblast_infile, self.species, 'J')
         for vdj, jquery, jbr in zip(vdjs, jquery_seqs, jblast_records):
             try:
                 germ = self.process_blast_record(jbr, self.species)
@@ -123,10 +174,16 @@ class Blastn(BaseAssigner):
             except:
                 vdj.exception('V-GENE ASSIGNMENT ERROR', traceback.format_exc())
                 self.unassigned.append(vdj)
-        os.unlink(jblast_infile)
-        vdjs = _vdjs
+        return _vdjs, dquery_seqs
 
-        # assign D-genes
+
+    def assign_dgenes(self, vdjs, dquery_seqs):
+        '''
+        Assigns D-genes to heavy chain VDJ objects.
+
+        Returns a list of successfully assigned VDJ objects. Sequences that
+        couldn't be assigned are added to ``self.unassigned``.
+        '''
         _vdjs = []
         for vdj, dquery in zip(vdjs, dquery_seqs):
             if all([vdj.v.chain == 'heavy', dquery]):
@@ -138,15 +195,125 @@ class Blastn(BaseAssigner):
                     self.unassigned.append(vdj)
                     continue
             _vdjs.append(vdj)
-        self.assigned = _vdjs
+        return _vdjs
 
 
-    # @property
-    # def name(self):
-    #     return 'blastn'
+    def orient_queries(self, seqs):
+        '''
+        Determines the orientation of each query sequence from germline k-mer matches.
+        Queries that are the reverse complement of the germline genes are reverse complemented,
+        so that they can be BLASTed against only the plus strand of the germline database.
 
+        Returns:
+        --------
 
-    def blast(self, seq_file, species, segment):
+            tuple: A list of oriented query sequences and a list containing the strand(s) that
+                should be searched for each query (``'plus'`` or, for queries whose orientation
+                couldn't be determined, ``'both'``). Queries that weren't reverse complemented
+                are returned unchanged.
+        '''
+        oriented = []
+        strands = []
+        for seq, strand in zip(seqs, get_kmer_index(self.species).orient([s.sequence for s in seqs])):
+            if strand == 'minus':
+                oriented.append(Sequence(seq.reverse_complement, id=seq.id))
+            else:
+                oriented.append(seq)
+            strands.append('both' if strand is None else 'plus')
+        return oriented, strands
+
+
+    def route_queries(self, seqs):
+        '''
+        Determines the likely chain of each query sequence from germline k-mer matches, so
+        that each query can be BLASTed against only the V-genes of that chain.
+
+        Returns a list containing the chain of each query, or ``None`` for queries that
+        couldn't be confidently assigned to a single chain. If there aren't any chain-specific
+        V-gene BLAST databases for the species, the queries aren't classified and all
+        chains are ``None``.
+        '''
+        if not any([self.blast_database('V', chain) != self.blast_database('V') for chain in CHAINS]):
+            return [None] * len(seqs)
+        return get_kmer_index(self.species).classify([s.sequence for s in seqs])
+
+
+    def blast_database(self, segment, chain=None):
+        '''
+        Returns the path to the BLASTn database for ``segment``. If ``chain`` is provided and
+        a chain-specific database (built by ``build_abstar_germline_db``) exists, the
+        chain-specific database is returned. Otherwise, the combined database is returned.
+        '''
+        blast_dir = os.path.join(self.germline_directory, 'blast')
+        if chain is not None:
+            chain_db = os.path.join(blast_dir, '{}_{}'.format(segment.lower(), chain))
+            if any([os.path.isfile(chain_db + ext) for ext in ['.nsq', '.nal']]):
+                return chain_db
+        return os.path.join(blast_dir, segment.lower())
+
+
+    def group_by_database(self, segment, chains, strands=None):
+        '''
+        Groups queries by the BLASTn database and strand(s) they should be searched against.
+
+        Returns a list of ``(database, strand, indexes)`` tuples, where ``indexes`` are the
+        positions of the queries to be searched against ``database``.
+        '''
+        if strands is None:
+            strands = ['plus'] * len(chains)
+        # each chain's database is only resolved once, rather than once per query
+        databases = {}
+        groups = {}
+        for i, (chain, strand) in enumerate(zip(chains, strands)):
+            if chain not in databases:
+                databases[chain] = self.blast_database(segment, chain)
+            groups.setdefault((databases[chain], strand), []).append(i)
+        return [(database, strand, indexes) for (database, strand), indexes in sorted(groups.items())]
+
+
+    def blast_by_chain(self, seqs, segment, chains, strands=None, seq_file=None):
+        '''
+        Runs BLASTn, searching each (oriented) query against the database for its chain. Queries
+        are batched so that there is a single BLASTn search for each database and strand.
+
+        Args:
+        -----
+
+            seqs (list): Query sequences, as abutils ``Sequence`` objects.
+
+            segment (str): Germline segment to query. Options are ``V`` and ``J``.
+
+            chains (list): The chain of each query sequence, or ``None`` if the
+                combined database should be used.
+
+            strands (list): The strand(s) to be searched for each query (``'plus'``
+                or ``'both'``). Default is to search only the plus strand for all queries.
+
+            seq_file (str): Path to a FASTA-formatted file containing ``seqs``. If provided,
+                it is used as the query file if all queries are searched against the same
+                database and strand(s).
+
+        Returns:
+        --------
+
+            list: BLASTn records, in the same order as ``seqs``.
+        '''
+        groups = self.group_by_database(segment, chains, strands)
+        if len(groups) == 1 and seq_file is not None:
+            database, strand, _ = groups[0]
+            return self.blast(seq_file, self.species, segment, database=database, strand=strand)
+        records = [None] * len(seqs)
+        for database, strand, indexes in groups:
+            group_file = self.build_blast_input([seqs[i] for i in indexes])
+            group_records = self.blast(group_file, self.species, segment, database=database, strand=strand)
+            os.unlink(group_file)
+            for i, record in zip(indexes, group_records):
+                records[i] = record
+        # if none of the searches returned any records, BLASTn failed
+        return records if any([r is not None for r in records]) else []
+
+
+    def blast(self, seq_file, species, segment, database=None, strand='plus'):
         '''
         Runs BLASTn against an antibody germline database.
 
@@ -159,35 +326,63 @@ class Blastn(BaseAssigner):
                 Options are: ``human``, ``macaque``, ``mouse`` and ``rabbit``.
 
             segment (str): Germline segment to query. Options are ``V`` and ``J``.
+
+            database (str): Path to the BLASTn database. Default is the combined
+                (all chains) database for ``segment``.
+
+            strand (str): Query strand(s) to search. Options are ``'both'``, ``'plus'``
+                and ``'minus'``. Default is ``'plus'``, since queries are usually oriented
+                before BLASTing.
         '''
-        blast_path = os.path.join(self.binary_directory, 'blastn_{}'.format(platform.system().lower()))
-        blast_db_path = os.path.join(self.germline_directory, 'blast/{}'.format(segment.lower()))
         blastout = NamedTemporaryFile(delete=False, mode='r')
-        blastn_cmd = NcbiblastnCommandline(cmd=blast_path,
-                                           db=blast_db_path,
-                                           query=seq_file,
-                                           out=blastout.name,
-                                           outfmt=5,
-                                           dust='no',
-                                           word_size=self._word_size(segment),
-                                           max_target_seqs=10,
-                                           evalue=self._evalue(segment),
-                                           reward=self._match_reward(segment),
-                                           penalty=self._mismatch_penalty(segment),
-                                           gapopen=self._gap_open(segment),
-                                           gapextend=self._gap_extend(segment))
+        blastout.close()
+        blastn_cmd = self.blast_commandline(seq_file, segment, blastout.name, database=database, strand=strand)
         stdout, stderr = blastn_cmd()
-        blast_records = [br for br in NCBIXML.parse(blastout)]
-        os.unlink(blastout.name)
+        return self.parse_blast_output(blastout.name)
+
+
+    def blast_commandline(self, seq_file, segment, out_file, database=None, strand='plus'):
+        '''
+        Builds the BLASTn command for querying ``seq_file`` against an antibody germline
+        database. Results will be written to ``out_file`` in XML format.
+
+        Returns a Biopython ``NcbiblastnCommandline`` object.
+        '''
+        from Bio.Blast.Applications import NcbiblastnCommandline
+        blast_path = os.path.join(self.binary_directory, 'blastn_{}'.format(platform.system().lower()))
+        blast_db_path = database if database is not None else self.blast_database(segment)
+        return NcbiblastnCommandline(cmd=blast_path,
+                                     db=blast_db_path,
+                                     query=seq_file,
+                                     out=out_file,
+                                     outfmt=5,
+                                     strand=strand,
+                                     dust='no',
+                                     word_size=self._word_size(segment),
+                                     max_target_seqs=10,
+                                     evalue=self._evalue(segment),
+                                     reward=self._match_reward(segment),
+                                     penalty=self._mismatch_penalty(segment),
+                                     gapopen=self._gap_open(segment),
+                                     gapextend=self._gap_extend(segment))
+
+
+    @staticmethod
+    def parse_blast_output(blast_file):
+        '''
+        Parses (and then deletes) an XML-formatted BLASTn output file.
+        '''
+        from Bio.Blast import NCBIXML
+        with open(blast_file, 'r') as blastout:
+            blast_records = [br for br in NCBIXML.parse(blastout)]
+        os.unlink(blast_file)
         return blast_records
 
 
     def assign_dgene(self, seq, species):
-        db_file = os.path.join(self.germline_directory, 'ungapped/d.fasta')
-        with open(db_file, 'r') as db_handle:
-            germs = [Sequence(s) for s in SeqIO.parse(db_handle, 'fasta')]
-            rc_germs = [Sequence(s.reverse_complement, id=s.id) for s in germs]
-            germs.extend(rc_germs)
+        germs = get_ungapped_germline_sequences(species, 'D')
+        rc_germs = [Sequence(s.reverse_complement, id=s.id) for s in germs]
+        germs.extend(rc_germs)
         alignments = local_alignment(seq, targets=germs,
                                      gap_open=-20, gap_extend=-2)
         alignments.sort(key=lambda x: x.score, reverse=True)
@@ -197,7 +392,7 @@ class Blastn(BaseAssigner):
             return None
         top_gl = all_gls[0]
         top_score = all_scores[0]
-        others = [GermlineSegment(germ, species, score=score) for germ, score in zip(all_gls[1:6], all_scores[1:6])]
+        others = [GermlineHit(germ, score) for germ, score in zip(all_gls[1:6], all_scores[1:6])]
         return GermlineSegment(top_gl, species, score=top_score, others=others, assigner_name=self.name)
 
 
@@ -206,13 +401,15 @@ class Blastn(BaseAssigner):
         all_scores = [a.hsps[0].bits for a in blast_record.alignments]
         top_gl = all_gls[0]
         top_score = all_scores[0]
-        others = [GermlineSegment(germ, species, score=score) for germ, score in zip(all_gls[1:], all_scores[1:])]
-        return GermlineSegment(top_gl, species, score=top_score, others=others[:5], assigner_name=self.name)
+        others = [GermlineHit(germ, score) for germ, score in zip(all_gls[1:6], all_scores[1:6])]
+        return GermlineSegment(top_gl, species, score=top_score, others=others, assigner_name=self.name)
 
 
     @staticmethod
     def orient_query(vdj, vbr):
         hsp = vbr.alignments[0].hsps[0]
+        # Queries are usually oriented before BLASTing (see orient_queries()) and only the
+        # plus strand is searched, so this only applies to queries with an uncertain orientation.
         # BLASTn always reverse complements the Subject sequence, never the query.
         # To determine whether the input sequence is the reverse complement, check
         # to see if the Subject sequence was reverse-complemented by BLASTn
@@ -242,10 +439,15 @@ class Blastn(BaseAssigner):
 
     @staticmethod
     def build_jblast_input(jseqs):
-        jblast_input = NamedTemporaryFile(delete=False, mode='w')
-        jblast_input.write('\n'.join([s.fasta for s in jseqs]))
-        jblast_input.close()
-        return jblast_input.name
+        return Blastn.build_blast_input(jseqs)
+
+
+    @staticmethod
+    def build_blast_input(seqs):
+        blast_input = NamedTemporaryFile(delete=False, mode='w')
+        blast_input.write('\n'.join([s.fasta for s in seqs]))
+        blast_input.close()
+        return blast_input.name
 
 
     @staticmethod
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# filename: cascade.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import namedtuple
+import logging
+import os
+import traceback
+
+import numpy as np
+
+from abutils.core.sequence import Sequence
+
+from .assigner import BaseAssigner
+from .blastn import Blastn
+from ..core.germline import GermlineHit, GermlineSegment, get_ungapped_germline_sequences
+from ..core.vdj import VDJ
+from ..utils.prefilter import DEFAULT_KMER_SIZE, encode_sequence, germline_chain, get_kmer_index, kmer_codes
+
+
+SeedHit = namedtuple('SeedHit', ['name', 'score', 'coverage', 'query_start',
+                                 'query_end', 'germline_start', 'germline_end'])
+
+_SEED_INDEXES = {}
+
+
+
+class Cascade(BaseAssigner):
+    '''
+    Two-stage assigner. V- and J-genes are first assigned in-process using exact k-mer
+    seeds, and only reads that can't be confidently assigned that way are sent to BLASTn
+    (in a single batch). D-genes are assigned the same way as the ``blastn`` assigner.
+
+    A seed assignment is considered confident if the top germline gene shares at least
+    ``min_margin`` more k-mers with the read than the next best germline gene, and the read
+    contains at least ``min_coverage`` (as a fraction) of the top germline gene's k-mers.
+    Both criteria must be met for the V- and J-gene.
+
+    If ``concordance`` is ``True``, all reads are also assigned with BLASTn and the BLASTn
+    assignments are used. Seed assignments are compared to the BLASTn assignments and the
+    number of concordant V- and J-gene assignments are reported in the run stats.
+
+    Each read is counted in exactly one of the ``cascade_seed`` (assigned only with seeds),
+    ``cascade_blastn`` (assigned only with BLASTn) and ``cascade_checked`` (assigned with
+    seeds and BLASTn, in concordance mode) stats, and ``cascade_reads`` is the total.
+
+    Options (passed with ``--assigner-option KEY=VALUE``):
+
+        min_margin (int): Default is 10.
+
+        min_coverage (float): Default is 0.5.
+
+        k (int): Seed length. Default is 13.
+
+        concordance (bool): Default is ``False``.
+    '''
+
+    def __init__(self, species, min_margin=10, min_coverage=0.5, k=DEFAULT_KMER_SIZE, concordance=False):
+        super(Cascade, self).__init__(species)
+        self.min_margin = int(min_margin)
+        self.min_coverage = float(min_coverage)
+        self.k = int(k)
+        self.concordance = concordance
+
+
+    def __call__(self, sequence_file, file_format):
+        seqs = Blastn.read_input(sequence_file, file_format)
+        vindex = get_seed_index(self.species, 'V', self.k)
+        jindex = get_seed_index(self.species, 'J', self.k)
+        strands = get_kmer_index(self.species, self.k).orient([s.sequence for s in seqs])
+
+        # seed assignment
+        seeded = []
+        seeded_dquery_seqs = []
+        blast_seqs = []
+        for seq, strand in zip(seqs, strands):
+            vdj = None
+            if strand is not None:
+                try:
+                    vdj, dquery = self.seed_assign(seq, strand, vindex, jindex)
+                except:
+                    logging.debug('CASCADE SEED ASSIGNMENT ERROR: {}\n{}'.format(seq.id, traceback.format_exc()))
+            if vdj is None or self.concordance:
+                blast_seqs.append(seq)
+            if vdj is not None:
+                seeded.append(vdj)
+                seeded_dquery_seqs.append(dquery)
+        checked = len(seeded) if self.concordance else 0
+        self.stats['cascade_reads'] = len(seqs)
+        self.stats['cascade_seed'] = len(seeded) - checked
+        self.stats['cascade_blastn'] = len(blast_seqs) - checked
+        self.stats['cascade_checked'] = checked
+
+        # BLASTn assignment of everything else
+        blastn = Blastn(self.species)
+        if blast_seqs:
+            blast_file = Blastn.build_blast_input(blast_seqs)
+            blastn(blast_file, 'fasta')
+            os.unlink(blast_file)
+        if self.concordance:
+            self.assigned = blastn.assigned
+            self.compare_assignments(seeded, blastn.assigned)
+        else:
+            assigned = blastn.assigned + blastn.assign_dgenes(seeded, seeded_dquery_seqs)
+            # return the assigned sequences in input order
+            order = {}
+            for i, seq in enumerate(seqs):
+                order.setdefault(seq.id, i)
+            self.assigned = sorted(assigned, key=lambda vdj: order.get(vdj.id, len(seqs)))
+        self.unassigned = blastn.unassigned
+
+
+    def seed_assign(self, seq, strand, vindex, jindex):
+        '''
+        Assigns V- and J-genes using exact k-mer seeds.
+
+        Args:
+        -----
+
+            seq (Sequence): Query sequence.
+
+            strand (str): Orientation of ``seq`` relative to the germline genes,
+                either ``'plus'`` or ``'minus'``.
+
+            vindex (SeedIndex): V-gene seed index.
+
+            jindex (SeedIndex): J-gene seed index.
+
+        Returns:
+        --------
+
+            tuple: A ``VDJ`` object and the D-gene query sequence, or ``(None, None)``
+                if the V- or J-gene couldn't be confidently assigned.
+        '''
+        oriented = seq if strand == 'plus' else Sequence(seq.reverse_complement, id=seq.id)
+        vhits = vindex.search(oriented.sequence)
+        if not self.is_confident(vhits):
+            return None, None
+        jquery = oriented.sequence[vhits[0].query_end:]
+        # same minimum J-gene query length as the blastn assigner
+        if len(jquery) < 10:
+            return None, None
+        jhits = jindex.search(jquery, chain=germline_chain(vhits[0].name))
+        if not self.is_confident(jhits):
+            return None, None
+        vdj = VDJ(seq, v=self.germline_segment(vhits), j=self.germline_segment(jhits))
+        vdj.oriented = oriented
+        dquery_end = max(0, jhits[0].query_start - jhits[0].germline_start)
+        return vdj, Sequence(jquery[:dquery_end], id=seq.id)
+
+
+    def is_confident(self, hits):
+        if not hits:
+            return False
+        top = hits[0]
+        runner_up = hits[1].score if len(hits) > 1 else 0
+        return all([top.coverage >= self.min_coverage,
+                    top.score - runner_up >= self.min_margin])
+
+
+    def germline_segment(self, hits):
+        others = [GermlineHit(h.name, h.score) for h in hits[1:6]]
+        return GermlineSegment(hits[0].name, self.species, score=hits[0].score,
+                               others=others, assigner_name=self.name)
+
+
+    def compare_assignments(self, seeded, blasted):
+        '''
+        Compares seed assignments to BLASTn assignments and updates ``stats`` with the
+        number of seed-assigned reads and the number with concordant V- and J-gene
+        (and allele) assignments.
+        '''
+        blast_vdjs = {}
+        for vdj in blasted:
+            blast_vdjs.setdefault(vdj.id, vdj)
+        counts = {'concordance_compared': len(seeded),
+                  'concordance_v_gene': 0,
+                  'concordance_v_allele': 0,
+                  'concordance_j_gene': 0,
+                  'concordance_j_allele': 0}
+        for vdj in seeded:
+            b = blast_vdjs.get(vdj.id, None)
+            if b is None:
+                logging.debug('CASCADE DISCORDANCE: {} was seed-assigned but not assigned by BLASTn'.format(vdj.id))
+                continue
+            for segment in ['v', 'j']:
+                seed_germ = getattr(vdj, segment)
+                blast_germ = getattr(b, segment)
+                if seed_germ.gene == blast_germ.gene:
+                    counts['concordance_{}_gene'.format(segment)] += 1
+                if seed_germ.full == blast_germ.full:
+                    counts['concordance_{}_allele'.format(segment)] += 1
+                else:
+                    logging.debug('CASCADE DISCORDANCE: {} {}-gene: seed={}, BLASTn={}'.format(vdj.id,
+                                                                                              segment.upper(),
+                                                                                              seed_germ.full,
+                                                                                              blast_germ.full))
+        self.stats.update(counts)
+
+
+
+class SeedIndex(object):
+    '''
+    Exact k-mer seed index for the germline genes of a single segment (V, D or J).
+
+    Germline genes with identical sequences are collapsed, and the first name in the
+    germline database is used.
+    '''
+    # read-only arrays that can be shared between processes (see ``utils.arena``)
+    SHARED_ARRAYS = ['chains', 'kmer_counts', 'codes', 'genes', 'positions']
+
+    def __init__(self, species, gene_type, k=DEFAULT_KMER_SIZE):
+        super(SeedIndex, self).__init__()
+        self.species = species
+        self.gene_type = gene_type
+        self.k = k
+        self.names = []
+        seen = set()
+        codes = []
+        genes = []
+        positions = []
+        for g in get_ungapped_germline_sequences(species, gene_type):
+            seq = g.sequence.upper()
+            if seq in seen:
+                continue
+            seen.add(seq)
+            c, valid = kmer_codes(encode_sequence(seq), k)
+            genes.append(np.full(valid.sum(), len(self.names), dtype=np.int64))
+            codes.append(c[valid])
+            positions.append(np.flatnonzero(valid))
+            self.names.append(g.id)
+        self.chains = np.array([germline_chain(n) or '' for n in self.names])
+        self.kmer_counts = np.array([len(c) for c in codes], dtype=np.int64)
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.uint64)
+        order = np.argsort(codes, kind='mergesort')
+        self.codes = codes[order]
+        self.genes = np.concatenate(genes)[order] if genes else np.zeros(0, dtype=np.int64)
+        self.positions = np.concatenate(positions)[order] if positions else np.zeros(0, dtype=np.int64)
+
+
+    def search(self, sequence, chain=None, max_hits=6):
+        '''
+        Finds the germline genes that share the most k-mers with ``sequence``.
+
+        Args:
+        -----
+
+            sequence (str): Query sequence, in the same orientation as the germline genes.
+
+            chain (str): If provided, only germline genes of this chain are considered.
+
+            max_hits (int): Maximum number of hits to return. Default is 6.
+
+        Returns:
+        --------
+
+            list: ``SeedHit`` objects, sorted by score (the number of shared k-mers). Query
+                and germline positions are 0-based, and end positions are exclusive.
+        '''
+        codes, valid = kmer_codes(encode_sequence(sequence), self.k)
+        query_positions = np.flatnonzero(valid)
+        codes = codes[valid]
+        left = np.searchsorted(self.codes, codes, side='left')
+        right = np.searchsorted(self.codes, codes, side='right')
+        counts = right - left
+        total = int(counts.sum())
+        if total == 0:
+            return []
+        # expand each query k-mer into all of its matching germline k-mers
+        starts = np.cumsum(counts) - counts
+        matches = np.arange(total) + np.repeat(left - starts, counts)
+        genes = self.genes[matches]
+        qpos = np.repeat(query_positions, counts)
+        gpos = self.positions[matches]
+        if chain is not None:
+            keep = self.chains[genes] == chain
+            genes = genes[keep]
+            qpos = qpos[keep]
+            gpos = gpos[keep]
+        scores = np.bincount(genes, minlength=len(self.names))
+        hits = []
+        for g in np.argsort(-scores, kind='mergesort')[:max_hits].tolist():
+            if scores[g] == 0:
+                break
+            m = genes == g
+            hits.append(SeedHit(self.names[g],
+                                int(scores[g]),
+                                min(1., float(scores[g]) / max(1, self.kmer_counts[g])),
+                                int(qpos[m].min()),
+                                int(qpos[m].max()) + self.k,
+                                int(gpos[m].min()),
+                                int(gpos[m].max()) + self.k))
+        return hits
+
+
+
+def get_seed_index(species, gene_type, k=DEFAULT_KMER_SIZE):
+    '''
+    Returns the ``SeedIndex`` for ``species`` and ``gene_type``. Indexes are only
+    built once per process.
+    '''
+    key = (species.lower(), gene_type.upper(), k)
+    if key not in _SEED_INDEXES:
+        _SEED_INDEXES[key] = SeedIndex(species, gene_type, k)
+    return _SEED_INDEXES[key]
@@ -24,6 +24,10 @@
 
 # from .assigner import BaseAssigner
 from .blastn import Blastn
+from .cascade import Cascade
+from .stored import Stored
 
 
-ASSIGNERS = {'blastn': Blastn}
+ASSIGNERS = {'blastn': Blastn,
+             'cascade': Cascade,
+             'stored': Stored}
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# filename: stored.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import csv
+import json
+import logging
+import traceback
+
+from abutils.core.sequence import Sequence
+
+from .assigner import BaseAssigner
+from ..core.germline import GermlineHit, GermlineSegment
+from ..core.vdj import VDJ
+from ..utils.prefilter import DEFAULT_KMER_SIZE, get_kmer_index, kmers
+
+
+# file formats of stored annotations
+STORED_FORMATS = ['json', 'minimal']
+
+
+class Stored(BaseAssigner):
+    '''
+    Re-uses the germline assignments from previously annotated sequences (JSON or
+    minimal output), so that sequences can be re-annotated without re-running germline
+    assignment. The V-, D- and J-gene calls are taken from the stored annotation, and
+    everything downstream of germline assignment (realignment, junction identification,
+    mutations, etc) is re-computed from the raw input sequence.
+
+    Stored annotations must include ``seq_id``, ``raw_input`` and the V- and J-gene calls,
+    so JSON output created with ``--json-keys`` may not be usable.
+    '''
+
+    def __call__(self, sequence_file, file_format):
+        records = []
+        for _, record in self.iter_annotations(sequence_file, file_format):
+            if record.get('raw_input'):
+                records.append(record)
+            else:
+                logging.debug('STORED ANNOTATION: {} has no raw input'.format(record.get('seq_id')))
+        raw_seqs = [r['raw_input'] for r in records]
+        strands = get_kmer_index(self.species).orient(raw_seqs)
+        for record, strand in zip(records, strands):
+            try:
+                vdj = self.build_vdj(record, strand)
+                if vdj.v is None or vdj.j is None:
+                    vdj.log('STORED ANNOTATION: missing V- or J-gene assignment')
+                    self.unassigned.append(vdj)
+                else:
+                    self.assigned.append(vdj)
+            except:
+                logging.debug('STORED ANNOTATION ERROR: {}\n{}'.format(record.get('seq_id'), traceback.format_exc()))
+
+
+    @staticmethod
+    def iter_annotations(sequence_file, file_format):
+        '''
+        Iterates over the stored annotations in a JSON or minimal-formatted file.
+
+        Yields ``(line, record)`` tuples, where ``line`` is the unmodified annotation (without
+        the trailing newline) and ``record`` is the annotation as a dict. Minimal-formatted
+        annotations are converted to the same structure as JSON annotations, although only
+        ``seq_id``, ``raw_input`` and the germline calls are included.
+        '''
+        with open(sequence_file) as f:
+            if file_format.lower() == 'minimal':
+                header = next(csv.reader([f.readline()]))
+            for line in f:
+                if not line.strip():
+                    continue
+                if file_format.lower() == 'json':
+                    record = json.loads(line)
+                else:
+                    record = _minimal_record(dict(zip(header, next(csv.reader([line])))))
+                yield line.rstrip('\n'), record
+
+
+    def build_vdj(self, record, strand=None):
+        '''
+        Builds a ``VDJ`` object from a stored annotation.
+
+        Args:
+        -----
+
+            record (dict): Stored annotation, in JSON format.
+
+            strand (str): Orientation of the raw input relative to the germline genes
+                (``'plus'`` or ``'minus'``), as determined by a k-mer vote. If the stored
+                annotation contains the oriented input, it is used instead.
+
+        Returns:
+        --------
+
+            VDJ
+        '''
+        seq = Sequence([record['seq_id'], record['raw_input']])
+        if record.get('oriented_input'):
+            strand = self.orientation(seq.sequence, record['oriented_input'])
+        vdj = VDJ(seq,
+                  v=self.germline_segment(record.get('v_gene'), record),
+                  d=self.germline_segment(record.get('d_gene'), record),
+                  j=self.germline_segment(record.get('j_gene'), record))
+        if strand == 'minus':
+            vdj.oriented = Sequence(seq.reverse_complement, id=seq.id)
+        vdj.umi_count = record.get('umi_count')
+        return vdj
+
+
+    def germline_segment(self, gene, record):
+        if not gene or not gene.get('full'):
+            return None
+        others = [GermlineHit(o['full'], o.get('assigner_score', o.get('score')))
+                  for o in gene.get('others', []) if o.get('full')]
+        return GermlineSegment(gene['full'],
+                               self.species,
+                               score=gene.get('assigner_score'),
+                               others=others,
+                               assigner_name=record.get('vdj_assigner', self.name))
+
+
+    @staticmethod
+    def orientation(raw_input, oriented_input, k=DEFAULT_KMER_SIZE):
+        '''
+        Determines whether the stored oriented input is the raw input or its reverse
+        complement. Frameshift indels are removed from the oriented input during
+        annotation, so the comparison is made using shared k-mers rather than identity.
+        '''
+        oriented = set(kmers(oriented_input, k).tolist())
+        plus = len(oriented & set(kmers(raw_input, k).tolist()))
+        minus = len(oriented & set(kmers(raw_input, k, reverse_complement=True).tolist()))
+        return 'minus' if minus > plus else 'plus'
+
+
+
+def _minimal_record(row):
+    record = {'seq_id': row.get('seq_id'),
+              'raw_input': row.get('raw_input'),
+              'v_gene': {'full': row.get('v_full')},
+              'j_gene': {'full': row.get('j_full')}}
+    if row.get('d_full') not in [None, '', '-']:
+        record['d_gene'] = {'full': row['d_full']}
+    return record
@@ -16,17 +16,20 @@
 
 # config file for Celery Daemon
 
+import os
+
 # default RabbitMQ broker
 # BROKER_URL = 'amqp://'
 
-# Redis broker
-BROKER_URL = 'redis://master:6379/0'
+# Redis broker (can be overridden with the ABSTAR_BROKER_URL environment
+# variable, for example 'memory://' to use Celery's in-memory broker for testing)
+BROKER_URL = os.environ.get('ABSTAR_BROKER_URL', 'redis://master:6379/0')
 
 # default RabbitMQ backend
 # CELERY_RESULT_BACKEND = 'amqp://'
 
-# Redis backend
-CELERY_RESULT_BACKEND = 'redis://master:6379/0'
+# Redis backend (can be overridden with the ABSTAR_RESULT_BACKEND environment variable)
+CELERY_RESULT_BACKEND = os.environ.get('ABSTAR_RESULT_BACKEND', 'redis://master:6379/0')
 
 # Additional Redis-specific configs
 BROKER_TRANSPORT_OPTIONS = {'fanout_prefix': True,
@@ -26,21 +26,24 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from argparse import ArgumentParser
 from glob import glob
+import collections
+import copy
+import functools
 import gzip
+import itertools
 import logging
-from multiprocessing import Pool
+from multiprocessing import cpu_count, Pool, Queue
 import os
-import pkg_resources
 import re
+import shutil
 from subprocess import Popen, PIPE
 import sys
 import tempfile
+import threading
 import time
 import traceback
 import warnings
 
-from Bio import SeqIO
-
 from abutils.core.sequence import Sequence
 from abutils.utils import log
 # from abutils.utils.pipeline import list_files
@@ -48,18 +51,32 @@ from abutils.utils import log
 from .antibody import Antibody
 from ..assigners.assigner import BaseAssigner
 from ..assigners.registry import ASSIGNERS
+from ..assigners.stored import STORED_FORMATS, Stored
 # from ..utils import output
-from ..utils.output import get_abstar_result, get_output, write_output, get_header
-from ..utils.queue.celery import celery
+from ..utils.arena import attach_arena, create_arena
+from ..utils.cache import AnnotationCache
+from ..utils.manifest import RunManifest, file_fingerprint
+from ..utils.payload import decode_file, encode_file
+from ..utils.output import format_json_output, get_abstar_result, get_output, write_output, get_header
+from ..utils.prefilter import Prefilter
+from ..utils.sqlite import merge_sqlite
+from ..utils.stragglers import SPECULATIVE_SPLITS, SequenceTimeout, StragglerTracker, time_limit
+from ..utils.umi import build_umi_consensus
+from ..version import get_version
 
 
 if sys.version_info[0] > 2:
     STR_TYPES = [str, ]
+    import queue
 else:
     STR_TYPES = [str, unicode]
+    import Queue as queue
+
+
+# maximum number of assigned sub-batches waiting to be annotated (see assign_sub_batches)
+PIPELINE_DEPTH = 2
 
 
-__version__ = pkg_resources.require("abstar")[0].version
 
 # ASSIGNERS = {cls.__name__.lower(): cls for cls in vars()['BaseAssigner'].__subclasses__()}
 
@@ -71,7 +88,7 @@ __version__ = pkg_resources.require("abstar")[0].version
 #####################################################################
 
 
-def parse_arguments(print_help=False):
+def parse_arguments(print_help=False, argv=None):
     parser = ArgumentParser(prog='abstar', description="VDJ assignment and antibody sequence annotation. Scalable from a single sequence to billions of sequences.")
     parser.add_argument('-p', '--project', dest='project_dir', default=None,
                         help="The data directory, where files will be downloaded (or have previously \
@@ -100,18 +117,25 @@ def parse_arguments(print_help=False):
     parser.add_argument('-a', '--assigner', dest='assigner', default='blastn',
                         help='VDJ germline assignment method to use. \
                         Options are: {}. Default is blastn'.format(', '.join(ASSIGNERS.keys())))
+    parser.add_argument('--assigner-option', dest='assigner_options', action='append', default=None,
+                        help="Assigner-specific option, formatted as KEY=VALUE. Can be provided more than once. \
+                        For example, the 'cascade' assigner accepts 'min_margin', 'min_coverage', 'k' and \
+                        'concordance': '--assigner-option min_margin=15 --assigner-option concordance=true'.")
     parser.add_argument('-k', '--chunksize', dest='chunksize', default=500, type=int,
                         help="Approximate number of sequences in each distributed job. \
                         Defaults to 500. \
                         Set to 0 if you want file splitting to be turned off \
                         Don't change unless you know what you're doing.")
     parser.add_argument('-O', '--output-type', dest="output_type", action='append',
-                        choices=['json', 'imgt', 'minimal'],
-                        help="Select the output type. Options are 'json', 'imgt' and 'minimal'. \
+                        choices=['json', 'imgt', 'minimal', 'mongodb', 'sqlite'],
+                        help="Select the output type. Options are 'json', 'imgt', 'minimal', 'mongodb' and 'sqlite'. \
                         IMGT output mimics the Summary table produced by IMGT High-V/Quest, \
                         to maintain some level of compatibility with existing IMGT-based pipelines. \
                         JSON output is much more detailed, and is suitable for direct import into MongoDB. \
                         Minimal output is in CSV format. \
+                        MongoDB output inserts JSON records directly into a MongoDB database (see --mongo-db). \
+                        SQLite output is a single SQLite database per input file, with indexed columns for \
+                        core fields (genes, CDR3, etc) and the complete JSON record. \
                         Defaults to JSON output.")
     parser.add_argument('-m', '--merge', dest="merge", action='store_true', default=False,
                         help="Use if the input files are paired-end FASTQs \
@@ -166,14 +190,100 @@ def parse_arguments(print_help=False):
     parser.add_argument('--pretty', dest='pretty', default=False, action='store_true',
                         help='Pretty format json file')
     parser.add_argument('-v', '--version', action='version', \
-                        version='%(prog)s {version}'.format(version=__version__))
+                        version='%(prog)s {version}'.format(version=get_version()))
     parser.add_argument('--add-padding', dest='padding', default=False, action='store_true',
                         help="If passed, will eliminate padding from json file. \
                         Don't use if you don't know what you are doing")
+    parser.add_argument('--cache', dest='cache', default=False, action='store_true',
+                        help="If set, annotations will be stored in (and retrieved from) a persistent cache, \
+                        so that sequences which have been previously annotated with the same species, \
+                        germline database and AbStar version are not re-annotated. \
+                        The cache is only used when all output types are 'json'. Default is False.")
+    parser.add_argument('--cache-dir', dest='cache_dir', default=None,
+                        help="Directory for the annotation cache. Default is '~/.abstar/cache'.")
+    parser.add_argument('--cache-size', dest='cache_size', default=2048, type=int,
+                        help="Maximum size of the annotation cache, in MB. \
+                        Once the cache reaches the maximum size, the least recently used annotations are removed. \
+                        Default is 2048.")
+    parser.add_argument('--resume', dest='resume', default=False, action='store_true',
+                        help="If set, resumes an interrupted run using the run manifest in the temp directory. \
+                        Input files that were completely processed are skipped, and only unfinished jobs \
+                        are re-run for partially processed files. Default is False.")
+    parser.add_argument('--prefilter', dest='prefilter', default=False, action='store_true',
+                        help="If set, reads that share too few k-mers with every V-gene in the germline database \
+                        (in either orientation) are removed before germline assignment. This is much faster than \
+                        BLASTing and logging primer dimers, PhiX and other non-antibody reads. \
+                        Removed reads are counted, but not logged. Default is False.")
+    parser.add_argument('--prefilter-min-kmers', dest='prefilter_min_kmers', default=3, type=int,
+                        help="Minimum number of k-mers a read must share with the V-gene germline database \
+                        to pass the prefilter. Default is 3.")
+    parser.add_argument('--umi-consensus', dest='umi_consensus', default=False, action='store_true',
+                        help="If set, reads are grouped by UID (which requires --uid) and a single consensus \
+                        sequence is annotated for each UID. For FASTQ input, base calls are weighted by quality. \
+                        The number of reads for each UID is recorded in the output. Default is False.")
+    parser.add_argument('--mongo-db', dest='mongo_db', default=None,
+                        help="MongoDB database into which annotations will be inserted. \
+                        Required if the output type is 'mongodb'.")
+    parser.add_argument('--mongo-collection', dest='mongo_collection', default=None,
+                        help="MongoDB collection into which annotations will be inserted. \
+                        Default is to use the input file name (minus the extension), the same as JSON output files.")
+    parser.add_argument('--mongo-ip', dest='mongo_ip', default='localhost',
+                        help="IP address of the MongoDB server. Default is 'localhost'.")
+    parser.add_argument('--mongo-port', dest='mongo_port', default=27017, type=int,
+                        help="MongoDB port. Default is 27017.")
+    parser.add_argument('--mongo-user', dest='mongo_user', default=None,
+                        help="Username for the MongoDB server. Not used if not provided.")
+    parser.add_argument('--mongo-password', dest='mongo_password', default=None,
+                        help="Password for the MongoDB server. Not used if not provided.")
+    parser.add_argument('--mongo-batch-size', dest='mongo_batch_size', default=1000, type=int,
+                        help="Number of annotations inserted into MongoDB at a time by each job. Default is 1000.")
+    parser.add_argument('--mongo-index', dest='mongo_indexes', action='append', default=None,
+                        help="Field to index once all annotations have been inserted into MongoDB. \
+                        Can be provided more than once. Default is to not create any indexes.")
+    parser.add_argument('--previous-germline-db', dest='previous_germline_db', default=None,
+                        help="Only used when re-annotating stored annotations. The germline database (a species name \
+                        or the path to a germline database directory) used to create the stored annotations. \
+                        Only stored annotations that could be affected by differences between this germline database \
+                        and the current one are re-assigned, everything else is carried forward unchanged.")
+    parser.add_argument('--reassigner', dest='reassigner', default='blastn',
+                        help="Only used with --previous-germline-db. The assigner used to re-assign stored annotations \
+                        that could be affected by the germline database update. Assigner options (--assigner-option) \
+                        are applied to this assigner. Default is blastn.")
+    parser.add_argument('--reassign-margin', dest='reassign_margin', default=0, type=float,
+                        help="Only used with --previous-germline-db. Stored annotations for which the difference between \
+                        the assigner scores of the top V- or J-gene and the next best alternative is less than this margin \
+                        are re-assigned even if their germline genes are unchanged. Default is 0, which disables the check.")
+    parser.add_argument('--sub-batch-size', dest='sub_batch_size', default=0, type=int,
+                        help="Splits each job into sub-batches of this many sequences, so that germline assignment \
+                        (BLASTn) for the next sub-batch runs while the current sub-batch is being annotated. \
+                        Default is 0, which assigns all of a job's sequences at once.")
+    parser.add_argument('--jobs-per-worker', dest='jobs_per_worker', default=2, type=int,
+                        help="Maximum number of queued jobs for each worker process (or Celery worker). Input files \
+                        are split as jobs are queued, so this limits the number of split files on disk. Default is 2.")
+    parser.add_argument('--inline-payloads', dest='inline_payloads', action='store_true', default=False,
+                        help="Only used with --cluster. Input sequences are sent to Celery workers (compressed) in the \
+                        task message, and job outputs are returned in the task result, so worker nodes don't need \
+                        a shared filesystem.")
+    parser.add_argument('--fuse-chunks', dest='fuse_chunks', default=1, type=int,
+                        help="Only used with --cluster. Number of jobs combined into each Celery task, which reduces \
+                        the number of task messages and results when jobs are small. Default is 1.")
+    parser.add_argument('--sequence-timeout', dest='sequence_timeout', default=0, type=float,
+                        help="Maximum time (in seconds) to annotate a single sequence. Sequences that take longer \
+                        are logged as failed. The limit is best-effort: it applies to annotation only (not germline \
+                        assignment with BLASTn) and can't interrupt code that doesn't return to the Python interpreter. \
+                        Default is 0, which disables the time limit.")
+    parser.add_argument('--chunk-timeout', dest='chunk_timeout', default=0, type=float,
+                        help="Jobs that have been running for longer than this (in seconds) are split into smaller \
+                        jobs, which are re-dispatched while the original job continues to run. Whichever finishes \
+                        first is used. Default is 0, which disables the time limit.")
+    parser.add_argument('--straggler-factor', dest='straggler_factor', default=0, type=float,
+                        help="Jobs that have been running for more than this many times the median job time are \
+                        split and re-dispatched, as with --chunk-timeout. Default is 0, which disables \
+                        straggler detection.")
     if print_help:
         parser.print_help()
     else:
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
         return args
 
 
@@ -183,7 +293,13 @@ class Args(object):
                  merge=False, pandaseq_algo='simple_bayesian', use_test_data=False,
                  nextseq=False, uid=0, isotype=False, pretty=False,
                  basespace=False, cluster=False, padding=True, raw=False, json_keys=None,
-                 debug=False, species='human', gzip=False):
+                 debug=False, species='human', gzip=False, cache=False, cache_dir=None, cache_size=2048,
+                 resume=False, prefilter=False, prefilter_min_kmers=3, assigner_options=None,
+                 umi_consensus=False, mongo_db=None, mongo_collection=None, mongo_ip='localhost',
+                 mongo_port=27017, mongo_user=None, mongo_password=None, mongo_batch_size=1000,
+                 mongo_indexes=None, previous_germline_db=None, reassigner='blastn', reassign_margin=0, sub_batch_size=0,
+                 sequence_timeout=0, chunk_timeout=0, straggler_factor=0, jobs_per_worker=2,
+                 inline_payloads=False, fuse_chunks=1):
         super(Args, self).__init__()
         self.sequences = sequences
         self.project_dir = os.path.abspath(project_dir) if project_dir is not None else project_dir
@@ -195,6 +311,7 @@ class Args(object):
         self.chunksize = int(chunksize)
         self.output_type = [output_type, ] if output_type in STR_TYPES else output_type
         self.assigner = assigner
+        self.assigner_options = assigner_options
         self.merge = True if basespace else merge
         self.pandaseq_algo = str(pandaseq_algo)
         self.nextseq = nextseq
@@ -209,6 +326,31 @@ class Args(object):
         self.json_keys = json_keys
         self.padding = padding
         self.species = species
+        self.cache = cache
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir is not None else cache_dir
+        self.cache_size = int(cache_size)
+        self.resume = resume
+        self.prefilter = prefilter
+        self.prefilter_min_kmers = int(prefilter_min_kmers)
+        self.umi_consensus = umi_consensus
+        self.mongo_db = mongo_db
+        self.mongo_collection = mongo_collection
+        self.mongo_ip = mongo_ip
+        self.mongo_port = int(mongo_port)
+        self.mongo_user = mongo_user
+        self.mongo_password = mongo_password
+        self.mongo_batch_size = int(mongo_batch_size)
+        self.mongo_indexes = [mongo_indexes, ] if type(mongo_indexes) in STR_TYPES else mongo_indexes
+        self.previous_germline_db = previous_germline_db
+        self.reassigner = reassigner
+        self.reassign_margin = float(reassign_margin)
+        self.sub_batch_size = int(sub_batch_size)
+        self.sequence_timeout = float(sequence_timeout)
+        self.chunk_timeout = float(chunk_timeout)
+        self.straggler_factor = float(straggler_factor)
+        self.jobs_per_worker = max(1, int(jobs_per_worker))
+        self.inline_payloads = inline_payloads
+        self.fuse_chunks = max(1, int(fuse_chunks))
 
 
 def validate_args(args):
@@ -232,10 +374,63 @@ def validate_args(args):
         args.output_type = ['json', ]
 
     # process JSON key string if provided
-    if args.json_keys is not None:
+    if args.json_keys is not None and type(args.json_keys) in STR_TYPES:
         args.json_keys = args.json_keys.split(',')
 
     # check to ensure a germline database exists for the requested species
+    validate_species(args.species)
+
+    # make sure the assigner (and assigner options) are valid
+    validate_assigner(args)
+
+    # MongoDB output needs somewhere to go
+    if 'mongodb' in args.output_type and args.mongo_db is None:
+        print('\nERROR: a MongoDB database (--mongo-db) is required for MongoDB output.')
+        sys.exit(1)
+
+    # stored annotations are re-annotated as-is
+    if args.assigner == 'stored' and any([args.prefilter, args.umi_consensus]):
+        print('\nWARNING: --prefilter and --umi-consensus are ignored when re-annotating stored annotations.')
+        args.prefilter = False
+        args.umi_consensus = False
+
+    # carried-forward annotations are copied verbatim, so they can't be reformatted
+    if args.previous_germline_db is not None:
+        if args.assigner != 'stored':
+            print('\nERROR: --previous-germline-db can only be used when re-annotating stored annotations.')
+            sys.exit(1)
+        if len(args.output_type) != 1 or args.output_type[0] not in STORED_FORMATS:
+            print('\nERROR: when using --previous-germline-db, the output type must be the same as the format')
+            print('of the stored annotations (either json or minimal).')
+            sys.exit(1)
+
+    # UMI consensus sequences can't be built without UMIs
+    if args.umi_consensus and args.uid == 0:
+        print('\nERROR: --umi-consensus requires the UID length to be provided with --uid.')
+        sys.exit(1)
+
+
+def validate_assigner(args):
+    if args.assigner not in ASSIGNERS:
+        print('\nERROR: {} is not a valid assigner.'.format(args.assigner))
+        print('Options are: {}'.format(', '.join(sorted(ASSIGNERS.keys()))))
+        sys.exit(1)
+    incremental = args.assigner == 'stored' and args.previous_germline_db is not None
+    assigner = get_germline_assigner_name(args)
+    if incremental and (assigner not in ASSIGNERS or assigner == 'stored'):
+        print('\nERROR: {} is not a valid assigner for re-assigning stored annotations.'.format(assigner))
+        print('Options are: {}'.format(', '.join(sorted([a for a in ASSIGNERS.keys() if a != 'stored']))))
+        sys.exit(1)
+    # assigner options apply to the assigner that runs germline assignment
+    try:
+        get_assigner(args, assigner)
+    except (TypeError, ValueError) as e:
+        print('\nERROR: invalid assigner option for the {} assigner:'.format(assigner))
+        print(e)
+        sys.exit(1)
+
+
+def validate_species(species):
     addon_species_dbs = []
     builtin_species_dbs = []
     addon_germline_dbs_dir = os.path.expanduser('~/.abstar/germline_dbs')
@@ -245,7 +440,7 @@ def validate_args(args):
     builtin_germline_dbs_dir = os.path.join(mod_dir, 'assigners/germline_dbs/')
     if os.path.isdir(builtin_germline_dbs_dir):
         builtin_species_dbs += [os.path.basename(d) for d in list_files(builtin_germline_dbs_dir)]
-    if not any([args.species.lower() in addon_species_dbs, args.species.lower() in builtin_species_dbs]):
+    if not any([species.lower() in addon_species_dbs, species.lower() in builtin_species_dbs]):
         print('\nERROR: A germline database was not found for the requested species.')
         print('\nBuilt-in databases exist for the following species:')
         print(', '.join(builtin_species_dbs))
@@ -322,13 +517,34 @@ def log_options(input_dir, output_dir, temp_dir, args):
     logger.info('')
     logger.info('SPECIES: {}'.format(args.species))
     logger.info('CHUNKSIZE: {}'.format(args.chunksize))
+    if args.sub_batch_size:
+        logger.info('SUB-BATCH SIZE: {}'.format(args.sub_batch_size))
+    if args.sequence_timeout:
+        logger.info('SEQUENCE TIMEOUT: {} seconds'.format(args.sequence_timeout))
+    if args.chunk_timeout:
+        logger.info('CHUNK TIMEOUT: {} seconds'.format(args.chunk_timeout))
+    if args.straggler_factor:
+        logger.info('STRAGGLER FACTOR: {}x median job time'.format(args.straggler_factor))
     logger.info('OUTPUT TYPE: {}'.format(', '.join(args.output_type)))
+    if 'mongodb' in args.output_type:
+        logger.info('MONGODB: {}:{}/{}'.format(args.mongo_ip, args.mongo_port, args.mongo_db))
+    logger.info('ASSIGNER: {}'.format(args.assigner))
+    if args.assigner_options:
+        logger.info('ASSIGNER OPTIONS: {}'.format(', '.join(args.assigner_options)))
     if args.merge or args.basespace:
         logger.info('PANDASEQ ALGORITHM: {}'.format(args.pandaseq_algo))
     logger.info('UID: {}'.format(args.uid))
     logger.info('ISOTYPE: {}'.format('yes' if args.isotype else 'no'))
     logger.info('EXECUTION: {}'.format('cluster' if args.cluster else 'local'))
+    if args.cluster and (args.inline_payloads or args.fuse_chunks > 1):
+        logger.info('CELERY TASKS: {} job{} per task{}'.format(args.fuse_chunks,
+                                                              's' if args.fuse_chunks > 1 else '',
+                                                              ', inline payloads' if args.inline_payloads else ''))
     logger.info('DEBUG: {}'.format('True' if args.debug else 'False'))
+    if args.cache:
+        logger.info('CACHE: {}'.format(args.cache_dir if args.cache_dir is not None else 'default'))
+    if args.prefilter:
+        logger.info('PREFILTER: {} k-mers'.format(args.prefilter_min_kmers))
     logger.debug('INPUT: {}'.format(input_dir))
     logger.debug('OUTPUT: {}'.format(output_dir))
     logger.debug('TEMP: {}'.format(temp_dir))
@@ -352,10 +568,26 @@ def list_files(d, log=False):
     return files
 
 
+def get_output_prefix(input_file):
+    bname = os.path.basename(input_file)
+    if '.' in bname:
+        return '.'.join(bname.split('.')[:-1])
+    return bname
+
+
+def get_file_output_types(args):
+    '''
+    Returns the (sorted) output types that are written to output files.
+    MongoDB output is inserted directly into the database by each job.
+    '''
+    return sorted([ot for ot in args.output_type if ot != 'mongodb'])
+
+
 def get_output_suffix(output_format):
     osuffixes = {'json': '.json',
                  'imgt': '.csv',
-                 'minimal': '.txt'}
+                 'minimal': '.txt',
+                 'sqlite': '.db'}
     return osuffixes[output_format.lower()]
 
 
@@ -372,47 +604,51 @@ def build_output_base(output_types):
 
 def concat_outputs(input_file, temp_output_files, output_dir, args):
     ofiles = []
-    bname = os.path.basename(input_file)
-    if '.' in bname:
-        split_name = bname.split('.')
-        oprefix = '.'.join(split_name[:-1])
-    else:
-        oprefix = bname
-    # temp_output_files is a 2D list in the same order as sorted(args.output_type)
+    oprefix = get_output_prefix(input_file)
+    # temp_output_files is a 2D list in the same order as get_file_output_types(args)
     logger.info('')
-    for output_type, temp_files in zip(sorted(args.output_type), zip(*temp_output_files)):
+    for output_type, temp_files in zip(get_file_output_types(args), zip(*temp_output_files)):
         osuffix = get_output_suffix(output_type)
         oname = oprefix + osuffix
         ofile = os.path.join(output_dir, oname)
         # temp_files = [tf for tf in temp_output_files if tf.endswith(osuffix)]
         logger.info('Concatenating {} {}-formatted job outputs into a single output file'.format(len(temp_output_files),
                                                                                                  output_type.upper()))
+        # SQLite databases are merged rather than concatenated, and aren't gzipped
+        if output_type == 'sqlite':
+            merge_sqlite(temp_files, ofile)
+            ofiles.append(ofile)
+            continue
         if args.gzip:
             ohandle = gzip.open(ofile + ".gz", 'wb')
         else:
             ohandle = open(ofile, 'w')
         with ohandle as out_file:
-            # JSON-formatted files don't have headers, so we don't worry about it
-            if output_type == 'json':
-                for temp_file in temp_files:
-                    with open(temp_file) as f:
-                        for line in f:
-                            out_file.write(line)
-                    out_file.write('\n')
-            # For file formats with headers, only keep headers from the first file
-            if output_type in ['imgt', 'minimal']:
-                for i, temp_file in enumerate(temp_files):
-                    with open(temp_file) as f:
-                        for j, line in enumerate(f):
-                            if i == 0:
-                                out_file.write(line)
-                            elif j >= 1:
-                                out_file.write(line)
-                        out_file.write('\n')
-        ofiles.append(ofile)
+            concat_output_files(temp_files, out_file, output_type)
+        ofiles.append(ofile + '.gz' if args.gzip else ofile)
     return ofiles
 
 
+def concat_output_files(temp_files, out_file, output_type):
+    # JSON-formatted files don't have headers, so we don't worry about it
+    if output_type == 'json':
+        for temp_file in temp_files:
+            with open(temp_file) as f:
+                for line in f:
+                    out_file.write(line)
+            out_file.write('\n')
+    # For file formats with headers, only keep headers from the first file
+    if output_type in ['imgt', 'minimal']:
+        for i, temp_file in enumerate(temp_files):
+            with open(temp_file) as f:
+                for j, line in enumerate(f):
+                    if i == 0:
+                        out_file.write(line)
+                    elif j >= 1:
+                        out_file.write(line)
+                out_file.write('\n')
+
+
 def concat_logs(input_file, logs, log_dir, log_type):
     bname = os.path.basename(input_file)
     if '.' in bname:
@@ -479,62 +715,131 @@ def _get_format(in_file):
             return 'fasta'
         elif line.lstrip().startswith('@'):
             return 'fastq'
+        # previously annotated sequences, for re-annotation
+        elif line.lstrip().startswith('{'):
+            return 'json'
+        elif line.strip().split(',')[0] == 'seq_id':
+            return 'minimal'
         else:
             return None
 
 
 def split_file(f, fmt, temp_dir, args):
-    file_counter = 0
-    seq_counter = 0
-    total_seq_counter = 0
-    subfiles = []
-    sequences = []
-    if '.' in os.path.basename(f):
-        out_prefix = '.'.join(os.path.basename(f).split('.')[:-1])
-    else:
-        out_prefix = os.path.basename(f)
-    if args.chunksize != 0:
-        try:
-            with open(f, 'r') as f_handle:
-                for seq in SeqIO.parse(f_handle, fmt.lower()):
-                    sequences.append(seq.format(fmt.lower()))
-                    seq_counter += 1
-                    total_seq_counter += 1
-                    if seq_counter == args.chunksize:
-                        out_file = os.path.join(temp_dir, '{}_{}'.format(out_prefix, file_counter))
-                        ohandle = open(out_file, 'w')
-                        ohandle.write('\n'.join(sequences))
-                        ohandle.close()
-                        sequences = []
-                        seq_counter = 0
-                        file_counter += 1
-                        subfiles.append(out_file)
-        except ValueError:
-            print('')
-            print('ERROR: invalid file.')
-            print('{} is not properly formatted'.format(f))
-            print(traceback.format_exception_only)
-            clear_temp_files(subfiles)
-            sys.exit(1)
+    '''
+    Splits ``f`` into files of ``args.chunksize`` sequences. All of the split files are
+    written immediately, so ``iter_split_file()`` should be used to split large files.
+
+    Returns:
+    --------
 
-    # We don't want our files split
+        tuple: A list of split files and the number of sequences in ``f``.
+    '''
+    seq_count = count_sequences(f, fmt)
+    subfiles = list(iter_split_file(f, fmt, temp_dir, args))
+    logger.info('SEQUENCES: {}'.format(seq_count))
+    logger.info('JOBS: {}'.format(len(subfiles)))
+    return subfiles, seq_count
+
+
+def iter_split_file(f, fmt, temp_dir, args, skip=None):
+    '''
+    Lazily splits ``f`` into files of ``args.chunksize`` sequences. Each split file is
+    only written when the next split file is requested, so the number of split files on disk
+    is bounded by the consumer rather than the size of the input file.
+
+    Split file names only depend on ``f``, ``temp_dir`` and ``args.chunksize`` (see ``get_chunk_names()``),
+    so a split can be repeated (for example, when resuming a run) with identical results.
+
+    Args:
+    -----
+
+        f (str): Path to the input file. Can be FASTA, FASTQ or stored (JSON or minimal) annotations.
+            The header line of minimal-formatted files is included in each split file.
+
+        fmt (str): Format of ``f``.
+
+        temp_dir (str): Directory for the split files.
+
+        args (Args): Runtime arguments.
+
+        skip (iterable): Split files to skip. Skipped split files are not written.
+
+    Yields:
+    -------
+
+        str: Path to a split file. If ``args.chunksize`` is 0, ``f`` is not split and ``f``
+            is the only path yielded.
+    '''
+    if args.chunksize == 0:
+        if skip is None or f not in skip:
+            yield f
+        return
+    skip = set(skip or [])
+    out_prefix = get_output_prefix(f)
+    with open(f, 'r') as f_handle:
+        header = f_handle.readline() if fmt == 'minimal' else ''
+        records = iter_records(f_handle, fmt)
+        for file_counter in itertools.count():
+            chunk = list(itertools.islice(records, args.chunksize))
+            if not chunk:
+                break
+            out_file = os.path.join(temp_dir, '{}_{}'.format(out_prefix, file_counter))
+            if out_file in skip:
+                continue
+            with open(out_file, 'w') as ohandle:
+                ohandle.write(header)
+                ohandle.write(''.join(chunk))
+            yield out_file
+
+
+def iter_records(f_handle, fmt):
+    '''
+    Yields the records in ``f_handle`` as strings (each ending with a newline), in the same format.
+
+    Sequences are parsed with Biopython's low-level FASTA/FASTQ parsers, which don't
+    build ``SeqRecord`` objects, so files can be counted and split quickly. The header line
+    of minimal-formatted files should be read before calling ``iter_records()``.
+    '''
+    if fmt in STORED_FORMATS:
+        for line in f_handle:
+            if line.strip():
+                yield line if line.endswith('\n') else line + '\n'
+    elif fmt.lower() == 'fasta':
+        from Bio.SeqIO.FastaIO import SimpleFastaParser
+        for title, seq in SimpleFastaParser(f_handle):
+            yield '>{}\n{}\n'.format(title, seq)
     else:
+        from Bio.SeqIO.QualityIO import FastqGeneralIterator
+        for title, seq, qual in FastqGeneralIterator(f_handle):
+            yield '@{}\n{}\n+\n{}\n'.format(title, seq, qual)
+
+
+def get_chunk_names(f, temp_dir, seq_count, args):
+    '''
+    Returns the names of the split files ``iter_split_file()`` creates for a file of ``seq_count`` sequences.
+    '''
+    if args.chunksize == 0:
+        return [f, ]
+    out_prefix = get_output_prefix(f)
+    chunk_count = -(-seq_count // args.chunksize)
+    return [os.path.join(temp_dir, '{}_{}'.format(out_prefix, i)) for i in range(chunk_count)]
+
+
+def count_sequences(f, fmt):
+    '''
+    Counts the sequences (or stored annotations) in ``f``. Exits if ``f`` isn't properly formatted.
+    '''
+    try:
         with open(f, 'r') as f_handle:
-            for seq in SeqIO.parse(f_handle, fmt.lower()):
-                total_seq_counter += 1
-            subfiles.append(f)
-            file_counter = 1
-
-    # unless the input file is an exact multiple of args.chunksize,
-    # need to write the last few sequences to a split file.
-    if seq_counter:
-        file_counter += 1
-        out_file = os.path.join(temp_dir, '{}_{}'.format(out_prefix, file_counter))
-        open(out_file, 'w').write('\n' + '\n'.join(sequences))
-        subfiles.append(out_file)
-    logger.info('SEQUENCES: {}'.format(total_seq_counter))
-    logger.info('JOBS: {}'.format(file_counter))
-    return subfiles, total_seq_counter
+            if fmt == 'minimal':
+                f_handle.readline()
+            return sum(1 for _ in iter_records(f_handle, fmt))
+    except ValueError:
+        print('')
+        print('ERROR: invalid file.')
+        print('{} is not properly formatted'.format(f))
+        print(traceback.format_exception_only)
+        sys.exit(1)
 
 
 #####################################################################
@@ -553,13 +858,46 @@ def print_input_file_info(f, fmt):
     logger.info('FORMAT: {}'.format(fmt.lower()))
 
 
-def print_job_stats(total_seqs, good_seq_counts, start_time, end_time):
+def print_job_stats(total_seqs, good_seq_counts, start_time, end_time, job_stats=None):
     run_time = end_time - start_time
     zero_files = sum([c == 0 for c in good_seq_counts])
     if zero_files > 0:
         logger.info('{} files contained no successfully processed sequences'.format(zero_files))
     good_seqs = sum(good_seq_counts)
     logger.info('')
+    stats = {}
+    for s in (job_stats or []):
+        for k, v in s.items():
+            stats[k] = stats.get(k, 0) + v
+    if 'mongodb_inserted' in stats:
+        logger.info('{} annotations were inserted into MongoDB'.format(stats['mongodb_inserted']))
+        if stats.get('mongodb_duplicates'):
+            logger.info('{} annotations were already in MongoDB and were skipped'.format(stats['mongodb_duplicates']))
+        if stats.get('mongodb_errors'):
+            logger.info('{} annotations could not be inserted into MongoDB'.format(stats['mongodb_errors']))
+    if 'carried_forward' in stats:
+        logger.info('{} stored annotations were carried forward, {} were re-assigned'.format(stats['carried_forward'],
+                                                                                             stats.get('reassigned', 0)))
+    if 'prefiltered' in stats:
+        logger.info('{} sequences were removed by the prefilter'.format(stats['prefiltered']))
+    if stats.get('timed_out'):
+        logger.info('{} sequences exceeded the per-sequence time limit'.format(stats['timed_out']))
+    if 'cascade_reads' in stats:
+        # each read is counted in exactly one of the cascade stages
+        cascade_total = max(1, stats['cascade_reads'])
+        logger.info('{} sequences ({:.1f}%) were assigned with seeds, {} sequences ({:.1f}%) with BLASTn'.format(
+            stats['cascade_seed'], 100. * stats['cascade_seed'] / cascade_total,
+            stats['cascade_blastn'], 100. * stats['cascade_blastn'] / cascade_total))
+        if stats.get('cascade_checked'):
+            logger.info('{} sequences ({:.1f}%) were assigned with seeds and checked with BLASTn'.format(
+                stats['cascade_checked'], 100. * stats['cascade_checked'] / cascade_total))
+    if 'concordance_compared' in stats:
+        compared = max(1, stats['concordance_compared'])
+        for segment in ['v', 'j']:
+            logger.info('{}-gene concordance with BLASTn: {:.1f}% (gene), {:.1f}% (allele)'.format(
+                segment.upper(),
+                100. * stats['concordance_{}_gene'.format(segment)] / compared,
+                100. * stats['concordance_{}_allele'.format(segment)] / compared))
     logger.info('{} sequences contained an identifiable rearrangement'.format(good_seqs))
     logger.info('AbStar completed in {} seconds'.format(run_time))
 
@@ -573,7 +911,6 @@ def print_job_stats(total_seqs, good_seq_counts, start_time, end_time):
 
 
 
-@celery.task
 def run_abstar(seq_file, output_dir, log_dir, file_format, arg_dict):
     '''
     Wrapper function to multiprocess (or not) the assignment of V, D and J
@@ -584,8 +921,9 @@ def run_abstar(seq_file, output_dir, log_dir, file_format, arg_dict):
 
     Output is a tuple containing (0) path to the output file, (1) the number of successfully
     annotated antibody sequences, (2) path to the log file for successfully annotated sequences (an
-    empty string unless args.debug is True) and (3) path to the log file for unsuccessfully annotated
-    sequences (only an eompty string if all sequences in the input file were successful).
+    empty string unless args.debug is True), (3) path to the log file for unsuccessfully annotated
+    sequences (only an eompty string if all sequences in the input file were successful), (4) path
+    to the log file for unassigned sequences and (5) a dict of job stats.
     '''
     try:
         # Args instances can't be serialized by Celery, so we need to pass them in
@@ -593,7 +931,7 @@ def run_abstar(seq_file, output_dir, log_dir, file_format, arg_dict):
         args = Args(**arg_dict)
         # identify output file
         output_filename = os.path.basename(seq_file)
-        output_suffixes = [get_output_suffix(output_type) for output_type in sorted(args.output_type)]
+        output_suffixes = [get_output_suffix(output_type) for output_type in get_file_output_types(args)]
         output_files = [os.path.join(output_dir, output_filename + output_suffix) for output_suffix in output_suffixes]
         # if args.output_type == 'json':
         #     output_file = os.path.join(output_dir, output_filename + '.json')
@@ -606,67 +944,247 @@ def run_abstar(seq_file, output_dir, log_dir, file_format, arg_dict):
         failed_loghandle = open(failed_logfile, 'a')
         unassigned_logfile = os.path.join(log_dir, 'temp/{}.unassigned'.format(output_filename))
         unassigned_loghandle = open(unassigned_logfile, 'a')
-        # start assignment
-        assigner_class = ASSIGNERS[args.assigner]
-        assigner = assigner_class(args.species)  # initialize the assigner class with the species
-        assigner(seq_file, file_format)  # call the assigner
-        # process all of the successfully assigned sequences
+        # retrieve previously annotated sequences from the cache
         outputs_dict = build_output_base(args.output_type)
-        assigned = [Antibody(vdj, args.species) for vdj in assigner.assigned]
         successful = 0
-        for ab in assigned:
-            try:
-                ab.annotate(args.uid)
-                result = get_abstar_result(ab,
-                                   pretty=args.pretty,
-                                   padding=args.padding,
-                                   raw=args.raw,
-                                   keys=args.json_keys)
-                for i, output_type in enumerate(args.output_type):
-                    try:
-                        output = get_output(result, output_type)
-                    except:
-                        ab.exception('OUTPUT CREATION ERROR', traceback.format_exc())
-                    if output is not None:
-                        outputs_dict[output_type].append(get_output(result, output_type))
-                        # only write debug log data once
-                        if i == 0:
-                            successful += 1
-                            if args.debug:
-                                annotated_loghandle.write(ab.format_log())
-                    # only write failed log data once
-                    elif i == 0:
-                        failed_loghandle.write(ab.format_log())
-            except:
-                ab.exception('ANNOTATION ERROR', traceback.format_exc())
-                failed_loghandle.write(ab.format_log())
-        outputs = [outputs_dict[ot] for ot in sorted(args.output_type)]
-        write_output(outputs, output_files)
+        stats = {}
+        query_file = seq_file
+        query_format = file_format
+        query_temp_files = []
+        cache = get_annotation_cache(args)
+        if cache is not None:
+            cached, query_file = check_annotation_cache(cache, seq_file, file_format)
+            query_format = 'fasta'
+            if query_file is not None:
+                query_temp_files.append(query_file)
+            for seq, record in cached:
+                outputs_dict['json'].append(format_cached_output(seq, record, args))
+                successful += 1
+        # remove non-antibody reads
+        if args.prefilter and query_file is not None:
+            prefiltered_file, stats['prefiltered'] = prefilter_sequence_file(query_file, query_format, args)
+            if prefiltered_file != query_file:
+                query_file = prefiltered_file
+                query_format = 'fasta'
+                if query_file is not None:
+                    query_temp_files.append(query_file)
+        # after a germline database update, only re-assign stored annotations that could be affected
+        incremental = all([args.assigner == 'stored', args.previous_germline_db is not None])
+        umi_counts = {}
+        if incremental and query_file is not None:
+            carried, reassign_file, reassigned, umi_counts = partition_stored_annotations(query_file,
+                                                                                          query_format,
+                                                                                          args)
+            outputs_dict[query_format].extend(carried)
+            successful += len(carried)
+            stats['carried_forward'] = len(carried)
+            stats['reassigned'] = len(reassigned)
+            query_file = reassign_file
+            query_format = 'fasta'
+            if query_file is not None:
+                query_temp_files.append(query_file)
+        # annotations are streamed into MongoDB as they're created
+        mongo_sink = None
+        if 'mongodb' in args.output_type:
+            from ..utils.mongodb import MongoSink, record_id
+            mongo_sink = MongoSink(args.mongo_collection,
+                                   args.mongo_db,
+                                   ip=args.mongo_ip,
+                                   port=args.mongo_port,
+                                   user=args.mongo_user,
+                                   password=args.mongo_password,
+                                   batch_size=args.mongo_batch_size)
+        # start assignment
+        if incremental:
+            new_assigner = functools.partial(get_assigner, args, args.reassigner)
+        else:
+            new_assigner = functools.partial(get_assigner, args)  # initialize the assigner class with the species
+        to_cache = []
+        unassigned = []
+        # with sub-batches, assignment of the next sub-batch runs in the
+        # background while the current sub-batch is being annotated
+        for assigner in assign_sub_batches(new_assigner, query_file, query_format, args.sub_batch_size, args.temp):
+            for key, value in assigner.stats.items():
+                stats[key] = stats.get(key, 0) + value
+            unassigned.extend(assigner.unassigned)
+            for vdj in assigner.assigned:
+                if vdj.id in umi_counts:
+                    vdj.umi_count = umi_counts[vdj.id]
+            # process all of the successfully assigned sequences
+            assigned = [Antibody(vdj, args.species) for vdj in assigner.assigned]
+            for ab in assigned:
+                try:
+                    with time_limit(args.sequence_timeout):
+                        ab.annotate(args.uid, umi_consensus=args.umi_consensus)
+                        result = get_abstar_result(ab,
+                                           pretty=args.pretty,
+                                           padding=args.padding,
+                                           raw=args.raw,
+                                           keys=args.json_keys)
+                    for i, output_type in enumerate(args.output_type):
+                        try:
+                            output = get_output(result, output_type)
+                        except:
+                            ab.exception('OUTPUT CREATION ERROR', traceback.format_exc())
+                        if output is not None:
+                            if output_type == 'mongodb':
+                                # a deterministic _id makes re-inserting the same annotation a no-op
+                                mongo_sink.add(output, _id=record_id(ab.id, ab.raw_input.sequence))
+                            else:
+                                outputs_dict[output_type].append(output)
+                            # only write debug log data once
+                            if i == 0:
+                                successful += 1
+                                if args.debug:
+                                    annotated_loghandle.write(ab.format_log())
+                                if cache is not None:
+                                    to_cache.append((ab.raw_input.sequence, result.json_record))
+                        # only write failed log data once
+                        elif i == 0:
+                            failed_loghandle.write(ab.format_log())
+                except SequenceTimeout:
+                    ab.exception('ANNOTATION TIMEOUT', traceback.format_exc())
+                    failed_loghandle.write(ab.format_log())
+                    stats['timed_out'] = stats.get('timed_out', 0) + 1
+                except:
+                    ab.exception('ANNOTATION ERROR', traceback.format_exc())
+                    failed_loghandle.write(ab.format_log())
+        outputs = [outputs_dict[ot] for ot in get_file_output_types(args)]
+        write_output(outputs, output_files, get_file_output_types(args))
+        if mongo_sink is not None:
+            mongo_sink.close()
+            stats['mongodb_inserted'] = mongo_sink.inserted
+            stats['mongodb_errors'] = mongo_sink.errors
+            stats['mongodb_duplicates'] = mongo_sink.duplicates
+        # update the annotation cache
+        if cache is not None:
+            cache.put(to_cache)
+            cache.close()
+        for temp_file in query_temp_files:
+            os.unlink(temp_file)
         # capture the log for all unsuccessful sequences
-        for vdj in assigner.unassigned:
+        for vdj in unassigned:
             unassigned_loghandle.write(vdj.format_log())
         # close the log handles
         unassigned_loghandle.close()
         annotated_loghandle.close()
         failed_loghandle.close()
         # return the number of successful assignments
-        return (output_files, successful, annotated_logfile, failed_logfile, unassigned_logfile)
+        return (output_files, successful, annotated_logfile, failed_logfile, unassigned_logfile, stats)
     except:
         logging.debug(traceback.format_exc())
 
 
 
+def run_abstar_batch(chunks, output_dir, log_dir, file_format, arg_dict, inline=False):
+    '''
+    Runs ``run_abstar()`` on several (split) input files in a single job, so that small
+    jobs don't each need their own Celery task message and result.
+
+    Args:
+    -----
+
+        chunks (list): Input files. If ``inline`` is ``True``, each input file is a ``(name, payload)``
+            tuple, where ``payload`` is the encoded contents of the input file (see ``utils.payload``).
+
+        output_dir (str): Directory for the job outputs. Not used for inline jobs.
+
+        log_dir (str): Log directory. Not used for inline jobs.
+
+        file_format (str): Format of the input files.
+
+        arg_dict (dict): Runtime arguments, as a dict.
+
+        inline (bool): If ``True``, input files are decoded into a local temp directory and the
+            job outputs and logs are returned (encoded) in the results, rather than being written to
+            ``output_dir`` and ``log_dir``, so a shared filesystem isn't required. Default is ``False``.
+
+    Returns:
+    --------
+
+        list: A result for each input file, in the same order as ``chunks``. Results are in the same
+            format as ``run_abstar()`` results, except that for inline jobs, file paths are replaced by
+            the encoded file contents (see ``decode_job_result()``).
+    '''
+    if not inline:
+        return [run_abstar(c, output_dir, log_dir, file_format, arg_dict) for c in chunks]
+    work_dir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(work_dir, 'temp'))
+        # the temp directory used by the submitting process may not exist on this node
+        arg_dict = dict(arg_dict, temp=work_dir)
+        results = []
+        for name, payload in chunks:
+            seq_file = decode_file(payload, os.path.join(work_dir, os.path.basename(name)))
+            result = run_abstar(seq_file, work_dir, work_dir, file_format, arg_dict)
+            results.append(encode_job_result(result))
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def encode_job_result(result):
+    '''
+    Replaces the output and log file paths in a ``run_abstar()`` result with the encoded file contents.
+    '''
+    if result is None:
+        return None
+    return [[encode_file(o) for o in result[0]],
+            result[1],
+            encode_file(result[2]),
+            encode_file(result[3]),
+            encode_file(result[4]),
+            result[5] if len(result) > 5 else {}]
+
+
+def decode_job_result(result, seq_file, output_dir, log_dir, args):
+    '''
+    Writes the outputs and logs in an encoded job result (see ``encode_job_result()``) to the
+    files that ``run_abstar()`` would have created for ``seq_file``.
+
+    Returns:
+    --------
+
+        tuple: A result tuple, in the same format as ``run_abstar()``.
+    '''
+    if result is None:
+        return None
+    name = os.path.basename(seq_file)
+    output_files = [decode_file(payload, os.path.join(output_dir, name + get_output_suffix(output_type)))
+                    for payload, output_type in zip(result[0], get_file_output_types(args))]
+    log_files = [decode_file(payload, os.path.join(log_dir, 'temp/{}.{}'.format(name, log_type)))
+                 for payload, log_type in zip(result[2:5], ['annotated', 'failed', 'unassigned'])]
+    return (output_files, result[1], log_files[0], log_files[1], log_files[2], result[5])
+
+
 def process_sequences(sequences, args):
+    outputs = []
+    # retrieve previously annotated sequences from the cache
+    cache = get_annotation_cache(args)
+    if cache is not None:
+        cached, sequences = cache.get(sequences)
+        for seq, record in cached:
+            record = collections.OrderedDict([('seq_id', seq.id)] + list(record.items()))
+            outputs.append(format_json_output(record, padding=False, raw=True))
+        if not sequences:
+            cache.close()
+            return outputs
+    # remove non-antibody reads
+    if args.prefilter:
+        sequences, _ = Prefilter(args.species, min_kmers=args.prefilter_min_kmers)(sequences)
+        if not sequences:
+            if cache is not None:
+                cache.close()
+            return outputs
     seq_file = tempfile.NamedTemporaryFile(dir=args.temp, delete=False)
     seq_file.close()
     with open(seq_file.name, 'w') as f:
         f.write('\n'.join([s.fasta for s in sequences]))
-    assigner_class = ASSIGNERS[args.assigner]
-    assigner = assigner_class(args.species)
+    assigner = get_assigner(args)
     assigner(seq_file.name, 'fasta')
     # process all of the successfully assigned sequences
-    outputs = []
     assigned = [Antibody(vdj, args.species) for vdj in assigner.assigned]
+    to_cache = []
     for ab in assigned:
         try:
             ab.annotate(args.uid)
@@ -677,29 +1195,385 @@ def process_sequences(sequences, args):
             output = get_output(result, 'json')
             if output is not None:
                 outputs.append(get_output(result, 'json'))
+                if cache is not None:
+                    to_cache.append((ab.raw_input.sequence, result.json_record))
         except:
             continue
     os.unlink(seq_file.name)
+    # update the annotation cache
+    if cache is not None:
+        cache.put(to_cache)
+        cache.close()
     return outputs
 
 
-def run_jobs(files, output_dir, log_dir, file_format, args):
+def assign_sub_batches(new_assigner, seq_file, file_format, sub_batch_size=0, temp_dir=None):
+    '''
+    Runs germline assignment on ``seq_file`` and yields an assigner (which has already
+    been called) for each sub-batch of sequences, in input order.
+
+    If there's more than one sub-batch, assignment runs in a background thread, which
+    stays at most ``PIPELINE_DEPTH`` sub-batches ahead of the caller. Most of the assignment
+    time is spent waiting for BLASTn subprocesses, so the next sub-batch is assigned while the
+    caller annotates the current one.
+
+    Args:
+    -----
+
+        new_assigner (callable): Returns a new (not yet called) assigner instance.
+
+        seq_file (str): Path to the sequence file. If ``None``, a single uncalled assigner is yielded.
+
+        file_format (str): Format of ``seq_file``.
+
+        sub_batch_size (int): Number of sequences in each sub-batch. Default is 0, which
+            assigns the entire file at once. Stored annotations are never split.
+
+        temp_dir (str): Directory for the sub-batch files. Default is the directory
+            containing ``seq_file``.
+    '''
+    if seq_file is None:
+        yield new_assigner()
+        return
+    if sub_batch_size <= 0 or file_format.lower() not in ['fasta', 'fastq']:
+        assigner = new_assigner()
+        assigner(seq_file, file_format)  # call the assigner
+        yield assigner
+        return
+    batch_files = split_sub_batches(seq_file, file_format, sub_batch_size, temp_dir)
+    assigners = queue.Queue(maxsize=PIPELINE_DEPTH)
+    stop = threading.Event()
+
+    def _put(item):
+        # if the caller stops early, nobody will drain the queue, so never block indefinitely
+        while not stop.is_set():
+            try:
+                assigners.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _assign():
+        try:
+            for batch_file in batch_files:
+                if stop.is_set():
+                    break
+                assigner = new_assigner()
+                try:
+                    assigner(batch_file, file_format)
+                except:
+                    logging.debug('SUB-BATCH ASSIGNMENT ERROR: {}\n{}'.format(batch_file, traceback.format_exc()))
+                _put(assigner)
+        finally:
+            _put(None)
+
+    thread = threading.Thread(target=_assign)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            assigner = assigners.get()
+            if assigner is None:
+                break
+            yield assigner
+    finally:
+        # stop the producer (which may be blocked on a full queue) and wait for it
+        # to finish before removing the sub-batch files it may still be reading
+        stop.set()
+        while True:
+            try:
+                assigners.get_nowait()
+            except queue.Empty:
+                break
+        thread.join()
+        for batch_file in batch_files:
+            if os.path.isfile(batch_file):
+                os.unlink(batch_file)
+
+
+def split_sub_batches(seq_file, file_format, sub_batch_size, temp_dir=None, suffix='sub'):
+    '''
+    Splits a FASTA, FASTQ or stored annotation (JSON or minimal) file into files of
+    ``sub_batch_size`` sequences (in the same format). The header line of minimal-formatted
+    files is included in each file.
+    '''
+    if temp_dir is None:
+        temp_dir = os.path.dirname(seq_file)
+    prefix = os.path.join(temp_dir, os.path.basename(seq_file))
+    batch_files = []
+    with open(seq_file, 'r') as f:
+        if file_format in STORED_FORMATS:
+            header = f.readline() if file_format == 'minimal' else ''
+            seqs = (l for l in f if l.strip())
+        else:
+            from Bio import SeqIO
+            seqs = SeqIO.parse(f, file_format.lower())
+        while True:
+            batch = list(itertools.islice(seqs, sub_batch_size))
+            if not batch:
+                break
+            batch_file = '{}.{}_{}'.format(prefix, suffix, len(batch_files))
+            with open(batch_file, 'w') as out:
+                if file_format in STORED_FORMATS:
+                    out.write(header)
+                    out.write(''.join(batch))
+                else:
+                    SeqIO.write(batch, out, file_format.lower())
+            batch_files.append(batch_file)
+    return batch_files
+
+
+def get_assigner(args, assigner=None):
+    '''
+    Initializes the assigner class, using any assigner options in ``args.assigner_options``.
+    The assigner is ``args.assigner``, unless a different assigner name is provided.
+    '''
+    assigner_class = ASSIGNERS[assigner if assigner is not None else args.assigner]
+    return assigner_class(args.species, **parse_assigner_options(args.assigner_options))
+
+
+def get_germline_assigner_name(args):
+    '''
+    Returns the name of the assigner that runs germline assignment. When stored annotations
+    are updated after a germline database change, that's the assigner used for re-assignment.
+    '''
+    if args.assigner == 'stored' and args.previous_germline_db is not None:
+        return args.reassigner
+    return args.assigner
+
+
+def parse_assigner_options(assigner_options):
+    '''
+    Parses a list of ``KEY=VALUE`` assigner option strings into a dict. Values are
+    converted to ``int``, ``float`` or ``bool`` (``'true'`` or ``'false'``) if possible.
+    '''
+    options = {}
+    for option in (assigner_options or []):
+        if '=' not in option:
+            raise ValueError('Assigner options must be formatted as KEY=VALUE, got {}'.format(option))
+        key, value = [o.strip() for o in option.split('=', 1)]
+        if value.lower() in ['true', 'false']:
+            value = value.lower() == 'true'
+        else:
+            for _type in [int, float]:
+                try:
+                    value = _type(value)
+                    break
+                except ValueError:
+                    continue
+        options[key.replace('-', '_')] = value
+    return options
+
+
+def get_annotation_cache(args):
+    '''
+    Returns an ``AnnotationCache`` if caching was requested, or ``None`` if it wasn't.
+
+    Only JSON output is cached, so the cache is not used if any other output types were requested.
+    '''
+    if not args.cache:
+        return None
+    if args.assigner == 'stored':
+        logging.debug('ANNOTATION CACHE: stored annotations are always re-annotated, the cache will not be used.')
+        return None
+    if any([output_type.lower() != 'json' for output_type in args.output_type]):
+        logging.debug('ANNOTATION CACHE: only JSON output can be cached, the cache will not be used.')
+        return None
+    if args.umi_consensus:
+        logging.debug('ANNOTATION CACHE: UMI consensus sequences are not cached, the cache will not be used.')
+        return None
+    # assigner options can change the annotation, so they're part of the cache key
+    assigner = args.assigner
+    if args.assigner_options:
+        assigner += ':' + ','.join(sorted(args.assigner_options))
+    return AnnotationCache(args.species,
+                           assigner=assigner,
+                           uid=args.uid,
+                           isotype=bool(args.isotype),
+                           version=get_version(),
+                           cache_dir=args.cache_dir,
+                           max_size=args.cache_size)
+
+
+def check_annotation_cache(cache, seq_file, file_format, temp_dir=None):
+    '''
+    Retrieves cached annotations for the sequences in ``seq_file``.
+
+    Args:
+    -----
+
+        cache (AnnotationCache): The annotation cache.
+
+        seq_file (str): Path to a FASTA or FASTQ-formatted sequence file.
+
+        file_format (str): Format of ``seq_file``. Either ``'fasta'`` or ``'fastq'``.
+
+        temp_dir (str): Directory into which the file of uncached sequences will be written.
+            Default is the directory containing ``seq_file``.
+
+    Returns:
+    --------
+
+        tuple: A list of ``(Sequence, record)`` tuples for all cached sequences, and the
+            path to a FASTA-formatted file containing the uncached sequences (or ``None``
+            if all sequences were cached).
+    '''
+    from Bio import SeqIO
+    with open(seq_file, 'r') as f:
+        seqs = [Sequence(s) for s in SeqIO.parse(f, file_format.lower())]
+    cached, uncached = cache.get(seqs)
+    if not uncached:
+        return cached, None
+    if temp_dir is None:
+        temp_dir = os.path.dirname(seq_file)
+    uncached_file = os.path.join(temp_dir, os.path.basename(seq_file) + '.uncached')
+    with open(uncached_file, 'w') as f:
+        f.write('\n'.join([s.fasta for s in uncached]))
+    return cached, uncached_file
+
+
+def partition_stored_annotations(seq_file, file_format, args):
+    '''
+    Separates stored annotations that could be affected by a germline database update
+    from those that can be carried forward unchanged.
+
+    Args:
+    -----
+
+        seq_file (str): Path to a file of stored (JSON or minimal) annotations.
+
+        file_format (str): Format of ``seq_file``. Either ``'json'`` or ``'minimal'``.
+
+        args (Args): Runtime arguments.
+
+    Returns:
+    --------
+
+        tuple: A list of the carried-forward annotations (unmodified lines from ``seq_file``),
+            the path to a FASTA-formatted file of raw input sequences that should be re-assigned
+            (or ``None`` if there aren't any), a list of the IDs of the sequences to be re-assigned
+            and a dict mapping the IDs of re-assigned sequences to their stored UMI counts (only
+            for sequences that have a UMI count).
+    '''
+    from ..utils.germline_diff import get_germline_diff, is_vulnerable
+    diff = get_germline_diff(args.previous_germline_db, args.species)
+    carried = []
+    reassign = []
+    umi_counts = {}
+    for line, record in Stored.iter_annotations(seq_file, file_format):
+        if record.get('raw_input') and is_vulnerable(record, diff, margin=args.reassign_margin):
+            reassign.append(Sequence([record['seq_id'], record['raw_input']]))
+            if record.get('umi_count') is not None:
+                umi_counts[record['seq_id']] = record['umi_count']
+        else:
+            carried.append(line)
+    reassigned = [s.id for s in reassign]
+    if not reassign:
+        return carried, None, reassigned, umi_counts
+    reassign_file = seq_file + '.reassign'
+    with open(reassign_file, 'w') as f:
+        f.write('\n'.join([s.fasta for s in reassign]))
+    return carried, reassign_file, reassigned, umi_counts
+
+
+def prefilter_sequence_file(seq_file, file_format, args):
+    '''
+    Removes non-antibody reads from ``seq_file`` using a k-mer ``Prefilter``.
+
+    Args:
+    -----
+
+        seq_file (str): Path to a FASTA or FASTQ-formatted sequence file.
+
+        file_format (str): Format of ``seq_file``. Either ``'fasta'`` or ``'fastq'``.
+
+        args (Args): Runtime arguments.
+
+    Returns:
+    --------
+
+        tuple: The path to a FASTA-formatted file containing the reads that passed the
+            prefilter (or ``None`` if no reads passed), and the number of reads that
+            were removed. If no reads were removed, ``seq_file`` is returned unchanged.
+    '''
+    from Bio import SeqIO
+    with open(seq_file, 'r') as f:
+        seqs = [Sequence(s) for s in SeqIO.parse(f, file_format.lower())]
+    kept, removed = Prefilter(args.species, min_kmers=args.prefilter_min_kmers)(seqs)
+    if not removed:
+        return seq_file, 0
+    if not kept:
+        return None, len(removed)
+    prefiltered_file = seq_file + '.prefiltered'
+    with open(prefiltered_file, 'w') as f:
+        f.write('\n'.join([s.fasta for s in kept]))
+    return prefiltered_file, len(removed)
+
+
+def format_cached_output(seq, record, args):
+    '''
+    Formats a cached annotation record for output. Since the same sequence can appear in
+    different samples (with different names), the sequence ID is not cached.
+    '''
+    record = collections.OrderedDict([('seq_id', seq.id)] + list(record.items()))
+    return format_json_output(record,
+                              pretty=args.pretty,
+                              padding=args.padding,
+                              raw=args.raw,
+                              keys=args.json_keys)
+
+
+def create_mongo_indexes(args):
+    '''
+    Indexes the MongoDB collection, once all jobs have finished inserting annotations.
+    '''
+    from ..utils.mongodb import create_indexes
+    logger.info('')
+    logger.info('Indexing the {} MongoDB collection: {}'.format(args.mongo_collection, ', '.join(args.mongo_indexes)))
+    try:
+        create_indexes(args.mongo_collection,
+                       args.mongo_db,
+                       args.mongo_indexes,
+                       ip=args.mongo_ip,
+                       port=args.mongo_port,
+                       user=args.mongo_user,
+                       password=args.mongo_password)
+    except:
+        logger.info('MongoDB indexing failed')
+        logging.debug(traceback.format_exc())
+
+
+def run_jobs(files, output_dir, log_dir, file_format, args, callback=None, total=None):
+    '''
+    Runs AbStar on a list (or an iterator, like ``iter_split_file()``) of (split) input files.
+    Input files are only requested from ``files`` as jobs can be started, so at most
+    ``args.jobs_per_worker`` jobs per worker process are queued at a time.
+
+    If provided, ``callback`` will be called with the input file and the result of
+    ``run_abstar()`` as each job is completed. ``total`` is the number of jobs, which is
+    only used to display progress (if not provided, ``len(files)`` is used).
+    '''
     sys.stdout.write('\nRunning VDJ...\n')
+    if total is None:
+        total = len(files)
     if args.cluster:
-        return _run_jobs_via_celery(files, output_dir, log_dir, file_format, args)
+        return _run_jobs_via_celery(files, output_dir, log_dir, file_format, args, callback, total)
     elif args.debug or args.chunksize == 0:
-        return _run_jobs_singlethreaded(files, output_dir, log_dir, file_format, args)
+        return _run_jobs_singlethreaded(files, output_dir, log_dir, file_format, args, callback, total)
     else:
-        return _run_jobs_via_multiprocessing(files, output_dir, log_dir, file_format, args)
+        return _run_jobs_via_multiprocessing(files, output_dir, log_dir, file_format, args, callback, total)
 
 
-def _run_jobs_singlethreaded(files, output_dir, log_dir, file_format, args):
+def _run_jobs_singlethreaded(files, output_dir, log_dir, file_format, args, callback=None, total=0):
     results = []
-    update_progress(0, len(files))
+    update_progress(0, total)
     for i, f in enumerate(files):
         try:
-            results.append(run_abstar(f, output_dir, log_dir, file_format, vars(args)))
-            update_progress(i + 1, len(files))
+            result = run_abstar(f, output_dir, log_dir, file_format, vars(args))
+            results.append(result)
+            if callback is not None:
+                callback(f, result)
+            update_progress(i + 1, total)
         except:
             logger.debug('FILE-LEVEL EXCEPTION: {}'.format(f))
             logging.debug(traceback.format_exc())
@@ -707,73 +1581,475 @@ def _run_jobs_singlethreaded(files, output_dir, log_dir, file_format, args):
     return results
 
 
-def _run_jobs_via_multiprocessing(files, output_dir, log_dir, file_format, args):
-    p = Pool(maxtasksperchild=50)
-    async_results = []
-    update_progress(0, len(files))
-    for f in files:
-        async_results.append((f, p.apply_async(run_abstar, (f,
-                                                         output_dir,
-                                                         log_dir,
-                                                         file_format,
-                                                         vars(args)))))
-    monitor_mp_jobs([ar[1] for ar in async_results])
-    results = []
-    for a in async_results:
-        try:
-            results.append(a[1].get())
-        except:
-            logger.debug('FILE-LEVEL EXCEPTION: {}'.format(a[0]))
-            # if args.debug:
-            #     traceback.print_exc()
-            logging.debug(''.join(traceback.format_exc()))
-            continue
-    p.close()
-    p.join()
+def _run_jobs_via_multiprocessing(files, output_dir, log_dir, file_format, args, callback=None, total=0):
+    # germline data is loaded once (in this process) and shared with the workers, rather
+    # than being re-loaded by every worker (and every replacement worker)
+    arena = create_arena(args)
+    job_starts = Queue()
+    processes = cpu_count()
+    p = Pool(processes=processes,
+             maxtasksperchild=50,
+             initializer=_initialize_mp_worker,
+             initargs=(arena.descriptor, job_starts))
+    runner = _PoolRunner(p, job_starts, capacity=processes * args.jobs_per_worker)
+    try:
+        results = monitor_jobs(runner, files, output_dir, log_dir, file_format, args, callback, total)
+    finally:
+        runner.close()
+        arena.release()
     return results
 
 
-def monitor_mp_jobs(results):
-    finished = 0
-    jobs = len(results)
-    while finished < jobs:
-        time.sleep(1)
-        ready = [ar for ar in results if ar.ready()]
-        finished = len(ready)
-        update_progress(finished, jobs)
-    sys.stdout.write('\n\n')
+def _initialize_mp_worker(arena_descriptor, job_starts):
+    global _JOB_STARTS
+    _JOB_STARTS = job_starts
+    attach_arena(arena_descriptor)
+
+
+def _run_mp_job(seq_file, output_dir, log_dir, file_format, arg_dict):
+    # job start times are reported to the parent process, so that straggling jobs can be identified
+    if _JOB_STARTS is not None:
+        _JOB_STARTS.put((seq_file, time.time()))
+    return run_abstar(seq_file, output_dir, log_dir, file_format, arg_dict)
+
+
+_JOB_STARTS = None
+
+
+
+class _PoolRunner(object):
+    '''
+    Submits jobs to a multiprocessing pool (see ``monitor_jobs()``).
+    '''
+    def __init__(self, pool, job_starts, capacity=None):
+        super(_PoolRunner, self).__init__()
+        self.pool = pool
+        self.job_starts = job_starts
+        self.capacity = capacity
+        self.cancelled = []
+        self._finished = threading.Event()
+
+    def submit(self, seq_file, output_dir, log_dir, file_format, arg_dict):
+        return self.pool.apply_async(_run_mp_job,
+                                     (seq_file, output_dir, log_dir, file_format, arg_dict),
+                                     callback=self._job_finished)
+
+    def wait(self, timeout):
+        # wakes up as soon as a job finishes, so that the next job can be submitted
+        self._finished.wait(timeout)
+        self._finished.clear()
+
+    def ready(self, job):
+        return job.ready()
+
+    def get(self, job):
+        return job.get()
+
+    def started(self, jobs):
+        starts = []
+        while True:
+            try:
+                starts.append(self.job_starts.get_nowait())
+            except queue.Empty:
+                break
+        return starts
+
+    def cancel(self, job):
+        # jobs can't be removed from a running pool, so a cancelled job keeps its worker busy
+        # until it finishes. The pool is terminated (rather than joined) if it hasn't finished
+        # by the end of the run
+        self.cancelled.append(job)
+
+    def close(self):
+        if any([not job.ready() for job in self.cancelled]):
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+    def _job_finished(self, result):
+        self._finished.set()
+
+
+
+def _run_jobs_via_celery(files, output_dir, log_dir, file_format, args, callback=None, total=0):
+    # Celery is only imported when running on a cluster
+    from ..utils.queue.celery import celery, run_abstar_batch_task, run_abstar_task
+    if args.inline_payloads or args.fuse_chunks > 1:
+        runner = _CeleryBatchRunner(run_abstar_batch_task,
+                                    capacity=_celery_capacity(celery, args.jobs_per_worker * args.fuse_chunks),
+                                    fuse=args.fuse_chunks,
+                                    inline=args.inline_payloads)
+    else:
+        runner = _CeleryRunner(run_abstar_task, capacity=_celery_capacity(celery, args.jobs_per_worker))
+    return monitor_jobs(runner, files, output_dir, log_dir, file_format, args, callback, total)
+
+
+def _celery_capacity(celery, jobs_per_worker):
+    '''
+    Returns the maximum number of queued Celery jobs: ``jobs_per_worker`` times the total
+    concurrency of the active workers, or ``None`` (no limit) if the workers can't be inspected.
+    '''
+    try:
+        stats = celery.control.inspect().stats() or {}
+        concurrency = sum([s['pool']['max-concurrency'] for s in stats.values()])
+    except:
+        logging.debug(traceback.format_exc())
+        return None
+    return concurrency * jobs_per_worker if concurrency else None
+
+
+
+class _CeleryRunner(object):
+    '''
+    Submits jobs to Celery workers (see ``monitor_jobs()``). Job start times are
+    only available if the task is tracking the ``STARTED`` state.
+    '''
+    def __init__(self, task, capacity=None):
+        super(_CeleryRunner, self).__init__()
+        self.task = task
+        self.capacity = capacity
+        self.reported = set()
+
+    def submit(self, seq_file, output_dir, log_dir, file_format, arg_dict):
+        return self.task.delay(seq_file, output_dir, log_dir, file_format, arg_dict)
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+
+    def ready(self, job):
+        return job.ready()
+
+    def get(self, job):
+        return job.get()
+
+    def started(self, jobs):
+        starts = []
+        for seq_file, job in jobs.items():
+            if seq_file in self.reported or job.ready():
+                continue
+            if job.state == 'STARTED':
+                self.reported.add(seq_file)
+                starts.append((seq_file, time.time()))
+        return starts
+
+    def cancel(self, job):
+        job.revoke(terminate=True)
+
+    def close(self):
+        pass
+
+
+
+class _CeleryBatchRunner(object):
+    '''
+    Submits jobs to Celery workers, with up to ``fuse`` jobs in each task (see ``run_abstar_batch()``).
+    Each task is polled once per call to ``wait()``, regardless of the number of jobs it contains.
+
+    If ``inline`` is ``True``, input files are sent in the task message and job outputs are
+    returned in the task result, so workers don't need access to the input, temp or output directories.
+    '''
+    def __init__(self, task, capacity=None, fuse=1, inline=False):
+        super(_CeleryBatchRunner, self).__init__()
+        self.task = task
+        self.capacity = capacity
+        self.fuse = max(1, int(fuse))
+        self.inline = inline
+        self.unsent = []
+        self.batches = []
+        self._job_args = None
+        self._args = None
+
+    def submit(self, seq_file, output_dir, log_dir, file_format, arg_dict):
+        job = _BatchedJob(seq_file)
+        self.unsent.append(job)
+        self._job_args = (output_dir, log_dir, file_format, arg_dict)
+        if len(self.unsent) >= self.fuse:
+            self._send()
+        return job
+
+    def wait(self, timeout):
+        # partial batches are sent, rather than waiting for more jobs
+        if self.unsent:
+            self._send()
+        time.sleep(timeout)
+        for batch in self.batches:
+            batch.done = batch.async_result.ready()
+        self.batches = [b for b in self.batches if not b.done]
+
+    def ready(self, job):
+        return job.batch is not None and job.batch.done
+
+    def get(self, job):
+        if job.batch.results is None:
+            job.batch.results = job.batch.async_result.get()
+        result = job.batch.results[job.batch.jobs.index(job)]
+        if self.inline:
+            output_dir, log_dir, _, arg_dict = self._job_args
+            if self._args is None:
+                self._args = Args(**arg_dict)
+            result = decode_job_result(result, job.seq_file, output_dir, log_dir, self._args)
+        return result
+
+    def started(self, jobs):
+        starts = []
+        for batch in self.batches:
+            if batch.started:
+                continue
+            if batch.async_result.state == 'STARTED':
+                batch.started = True
+                starts.extend([(job.seq_file, time.time()) for job in batch.jobs])
+        return starts
+
+    def cancel(self, job):
+        # a task is only revoked if none of its jobs are still needed
+        job.cancelled = True
+        if job.batch is not None and not job.batch.done and all([j.cancelled for j in job.batch.jobs]):
+            job.batch.async_result.revoke(terminate=True)
+
+    def close(self):
+        pass
+
+    def _send(self):
+        jobs = self.unsent
+        self.unsent = []
+        output_dir, log_dir, file_format, arg_dict = self._job_args
+        if self.inline:
+            chunks = [(job.seq_file, encode_file(job.seq_file)) for job in jobs]
+        else:
+            chunks = [job.seq_file for job in jobs]
+        batch = _CeleryBatch(self.task.delay(chunks, output_dir, log_dir, file_format, arg_dict, self.inline), jobs)
+        for job in jobs:
+            job.batch = batch
+        self.batches.append(batch)
+
+
+
+class _CeleryBatch(object):
+    def __init__(self, async_result, jobs):
+        super(_CeleryBatch, self).__init__()
+        self.async_result = async_result
+        self.jobs = jobs
+        self.done = False
+        self.started = False
+        self.results = None
+
+
+
+class _BatchedJob(object):
+    def __init__(self, seq_file):
+        super(_BatchedJob, self).__init__()
+        self.seq_file = seq_file
+        self.batch = None
+        self.cancelled = False
+
+
+
+def monitor_jobs(runner, files, output_dir, log_dir, file_format, args, callback=None, total=0):
+    '''
+    Submits jobs using ``runner``, monitors their progress and collects the results.
+
+    Input files are requested from ``files`` (which can be an iterator) as jobs are submitted,
+    and no more than ``runner.capacity`` jobs are in flight at once. Finished jobs are released
+    as soon as their results have been collected and passed to ``callback``.
+
+    If ``args.chunk_timeout`` or ``args.straggler_factor`` are set, jobs that run for too long
+    (either longer than ``args.chunk_timeout`` seconds or more than ``args.straggler_factor`` times
+    the median job time) are split into smaller jobs, which are re-dispatched while the original
+    job keeps running. Whichever finishes first is used: either the original job's result, or the
+    merged results of the re-dispatched jobs (see ``merge_job_results()``). The other is cancelled.
+    If one of them fails, the other is still used, and the job only fails if both fail. Cancelling is
+    best-effort: Celery tasks are revoked, but jobs in a multiprocessing pool run until they finish
+    (or until the pool is terminated at the end of the run).
+
+    Args:
+    -----
+
+        runner: Job runner (``_PoolRunner`` or ``_CeleryRunner``).
+
+        files (iterable): Paths to the (split) input files.
+
+        output_dir (str): Directory for the job outputs.
+
+        log_dir (str): Log directory.
+
+        file_format (str): Format of the input files.
+
+        args (Args): Runtime arguments.
+
+        callback (callable): Called with the input file and the result of ``run_abstar()``
+            as each job is completed.
+
+        total (int): Total number of jobs, which is only used to display progress.
 
+    Returns:
+    --------
 
-def _run_jobs_via_celery(files, output_dir, log_dir, file_format, args):
-    async_results = []
-    for f in files:
-        async_results.append(run_abstar.delay(f,
-                                           output_dir,
-                                           log_dir,
-                                           file_format,
-                                           vars(args)))
-    succeeded, failed = monitor_celery_jobs(async_results)
-    failed_files = [f for i, f in enumerate(files) if async_results[i].failed()]
-    for ff in failed_files:
-        logger.debug('FAILED FILE: {}'.format(f))
-    return [s.get() for s in succeeded]
-
-
-def monitor_celery_jobs(results):
-    finished = 0
-    jobs = len(results)
-    while finished < jobs:
-        time.sleep(1)
-        succeeded = [ar for ar in results if ar.successful()]
-        failed = [ar for ar in results if ar.failed()]
-        finished = len(succeeded) + len(failed)
-        update_progress(finished, jobs, failed=len(failed))
+        list: Job results, in the same order as ``files``. Jobs that failed are not included.
+    '''
+    arg_dict = vars(args)
+    tracker = StragglerTracker(factor=args.straggler_factor, timeout=args.chunk_timeout)
+    files = iter(files)
+    order = []
+    jobs = collections.OrderedDict()
+    speculative = {}
+    speculated = []
+    speculative_wins = 0
+    redispatched = 0
+    results = {}
+    failed = 0
+    job_failed = set()
+    exhausted = False
+    update_progress(0, total)
+    while True:
+        # keep the runner busy, without queueing more than runner.capacity jobs
+        while not exhausted and (runner.capacity is None or len(jobs) < runner.capacity):
+            try:
+                f = next(files)
+            except StopIteration:
+                exhausted = True
+                break
+            order.append(f)
+            jobs[f] = runner.submit(f, output_dir, log_dir, file_format, arg_dict)
+        if exhausted and not jobs:
+            break
+        runner.wait(1)
+        for f, start_time in runner.started(jobs):
+            tracker.started(f, start_time)
+        for f, job in list(jobs.items()):
+            pieces = speculative.get(f)
+            if f not in job_failed and runner.ready(job):
+                tracker.finished(f)
+                try:
+                    result = runner.get(job)
+                except:
+                    logger.debug('FILE-LEVEL EXCEPTION: {}'.format(f))
+                    logging.debug(''.join(traceback.format_exc()))
+                    result = None
+                # run_abstar() returns None if the job failed
+                if result is None:
+                    job_failed.add(f)
+                else:
+                    results[f] = result
+                    for _, piece in (pieces or []):
+                        runner.cancel(piece)
+            for pf, piece in (pieces or []):
+                if runner.ready(piece):
+                    tracker.finished(pf)
+            if f not in results and pieces and all([runner.ready(piece) for _, piece in pieces]):
+                try:
+                    results[f] = merge_job_results(f, [runner.get(piece) for _, piece in pieces],
+                                                   output_dir, log_dir, args)
+                    speculative_wins += 1
+                except:
+                    logger.debug('FILE-LEVEL EXCEPTION: {}'.format(f))
+                    logging.debug(''.join(traceback.format_exc()))
+                    # an empty list of pieces marks the re-dispatched jobs as failed
+                    speculative[f] = []
+                else:
+                    runner.cancel(job)
+            if f not in results:
+                # the job has only failed once the original job and
+                # any re-dispatched jobs have all failed
+                if f not in job_failed or speculative.get(f):
+                    continue
+                failed += 1
+            del jobs[f]
+            speculative.pop(f, None)
+            if f in results and callback is not None:
+                try:
+                    callback(f, results[f])
+                except:
+                    logging.debug(traceback.format_exc())
+        for f in tracker.stragglers():
+            if f not in jobs or f in speculative:
+                continue
+            try:
+                piece_files = split_speculative_job(f, file_format)
+            except:
+                logging.debug(traceback.format_exc())
+                continue
+            logging.debug('STRAGGLER: {} was re-dispatched as {} jobs'.format(f, len(piece_files)))
+            speculative[f] = [(pf, runner.submit(pf, output_dir, log_dir, file_format, arg_dict)) for pf in piece_files]
+            speculated.extend(piece_files)
+            redispatched += 1
+        update_progress(len(results) + failed, max(total, len(order)), failed=failed)
     sys.stdout.write('\n\n')
-    return succeeded, failed
+    if speculated:
+        logger.info('{} slow jobs were re-dispatched ({} finished before the original job)'.format(
+            redispatched, speculative_wins))
+        clear_temp_files([pf for pf in speculated if os.path.isfile(pf)])
+    return [results[f] for f in order if f in results]
+
+
+def split_speculative_job(seq_file, file_format):
+    '''
+    Splits the input file of a straggling job into (at most) ``SPECULATIVE_SPLITS`` files.
+    '''
+    if file_format in STORED_FORMATS:
+        with open(seq_file) as f:
+            count = len([l for l in f if l.strip()]) - (1 if file_format == 'minimal' else 0)
+    else:
+        from Bio import SeqIO
+        with open(seq_file) as f:
+            count = sum([1 for _ in SeqIO.parse(f, file_format.lower())])
+    batch_size = max(1, -(-count // SPECULATIVE_SPLITS))
+    return split_sub_batches(seq_file, file_format, batch_size, suffix='spec')
+
+
+def merge_job_results(seq_file, results, output_dir, log_dir, args):
+    '''
+    Merges the results of the jobs that a straggling job was split into, so that
+    they can be used in place of the straggling job's result.
+
+    Returns:
+    --------
+
+        tuple: A result tuple, in the same format as ``run_abstar()``. Merged outputs
+            and logs are written to new files, since the original job may still be
+            writing to its own output files.
+
+    Raises:
+    -------
+
+        ValueError: If any of the jobs failed (``run_abstar()`` returned ``None``), since
+            the merged results would be missing that job's sequences.
+    '''
+    if any([r is None for r in results]):
+        raise ValueError('{} of {} re-dispatched jobs failed'.format(len([r for r in results if r is None]),
+                                                                    len(results)))
+    name = os.path.basename(seq_file) + '.speculative'
+    output_files = []
+    for i, output_type in enumerate(get_file_output_types(args)):
+        ofile = os.path.join(output_dir, name + get_output_suffix(output_type))
+        temp_files = [r[0][i] for r in results]
+        if output_type == 'sqlite':
+            merge_sqlite(temp_files, ofile)
+        else:
+            with open(ofile, 'w') as out_file:
+                concat_output_files(temp_files, out_file, output_type)
+        output_files.append(ofile)
+    log_files = []
+    for i, log_type in zip([2, 3, 4], ['annotated', 'failed', 'unassigned']):
+        lfile = os.path.join(log_dir, 'temp/{}.{}'.format(name, log_type))
+        with open(lfile, 'w') as out_file:
+            for r in results:
+                if r[i] and os.path.isfile(r[i]):
+                    with open(r[i]) as f:
+                        for line in f:
+                            out_file.write(line)
+        log_files.append(lfile)
+    stats = {}
+    for r in results:
+        for k, v in (r[5] if len(r) > 5 else {}).items():
+            stats[k] = stats.get(k, 0) + v
+    successful = sum([r[1] for r in results])
+    clear_temp_files([f for r in results for f in r[0] + list(r[2:5]) if f and os.path.isfile(f)])
+    return (output_files, successful, log_files[0], log_files[1], log_files[2], stats)
 
 
 def update_progress(finished, jobs, failed=None):
-    pct = int(100. * finished / jobs)
+    pct = int(100. * finished / jobs) if jobs else 100
     ticks = int(pct / 2)
     spaces = int(50 - ticks)
     if failed:
@@ -845,6 +2121,13 @@ def run(*args, **kwargs):
         When given multiple sequences, ``abstar.run()`` will return a list of AbTools ``Sequence`` objects,
         one per input sequence.
 
+        All of the sequences are annotated at once, so ``abstar.run()`` isn't well suited to very large
+        numbers of sequences. In that case, ``abstar.stream()`` consumes the sequences lazily and yields
+        results as they are completed::
+
+            for ab in abstar.stream(SeqIO.parse(fasta, 'fasta'), chunksize=500):
+                print(ab['cdr3_aa'])
+
         If you'd prefer not to parse the FASTQ/A file into a list (for example, if the input file is
         extremely large), you can pass the input file path directly, along with a temp directory and output
         directory::
@@ -940,6 +2223,20 @@ def run(*args, **kwargs):
         debug (bool): If ``True``, ``abstar.run()`` runs in single-threaded mode, the log is much more verbose,
             and temporary files are not removed. Default is ``False``.
 
+        cache (bool): If ``True``, annotations are stored in a persistent cache and previously
+            cached annotations are re-used rather than re-annotating the sequence. Annotations are
+            only re-used if the species, germline database and AbStar version are unchanged. Only
+            JSON output is cached. Default is ``False``.
+
+        cache_dir (str): Path to the annotation cache directory. Default is ``~/.abstar/cache``.
+
+        cache_size (int): Maximum size of the annotation cache, in MB. When the cache is full,
+            the least recently used annotations are removed. Default is 2048.
+
+        resume (bool): If ``True``, resumes an interrupted run using the run manifest in ``temp``.
+            Input files that were completely processed are skipped, and only unfinished jobs are
+            re-run for partially processed files. Default is ``False``.
+
 
     Returns:
 
@@ -986,6 +2283,167 @@ def run(*args, **kwargs):
     return output
 
 
+def stream(sequences, chunksize=500, processes=None, **kwargs):
+    '''
+    Annotates an iterable of sequences, yielding results as they're completed.
+
+    Unlike ``run()``, which annotates all of the input sequences at once, ``stream()``
+    consumes the input lazily and processes it in chunks using a pool of worker processes.
+    Only a limited number of chunks are in progress at any time, so memory usage is bounded
+    by ``chunksize`` (and the number of processes) rather than by the number of input sequences.
+    This makes ``stream()`` suitable for annotating very large numbers of sequences
+    interactively, or for sequences that come from a generator.
+
+    Sequences can be in any format recognized by ``abutils.core.sequence.Sequence``. All other
+    keyword arguments are the same as ``run()``.
+
+    Examples:
+
+        Annotating sequences parsed from a FASTA file with Biopython::
+
+            from Bio import SeqIO
+
+            with open('my_sequences.fasta', 'r') as fasta:
+                for ab in abstar.stream(SeqIO.parse(fasta, 'fasta')):
+                    print(ab['v_gene']['gene'])
+
+
+    Args:
+
+        sequences: An iterable of sequences. Required.
+
+        chunksize (int): Number of sequences that are annotated together in a single job.
+            Default is 500.
+
+        processes (int): Number of worker processes. Default is ``None``, which uses
+            all available CPUs. If ``processes`` is 1, sequences are annotated in the current
+            process.
+
+
+    Yields:
+
+        AbTools ``Sequence`` objects, one per successfully annotated input sequence. Results are
+        yielded in the order that chunks are completed, which may not be the input order.
+
+    Raises:
+
+        ValueError: If an input sequence isn't in a recognized format. If annotating a chunk
+            fails, the exception is re-raised once the chunk is collected.
+    '''
+    warnings.filterwarnings("ignore")
+    args = Args(**kwargs)
+    # validated as an interactive run, but sequences are consumed lazily
+    # so they aren't stored in (and sent to each worker with) the args
+    args.sequences = True
+    validate_args(args)
+    args.sequences = None
+    chunksize = max(int(chunksize), 1)
+    chunks = _iter_sequence_chunks(sequences, chunksize)
+    if processes == 1:
+        for chunk in chunks:
+            for p in process_sequences([Sequence(s) for s in chunk], args):
+                yield Sequence(dict(p))
+        return
+    pool = Pool(processes=processes, maxtasksperchild=50)
+    # limit the number of in-flight chunks so that input is only consumed
+    # as quickly as workers can process it
+    max_in_flight = 2 * (processes if processes is not None else cpu_count())
+    completed = queue.Queue()
+    in_flight = 0
+    try:
+        for chunk in chunks:
+            pool.apply_async(_process_sequence_chunk, (chunk, vars(args)),
+                             callback=lambda r: completed.put((r, None)),
+                             error_callback=lambda e: completed.put((None, e)))
+            in_flight += 1
+            while in_flight >= max_in_flight:
+                for p in _get_completed_chunk(completed):
+                    yield Sequence(dict(p))
+                in_flight -= 1
+        while in_flight > 0:
+            for p in _get_completed_chunk(completed):
+                yield Sequence(dict(p))
+            in_flight -= 1
+        pool.close()
+    except:
+        # includes GeneratorExit, if the caller stops iterating early
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _iter_sequence_chunks(sequences, chunksize):
+    '''
+    Lazily groups an iterable of sequences into lists of ``[seq_id, sequence]``
+    pairs, each containing at most ``chunksize`` sequences.
+    '''
+    sequences = iter(sequences)
+    while True:
+        chunk = []
+        for s in itertools.islice(sequences, chunksize):
+            try:
+                seq = Sequence(s)
+            except Exception:
+                raise ValueError('invalid format for sequence input: {!r}'.format(s))
+            chunk.append([seq.id, seq.sequence])
+        if not chunk:
+            return
+        yield chunk
+
+
+def _get_completed_chunk(completed):
+    '''
+    Returns the next completed chunk from ``stream()``, re-raising the exception if
+    the chunk failed (for example, if the worker process died or results couldn't be pickled).
+    '''
+    result, error = completed.get()
+    if error is not None:
+        raise error
+    return result
+
+
+def _process_sequence_chunk(sequences, arg_dict):
+    '''
+    Worker function for ``stream()`` and the annotation server. Exceptions aren't caught
+    here, so that they reach the caller (through the pool's ``error_callback``) rather than
+    silently dropping the chunk's sequences.
+    '''
+    args = Args(**arg_dict)
+    return process_sequences([Sequence(s) for s in sequences], args)
+
+
+def reannotate(**kwargs):
+    '''
+    Re-annotates previously annotated sequences, re-using the stored germline assignments.
+
+    Stored annotations can be either JSON or minimal output, and must include the raw
+    input sequence. Only the annotation steps that follow germline assignment are run,
+    so re-annotation is much faster than the original run. This is useful when the
+    annotation logic or output schema has changed.
+
+    Args:
+
+        input (str): Path to a file or directory of stored annotations. Required.
+
+        output (str): Path to the output directory. Required.
+
+        temp (str): Path to the temp directory. Required.
+
+    All other keyword arguments are the same as ``abstar.run()``, although the assigner
+    is always ``'stored'``.
+
+    Returns:
+
+        list: Output files.
+    '''
+    warnings.filterwarnings("ignore")
+    kwargs['assigner'] = 'stored'
+    args = Args(**kwargs)
+    validate_args(args)
+    return main(args)
+
+
 def run_standalone(args):
     output_dir = main(args)
 
@@ -1016,30 +2474,94 @@ def main(args):
         output_files = []
         # assigned_files = []
         # unassigned_files = []
+        manifest = RunManifest(os.path.join(temp_dir, 'abstar_manifest.json'), args, resume=args.resume)
+        if args.resume and not manifest.resumed:
+            logger.info('')
+            logger.info('No resumable run was found in the temp directory, starting a new run.')
         for f, fmt in zip(input_files, format_check(input_files)):
-            # skip the non-FASTA/Q files
-            if fmt is None:
+            # skip the non-FASTA/Q files (or, when re-annotating, files that aren't stored annotations)
+            if fmt is None or (fmt in STORED_FORMATS) != (args.assigner == 'stored'):
+                continue
+            # carried-forward annotations are copied verbatim, so they must already be in the output format
+            if args.previous_germline_db is not None and fmt not in args.output_type:
+                logger.info('')
+                logger.info('Skipping {}: {}-formatted annotations can only be updated with {} output'.format(
+                    os.path.basename(f), fmt, fmt))
                 continue
             start_time = time.time()
             print_input_file_info(f, fmt)
-            subfiles, seq_count = split_file(f, fmt, temp_dir, args)
-            run_info = run_jobs(subfiles, temp_dir, log_dir, fmt, args)
+            # the full checksum of each input file is only needed to verify a resumed run
+            fingerprint = file_fingerprint(f, checksum=manifest.resumed)
+            if manifest.is_file_complete(f, fingerprint):
+                logger.info('Skipping: this file was completed by a previous run.')
+                output_files.extend(manifest.file_entry(f)['outputs'])
+                continue
+            split_input, split_format = f, fmt
+            if args.umi_consensus:
+                umi_results = build_umi_consensus(f, fmt, args.uid, temp_dir)
+                consensus_file, read_count, consensus_count, dropped_count = umi_results
+                logger.info('{} reads were collapsed into {} UMI consensus sequences'.format(read_count,
+                                                                                            consensus_count))
+                if dropped_count:
+                    logger.info('{} reads were excluded from the consensus sequences because their length '
+                                'differed from the other reads with the same UMI'.format(dropped_count))
+                split_input, split_format = consensus_file, 'fasta'
+            # sequence counts are recorded in the manifest, so an (unchanged) input file
+            # is only counted once, rather than every time the run is resumed
+            seq_count = manifest.seq_count(f, fingerprint)
+            if seq_count is None:
+                seq_count = count_sequences(split_input, split_format)
+            # split files are created lazily (as jobs are queued), but their names are fixed
+            subfiles = get_chunk_names(split_input, temp_dir, seq_count, args)
+            logger.info('SEQUENCES: {}'.format(seq_count))
+            logger.info('JOBS: {}'.format(len(subfiles)))
+            manifest.start_file(f, fingerprint, seq_count)
+            results = manifest.completed_chunks(f)
+            if results:
+                logger.info('RESUMING: {} of {} jobs were completed by a previous run'.format(len(results),
+                                                                                              len(subfiles)))
+
+            def job_completed(subfile, result, f=f, results=results, split_input=split_input):
+                manifest.complete_chunk(f, subfile, result)
+                results[subfile] = result
+                # split files aren't needed once their job is complete
+                if not args.debug and subfile != split_input and os.path.isfile(subfile):
+                    os.unlink(subfile)
+
+            job_args = args
+            if 'mongodb' in args.output_type and args.mongo_collection is None:
+                job_args = copy.copy(args)
+                job_args.mongo_collection = get_output_prefix(f)
+            pending_count = len([sf for sf in subfiles if sf not in results])
+            if pending_count:
+                pending = iter_split_file(split_input, split_format, temp_dir, args, skip=results)
+                run_jobs(pending, temp_dir, log_dir, split_format, job_args,
+                         callback=job_completed, total=pending_count)
+                if 'mongodb' in args.output_type and args.mongo_indexes:
+                    create_mongo_indexes(job_args)
+            if split_input != f:
+                os.unlink(split_input)
+            run_info = [results[sf] for sf in subfiles if sf in results]
             temp_output_files = [r[0] for r in run_info if r is not None]
             processed_seq_counts = [r[1] for r in run_info if r is not None]
             annotated_log_files = [r[2] for r in run_info if r is not None]
             failed_log_files = [r[3] for r in run_info if r is not None]
             unassigned_log_files = [r[4] for r in run_info if r is not None]
+            job_stats = [r[5] for r in run_info if r is not None and len(r) > 5]
             vdj_end_time = time.time()
             _output_files = concat_outputs(f, temp_output_files, output_dir, args)
             unassigned_file = concat_logs(f, unassigned_log_files, log_dir, 'unassigned')
             failed_file = concat_logs(f, failed_log_files, log_dir, 'failed')
             if args.debug:
                 annotated_file = concat_logs(f, annotated_log_files, log_dir, 'annotated')
-            output_files.extend(output_files)
+            output_files.extend(_output_files)
+            manifest.complete_file(f, _output_files)
             if not args.debug:
                 flat_temp_files = [f for subl in temp_output_files for f in subl]
-                clear_temp_files(subfiles + flat_temp_files + annotated_log_files + failed_log_files + unassigned_log_files)
-            print_job_stats(seq_count, processed_seq_counts, start_time, vdj_end_time)
+                # split files for failed jobs
+                leftover_subfiles = [sf for sf in subfiles if sf != split_input and os.path.isfile(sf)]
+                clear_temp_files(leftover_subfiles + flat_temp_files + annotated_log_files + failed_log_files + unassigned_log_files)
+            print_job_stats(seq_count, processed_seq_counts, start_time, vdj_end_time, job_stats)
         return output_files
 
 
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# filename: aio.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+'''
+Asynchronous (``asyncio``) interface to AbStar. Requires Python 3.7 or later.
+'''
+
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import shlex
+from tempfile import NamedTemporaryFile
+
+from abutils.core.sequence import Sequence
+
+from .abstar import (Args, format_cached_output, get_annotation_cache, process_sequences,
+                     validate_species, STR_TYPES)
+from .antibody import Antibody
+from ..assigners.blastn import Blastn
+from ..utils.output import get_abstar_result, get_output
+from ..utils.prefilter import Prefilter
+
+
+_EXECUTOR = None
+_EXECUTOR_PROCESSES = None
+
+
+async def run_async(*sequences, processes=None, **kwargs):
+    '''
+    Annotates one or more sequences without blocking the event loop.
+
+    BLASTn is run as an asynchronous subprocess, and the CPU-intensive parts of the
+    annotation are done in a pool of worker processes. The worker pool is created the
+    first time ``run_async()`` is called and is shared by all subsequent calls, so
+    concurrent requests are spread across a single set of warm workers.
+
+    Input sequences can be provided in the same formats as ``abstar.run()``: individual
+    sequences as positional arguments, or a list of sequences as a single argument.
+    All other keyword arguments are the same as ``abstar.run()``.
+
+    Examples:
+
+        Annotating a single sequence from within a coroutine::
+
+            import abstar
+
+            async def handler(request):
+                ab = await abstar.run_async(['seq1', 'ATGC'])
+                return ab['cdr3_aa']
+
+
+    Args:
+
+        processes (int): Number of worker processes in the shared worker pool. Only used
+            when the pool is first created. Default is ``None``, which uses all available CPUs.
+
+
+    Returns:
+
+        If the input is a single sequence, ``run_async`` returns a single AbTools ``Sequence``
+        object (or ``None``, if the sequence couldn't be annotated).
+
+        If the input is a list of sequences, ``run_async`` returns a list of AbTools ``Sequence`` objects.
+    '''
+    single = False
+    if len(sequences) == 1:
+        try:
+            sequences = [Sequence(sequences[0]), ]
+            single = True
+        except:
+            sequences = [Sequence(s) for s in sequences[0]]
+    else:
+        sequences = [Sequence(s) for s in sequences]
+    args = Args(**kwargs)
+    args.output_type = ['json', ]
+    args.raw = True
+    args.padding = False
+    if args.json_keys is not None and type(args.json_keys) in STR_TYPES:
+        args.json_keys = args.json_keys.split(',')
+    if args.temp is None:
+        args.temp = '/tmp'
+    validate_species(args.species)
+    loop = asyncio.get_running_loop()
+    executor = get_executor(processes)
+    if args.assigner == 'blastn' and sequences:
+        processed = await _process_sequences_async(sequences, args, loop, executor)
+    elif sequences:
+        processed = await loop.run_in_executor(executor, _process_sequences, sequences, vars(args))
+    else:
+        processed = []
+    results = [Sequence(dict(p)) for p in processed]
+    if single:
+        return results[0] if results else None
+    return results
+
+
+def get_executor(processes=None):
+    '''
+    Returns the worker pool shared by all ``run_async()`` calls, creating it if necessary.
+    '''
+    global _EXECUTOR, _EXECUTOR_PROCESSES
+    if _EXECUTOR is None:
+        _EXECUTOR_PROCESSES = processes if processes is not None else multiprocessing.cpu_count()
+        _EXECUTOR = ProcessPoolExecutor(max_workers=_EXECUTOR_PROCESSES)
+    return _EXECUTOR
+
+
+def shutdown_executor(wait=True):
+    '''
+    Shuts down the shared worker pool. A new pool will be created by the next
+    ``run_async()`` call.
+    '''
+    global _EXECUTOR, _EXECUTOR_PROCESSES
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=wait)
+        _EXECUTOR = None
+        _EXECUTOR_PROCESSES = None
+
+
+async def _process_sequences_async(sequences, args, loop, executor):
+    '''
+    Async equivalent of ``process_sequences()`` for the BLASTn assigner.
+
+    V- and J-gene BLASTn searches run as asynchronous subprocesses. BLASTn output is parsed
+    in the default thread pool, and D-gene assignment and annotation are done in ``executor``.
+    '''
+    outputs = []
+    # retrieve previously annotated sequences from the cache
+    if args.cache:
+        cached, sequences = await loop.run_in_executor(None, _cache_get, sequences, args)
+        outputs += [format_cached_output(seq, record, args) for seq, record in cached]
+        if not sequences:
+            return outputs
+    # remove non-antibody reads
+    if args.prefilter:
+        # building the k-mer index (the first time) and classifying reads are both CPU-bound
+        sequences, _ = await loop.run_in_executor(None, _prefilter, sequences, args.species, args.prefilter_min_kmers)
+        if not sequences:
+            return outputs
+    assigner = Blastn(args.species)
+    # assign V-genes
+    oriented, strands = await loop.run_in_executor(None, assigner.orient_queries, sequences)
+    vchains = await loop.run_in_executor(None, assigner.route_queries, oriented)
+    vblast_records = await _blast_by_chain(assigner, oriented, 'V', vchains, strands, args.temp)
+    vdjs, jquery_seqs = await loop.run_in_executor(None, assigner.assign_vgenes,
+                                                   sequences, vblast_records, oriented)
+    if not vdjs:
+        return outputs
+    # assign J-genes (using the chain of the assigned V-gene)
+    jchains = [vdj.v.chain for vdj in vdjs]
+    jblast_records = await _blast_by_chain(assigner, jquery_seqs, 'J', jchains, None, args.temp)
+    vdjs, dquery_seqs = await loop.run_in_executor(None, assigner.assign_jgenes, vdjs, jquery_seqs, jblast_records)
+    if not vdjs:
+        return outputs
+    # assign D-genes and annotate
+    annotated = await loop.run_in_executor(executor, _annotate, vdjs, dquery_seqs, vars(args))
+    outputs += [output for _, _, output in annotated]
+    # update the annotation cache
+    if args.cache:
+        await loop.run_in_executor(None, _cache_put, [(seq, record) for seq, record, _ in annotated], args)
+    return outputs
+
+
+async def _blast_by_chain(assigner, sequences, segment, chains, strands, temp_dir):
+    '''
+    Searches each (oriented) sequence against the BLASTn database for its chain. Searches
+    against different databases (or strands) are run concurrently.
+    '''
+    groups = assigner.group_by_database(segment, chains, strands)
+    group_records = await asyncio.gather(*[_blast(assigner, [sequences[i] for i in indexes], segment, temp_dir,
+                                                  database=database, strand=strand)
+                                           for database, strand, indexes in groups])
+    records = [None] * len(sequences)
+    for (database, strand, indexes), recs in zip(groups, group_records):
+        for i, record in zip(indexes, recs):
+            records[i] = record
+    # if none of the searches returned any records, BLASTn failed
+    return records if any([r is not None for r in records]) else []
+
+
+async def _blast(assigner, sequences, segment, temp_dir, database=None, strand='plus'):
+    seq_file = _write_fasta(sequences, temp_dir)
+    blastout = NamedTemporaryFile(dir=temp_dir, delete=False)
+    blastout.close()
+    blastn_cmd = assigner.blast_commandline(seq_file, segment, blastout.name, database=database, strand=strand)
+    proc = await asyncio.create_subprocess_exec(*shlex.split(str(blastn_cmd)),
+                                                stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate()
+    os.unlink(seq_file)
+    if proc.returncode != 0:
+        os.unlink(blastout.name)
+        raise RuntimeError('BLASTn returned non-zero exit status {}:\n{}'.format(proc.returncode,
+                                                                                  stderr.decode('utf-8', 'replace')))
+    return assigner.parse_blast_output(blastout.name)
+
+
+def _cache_get(sequences, args):
+    '''
+    Retrieves cached annotations. Returns a list of ``(sequence, record)`` tuples for the cached
+    sequences and a list of the uncached sequences.
+
+    SQLite connections can only be used by the thread that opened them, and executor calls
+    don't always run on the same thread, so the cache is opened and closed within each call.
+    '''
+    cache = get_annotation_cache(args)
+    if cache is None:
+        return [], sequences
+    try:
+        return cache.get(sequences)
+    finally:
+        cache.close()
+
+
+def _cache_put(results, args):
+    '''
+    Adds ``(sequence, record)`` tuples to the annotation cache (see ``_cache_get()``).
+    '''
+    cache = get_annotation_cache(args)
+    if cache is None:
+        return
+    try:
+        cache.put(results)
+    finally:
+        cache.close()
+
+
+def _prefilter(sequences, species, min_kmers):
+    return Prefilter(species, min_kmers=min_kmers)(sequences)
+
+
+def _write_fasta(sequences, temp_dir):
+    fasta = NamedTemporaryFile(dir=temp_dir, delete=False, mode='w')
+    fasta.write('\n'.join([s.fasta for s in sequences]))
+    fasta.close()
+    return fasta.name
+
+
+def _annotate(vdjs, dquery_seqs, arg_dict):
+    '''
+    Worker function that assigns D-genes and annotates a list of VDJ objects.
+
+    Returns a list of ``(raw_input, json_record, output)`` tuples. ``json_record`` is
+    only included (for updating the annotation cache) if caching is enabled.
+    '''
+    args = Args(**arg_dict)
+    assigner = Blastn(args.species)
+    annotated = []
+    for vdj in assigner.assign_dgenes(vdjs, dquery_seqs):
+        try:
+            ab = Antibody(vdj, args.species)
+            ab.annotate(args.uid)
+            result = get_abstar_result(ab,
+                                       pretty=False,
+                                       padding=False,
+                                       raw=True,
+                                       keys=args.json_keys)
+            output = get_output(result, 'json')
+            if output is not None:
+                annotated.append((ab.raw_input.sequence,
+                                  result.json_record if args.cache else None,
+                                  output))
+        except:
+            continue
+    return annotated
+
+
+def _process_sequences(sequences, arg_dict):
+    '''
+    Worker function for assigners that don't support asynchronous assignment.
+    '''
+    return process_sequences(sequences, Args(**arg_dict))
@@ -26,14 +26,13 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import traceback
 
-from Bio.Seq import Seq
-from Bio.Alphabet import generic_dna
-
 from abutils.utils.alignment import global_alignment, local_alignment
 
 from .germline import get_imgt_germlines
 from ..utils import isotype, junction, mutations, productivity, regions
 from ..utils.mixins import LoggingMixin
+from ..utils.translation import translate
+from ..utils.umi import parse_umi_count
 
 
 class Antibody(LoggingMixin):
@@ -51,6 +50,7 @@ class Antibody(LoggingMixin):
         self.d = vdj.d
         self.chain = vdj.v.chain
         self.species = species.lower()
+        self.umi_count = vdj.umi_count
         # initialize the log
         self.initialize_log()
         # property vars
@@ -101,14 +101,19 @@ class Antibody(LoggingMixin):
 
 
 
-    def annotate(self, uid):
+    def annotate(self, uid, umi_consensus=False):
         '''
         Realigns the V(D)J germline genes using optimized SSW alignment
         parameters, followed by more detailed annotation (junction
         identification, ambig correction, parsing of mutations and
         indels, etc).
+
+        If ``umi_consensus`` is ``True``, the sequence is a UMI consensus
+        sequence and the number of reads is parsed from the sequence ID.
         '''
         try:
+            if umi_consensus:
+                self.id, self.umi_count = parse_umi_count(self.id)
             # print(self.id)
             # print('Parsing UIDs...')
             self._parse_uid(uid)
@@ -263,12 +268,12 @@ class Antibody(LoggingMixin):
         self.coding_start = self.v.query_start + self.v_rf_offset
         self.coding_end = self.j.query_end - (len(self.oriented_input[self.coding_start:self.j.query_end])) % 3
         self.coding_region = self.oriented_input[self.coding_start:self.coding_end + 1]
-        translated_seq = Seq(self.coding_region, generic_dna).translate()
+        translated_seq = translate(self.coding_region)
         self.log('READING FRAME OFFSET:', self.v_rf_offset)
         self.log('CODING START:', self.coding_start)
         self.log('CODING END:', self.coding_end)
         self.log('CODING REGION:', self.coding_region)
-        return str(translated_seq)
+        return translated_seq
 
 
     def _gapped_vdj_germ_nt(self):
@@ -287,8 +292,7 @@ class Antibody(LoggingMixin):
     def _vdj_germ_aa(self):
         'Returns the germline amino acid sequence of the VDJ region.'
         trim = len(self.vdj_germ_nt) - (len(self.vdj_germ_nt[self.v_rf_offset:]) % 3)
-        translated_seq = Seq(self.vdj_germ_nt[self.v_rf_offset:trim], generic_dna).translate()
-        return str(translated_seq)
+        return translate(self.vdj_germ_nt[self.v_rf_offset:trim])
 
 
     def _parse_uid(self, uid):
@@ -26,11 +26,10 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import math
 import os
+from collections import namedtuple
 import traceback
 
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.Alphabet import generic_dna
+import numpy as np
 
 from abutils.core.sequence import Sequence
 from abutils.utils.alignment import global_alignment, local_alignment
@@ -38,6 +37,16 @@ from abutils.utils.codons import codon_lookup
 from abutils.utils.decorators import lazy_property
 
 from ..utils.mixins import LoggingMixin
+from ..utils.translation import translate
+
+
+# Alternate (lower scoring) germline assignments only need a name and a score,
+# so they're stored as lightweight tuples rather than full GermlineSegment objects.
+GermlineHit = namedtuple('GermlineHit', ['full', 'assigner_score'])
+
+# Germline database files are parsed once per process and cached,
+# keyed by (germline database file path).
+_GERMLINE_CACHE = {}
 
 
 class GermlineSegment(LoggingMixin):
@@ -61,13 +70,25 @@ class GermlineSegment(LoggingMixin):
             or ``'-'`` for the negative strand (query sequence is the reverse complement of
             the germline gene). Optional.
 
-        others (list(Germline)): An optional list of additional high scoring germline genes.
-            Can be a list of arbitrary length, with each member of the list being another
-            ``Germline`` instance.
+        others (list(GermlineHit)): An optional list of additional high scoring germline genes.
+            Can be a list of arbitrary length, with each member of the list being a
+            ``GermlineHit`` (a ``(full, assigner_score)`` tuple).
 
         assigner_name (str): The assigner name. Will be converted to lowercase. Optional.
             If not provided, ``assigner_name`` will be set to ``'unknown'``.
     """
+    __slots__ = ('full', 'species', 'assigner_score', 'strand', 'others', 'gene_type', 'assigner',
+                 '_family', '_gene', '_chain', 'query_start', 'query_end', 'germline_start',
+                 'germline_end', 'score', 'realignment', 'raw_query', 'raw_germline',
+                 'query_alignment', 'germline_alignment', 'alignment_midline', 'alignment_length',
+                 'alignment_reading_frame', 'imgt_germline', 'imgt_gapped_alignment',
+                 'imgt_nt_positions', 'imgt_aa_positions', '_imgt_position_from_raw',
+                 '_raw_position_from_imgt', '_correct_imgt_nt_position_from_imgt',
+                 '_correct_imgt_aa_position_from_imgt', 'fs_indel_adjustment',
+                 'nfs_indel_adjustment', 'has_insertion', 'has_deletion', '_insertions',
+                 '_deletions', 'coding_region', 'aa_sequence', 'regions', 'nt_mutations',
+                 'nt_identity', 'aa_mutations', 'aa_identity')
+
     def __init__(self, full, species, score=None, strand=None, others=None, assigner_name=None):
         super(GermlineSegment, self).__init__()
         LoggingMixin.__init__(self)
@@ -121,8 +142,10 @@ class GermlineSegment(LoggingMixin):
         self.imgt_gapped_alignment = None
         self.imgt_nt_positions = []
         self.imgt_aa_positions = []
-        self._imgt_position_from_raw = {}
-        self._raw_position_from_imgt = {}
+        # dense position maps, indexed by raw (or IMGT) position, with -1
+        # indicating that there isn't an equivalent position
+        self._imgt_position_from_raw = np.zeros(0, dtype=np.int64)
+        self._raw_position_from_imgt = np.zeros(0, dtype=np.int64)
         self._correct_imgt_nt_position_from_imgt = None
         self._correct_imgt_aa_position_from_imgt = None
         self.fs_indel_adjustment = 0
@@ -134,6 +157,10 @@ class GermlineSegment(LoggingMixin):
         self.coding_region = None
         self.aa_sequence = None
         self.regions = None
+        self.nt_mutations = None
+        self.nt_identity = None
+        self.aa_mutations = None
+        self.aa_identity = None
 
 
     @property
@@ -294,11 +321,64 @@ class GermlineSegment(LoggingMixin):
         return matrix
 
     def get_imgt_position_from_raw(self, raw):
-        return self._imgt_position_from_raw.get(raw, None)
+        return self._lookup_position(self._imgt_position_from_raw, raw)
 
 
     def get_raw_position_from_imgt(self, imgt):
-        return self._raw_position_from_imgt.get(imgt, None)
+        return self._lookup_position(self._raw_position_from_imgt, imgt)
+
+
+    def get_imgt_positions_from_raw(self, raw_positions):
+        '''
+        Vectorized version of ``get_imgt_position_from_raw()``.
+
+        Args:
+        -----
+
+            raw_positions (np.ndarray): Array of raw (oriented_input) positions.
+
+        Returns:
+        --------
+
+            np.ndarray: IMGT positions, with -1 for raw positions that don't have an
+                equivalent IMGT position.
+        '''
+        return self._lookup_positions(self._imgt_position_from_raw, raw_positions)
+
+
+    def get_raw_positions_from_imgt(self, imgt_positions):
+        '''
+        Vectorized version of ``get_raw_position_from_imgt()``.
+
+        Args:
+        -----
+
+            imgt_positions (np.ndarray): Array of IMGT positions.
+
+        Returns:
+        --------
+
+            np.ndarray: Raw (oriented_input) positions, with -1 for IMGT positions that
+                don't have an equivalent raw position.
+        '''
+        return self._lookup_positions(self._raw_position_from_imgt, imgt_positions)
+
+
+    @staticmethod
+    def _lookup_position(position_map, position):
+        if position is None or position < 0 or position >= len(position_map):
+            return None
+        mapped = position_map[position]
+        return int(mapped) if mapped >= 0 else None
+
+
+    @staticmethod
+    def _lookup_positions(position_map, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        in_range = (positions >= 0) & (positions < len(position_map))
+        mapped = np.full(positions.shape, -1, dtype=np.int64)
+        mapped[in_range] = position_map[positions[in_range]]
+        return mapped
 
 
     def _process_realignment(self, antibody, aln, query_start):
@@ -333,14 +413,10 @@ class GermlineSegment(LoggingMixin):
         '''
         # mod_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         # db_file = os.path.join(mod_dir, 'assigners/germline_dbs/{}_{}.fasta'.format(self.species.lower(), self.gene_type))
-        germ_dir = get_germline_database_directory(self.species)
-        db_file = os.path.join(germ_dir, 'ungapped/{}.fasta'.format(self.gene_type.lower()))
         try:
-            for s in SeqIO.parse(open(db_file), 'fasta'):
-                if s.id == self.full:
-                    return str(s.seq)
+            germs = get_ungapped_germlines(self.species, self.gene_type)
             # TODO: log that the germline gene wasn't found in the database file
-            return None
+            return germs.get(self.full, None)
         except:
             # TODO: log that the germline database file couldn't be found
             return None
@@ -351,8 +427,6 @@ class GermlineSegment(LoggingMixin):
         aln_pos = 0
         imgt_start = self.imgt_gapped_alignment.target_begin + 1
         imgt_pos = imgt_start
-        raw_position_from_imgt = {}
-        imgt_position_from_raw = {}
 
         # imgt_start_offset is for J-genes only. Since the first position of the gapped IMGT
         # V-gene is the first position of the antibody seqeunce, IMGT numbering of the
@@ -360,6 +434,12 @@ class GermlineSegment(LoggingMixin):
         # When processing V-genes, imgt_start_offset will always be 0.
         imgt_start_offset = self._get_imgt_start_offset()
 
+        # positions are collected in lists (which are much faster to update one element
+        # at a time than arrays) and converted to dense arrays once numbering is complete.
+        # -1 indicates that there's no equivalent position.
+        raw_position_from_imgt = [-1] * (len(self.imgt_germline.gapped_nt_sequence) + imgt_start_offset + 1)
+        imgt_position_from_raw = [-1] * (aln_start + len(self.germline_alignment) + 1)
+
         # Because we're iterating over the alignment but also want to track the raw (oriented_input)
         # query position, we need to adjust the alignment numbering in case there's a deletion
         # in the query sequence. With a deletion, the alignment position increases, but the raw
@@ -388,14 +468,14 @@ class GermlineSegment(LoggingMixin):
             # If the gapped IMGT germline is '.' (indicating a gap introduced by IMGT for numbering purposes),
             # we only need to increment the IMGT position and indicate the lack of sequence at the IMGT position.
             if gl == '.':
-                raw_position_from_imgt[imgt_pos + imgt_start_offset] = None
+                raw_position_from_imgt[imgt_pos + imgt_start_offset] = -1
                 imgt_pos += 1
                 continue
 
             # If there's a gap in the query alignment (deletion in the query sequence)
             # there's no equivalent IMGT position in the query.
             if self.query_alignment[aln_pos] == '-':
-                raw_position_from_imgt[imgt_pos + imgt_start_offset] = None
+                raw_position_from_imgt[imgt_pos + imgt_start_offset] = -1
                 aln_pos += 1
                 imgt_pos += 1
                 query_del_adjustment += 1
@@ -409,7 +489,7 @@ class GermlineSegment(LoggingMixin):
             if self.germline_alignment[aln_pos] == '-':
                 self.log('INFO: Found an insertion in the query sequence!')
                 while self.germline_alignment[aln_pos] == '-':
-                    imgt_position_from_raw[aln_pos + self.query_start - query_del_adjustment] = None
+                    imgt_position_from_raw[aln_pos + self.query_start - query_del_adjustment] = -1
                     self.imgt_nt_positions.append(None)
                     aln_pos += 1
 
@@ -423,8 +503,8 @@ class GermlineSegment(LoggingMixin):
             imgt_pos += 1
             if aln_pos >= len(self.germline_alignment):
                 break
-        self._raw_position_from_imgt = raw_position_from_imgt
-        self._imgt_position_from_raw = imgt_position_from_raw
+        self._raw_position_from_imgt = np.array(raw_position_from_imgt, dtype=np.int64)
+        self._imgt_position_from_raw = np.array(imgt_position_from_raw, dtype=np.int64)
         if self.insertions or self.deletions:
             self._calculate_imgt_indel_positions()
 
@@ -452,7 +532,7 @@ class GermlineSegment(LoggingMixin):
 
 
     def _get_aa_sequence(self):
-        return Seq(self.coding_region, generic_dna).translate()
+        return translate(self.coding_region)
 
 
     def _fix_ambigs(self, antibody):
@@ -492,24 +572,26 @@ class GermlineSegment(LoggingMixin):
 
 
     def _calculate_imgt_indel_positions(self):
-        if self.insertions:
-            for i in self.insertions:
-                # since there's possibly not a direct IMGT correlate to the position
-                # at the start of the insertion, need to find the closest IMGT correlate
-                raw_pos = i.raw_position
-                while self.get_imgt_position_from_raw(raw_pos) is None:
-                    raw_pos -= 1
-                i.imgt_position = self.get_imgt_position_from_raw(raw_pos)
-                i.imgt_codon = int(math.ceil(i.imgt_position / 3.0))
-        if self.deletions:
-            for d in self.deletions:
-                # since there's possibly not a direct IMGT correlate to the position
-                # at the start of the deletion, need to find the closest IMGT correlate
-                raw_pos = d.raw_position
-                while self.get_imgt_position_from_raw(raw_pos) is None:
-                    raw_pos -= 1
-                d.imgt_position = self.get_imgt_position_from_raw(raw_pos)
-                d.imgt_codon = int(math.ceil(d.imgt_position / 3.0))
+        # since there's possibly not a direct IMGT correlate to the position
+        # at the start of an indel, need to find the closest IMGT correlate
+        for indel in (self.insertions or []) + (self.deletions or []):
+            imgt_pos = self._closest_imgt_position_from_raw(indel.raw_position)
+            if imgt_pos is None:
+                continue
+            indel.imgt_position = imgt_pos
+            indel.imgt_codon = int(math.ceil(imgt_pos / 3.0))
+
+
+    def _closest_imgt_position_from_raw(self, raw):
+        '''
+        Returns the IMGT position of the closest numbered raw position at or before
+        ``raw``, or ``None`` if there aren't any numbered positions at or before ``raw``.
+        '''
+        preceding = self._imgt_position_from_raw[:raw + 1]
+        numbered = np.flatnonzero(preceding >= 0)
+        if numbered.size == 0:
+            return None
+        return int(preceding[numbered[-1]])
 
 
     @staticmethod
@@ -550,6 +632,57 @@ def get_germline_database_directory(species):
     return os.path.join(mod_dir, 'assigners/germline_dbs/{}'.format(species.lower()))
 
 
+def get_ungapped_germline_sequences(species, gene_type):
+    '''
+    Returns a list of abutils ``Sequence`` objects, one for each ungapped germline gene
+    in the germline database. The germline database file is only parsed once per process.
+
+    Args:
+    -----
+
+        species (str): Species for which the germline genes should be obtained.
+
+        gene_type (str): Options are 'V', 'D', and 'J'.
+    '''
+    germ_dir = get_germline_database_directory(species)
+    db_file = os.path.join(germ_dir, 'ungapped/{}.fasta'.format(gene_type.lower()))
+    if db_file not in _GERMLINE_CACHE:
+        from Bio import SeqIO
+        with open(db_file, 'r') as f:
+            _GERMLINE_CACHE[db_file] = [Sequence(s) for s in SeqIO.parse(f, 'fasta')]
+    return list(_GERMLINE_CACHE[db_file])
+
+
+def get_ungapped_germlines(species, gene_type):
+    '''
+    Returns a dict mapping germline gene names (like IGHV1-2*02) to ungapped germline
+    sequences (as strings). If a gene name is present more than once in the germline
+    database, the first sequence is used.
+    '''
+    germ_dir = get_germline_database_directory(species)
+    key = os.path.join(germ_dir, 'ungapped/{}.fasta:names'.format(gene_type.lower()))
+    if key not in _GERMLINE_CACHE:
+        germs = {}
+        for s in get_ungapped_germline_sequences(species, gene_type):
+            if s.id not in germs:
+                germs[s.id] = s.sequence
+        _GERMLINE_CACHE[key] = germs
+    return _GERMLINE_CACHE[key]
+
+
+def preload_germlines(species):
+    '''
+    Parses all germline database files for ``species`` into the per-process germline
+    cache, so that the first annotated sequence doesn't pay the cost of loading them.
+    '''
+    for gene_type in ['V', 'D', 'J']:
+        try:
+            get_ungapped_germlines(species, gene_type)
+            get_imgt_germlines(species, gene_type)
+        except:
+            continue
+
+
 def get_imgt_germlines(species, gene_type, gene=None):
     '''
     Returns one or more IMGTGermlineGene objects that each contain a single IMGT-gapped germline gene.
@@ -578,7 +711,11 @@ def get_imgt_germlines(species, gene_type, gene=None):
     germ_dir = get_germline_database_directory(species)
     db_file = os.path.join(germ_dir, 'imgt_gapped/{}.fasta'.format(gene_type.lower()))
     try:
-        germs = [IMGTGermlineGene(g) for g in SeqIO.parse(open(db_file, 'r'), 'fasta')]
+        if db_file not in _GERMLINE_CACHE:
+            from Bio import SeqIO
+            with open(db_file, 'r') as f:
+                _GERMLINE_CACHE[db_file] = [IMGTGermlineGene(g) for g in SeqIO.parse(f, 'fasta')]
+        germs = list(_GERMLINE_CACHE[db_file])
     except:
         # TODO: log that the germline database file couldn't be found
 
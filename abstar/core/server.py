@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+# filename: server.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+'''
+Long-lived local annotation server.
+
+Start the server with ``abstar serve``. The server keeps a pool of worker processes (with
+germline databases already loaded) running, and groups concurrent requests into batches
+so that each batch requires only a single pair of BLASTn searches. Sequences can then be
+annotated with ``abstar.run_remote()``, which mirrors ``abstar.run()``.
+'''
+
+
+from argparse import ArgumentParser
+import collections
+import functools
+import json
+from multiprocessing import cpu_count, Pool
+import os
+import sys
+import threading
+import time
+import traceback
+
+from abutils.core.sequence import Sequence
+
+from .abstar import Args, _process_sequence_chunk
+from .germline import get_germline_database_directory
+from ..utils.arena import GermlineArena, attach_arena
+
+if sys.version_info[0] > 2:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.request import Request, urlopen
+    import queue
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib2 import Request, urlopen
+    import Queue as queue
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# runtime options that can be set by individual requests
+REQUEST_OPTIONS = ['species', 'assigner', 'uid', 'isotype', 'cache', 'cache_dir', 'cache_size',
+                   'prefilter', 'prefilter_min_kmers', 'assigner_options']
+
+
+
+#####################################################################
+#
+#                             SERVER
+#
+#####################################################################
+
+
+
+def request_options(options):
+    '''
+    Returns the subset of ``options`` that can be set by individual requests.
+    '''
+    return dict([(k, v) for k, v in options.items() if k in REQUEST_OPTIONS])
+
+
+
+class AnnotationRequest(object):
+    """
+    A single client request, waiting to be annotated as part of a batch.
+    """
+    def __init__(self, sequences, options):
+        super(AnnotationRequest, self).__init__()
+        self.sequences = sequences
+        self.options = options
+        self.results = []
+        self.remaining = 0
+        self.error = None
+        self.done = threading.Event()
+
+
+    @property
+    def batch_key(self):
+        '''
+        Requests can only be batched together if they use the same runtime options.
+        '''
+        return tuple(sorted([(k, tuple(v) if isinstance(v, list) else v) for k, v in self.options.items()]))
+
+
+
+class AnnotationServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP annotation server.
+
+    Args:
+    -----
+
+        host (str): Host address. Default is ``127.0.0.1``, so that the server is only
+            accessible from the local machine.
+
+        port (int): Port. Default is 8765.
+
+        processes (int): Number of worker processes. Default is the number of available CPUs.
+
+        batch_window (float): Maximum time (in milliseconds) to wait for additional
+            requests before starting a batch. Default is 10.
+
+        batch_size (int): Maximum number of sequences in a single batch. Default is 500.
+
+        species (list): Germline databases for these species are loaded once, when the
+            server starts, and shared with the worker processes. Default is ``['human']``.
+
+        temp (str): Temp directory. Default is ``/tmp``.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, processes=None, batch_window=10,
+                 batch_size=500, species=None, temp=None):
+        HTTPServer.__init__(self, (host, port), AnnotationRequestHandler)
+        self.processes = processes if processes is not None else cpu_count()
+        self.batch_window = batch_window / 1000.
+        self.batch_size = batch_size
+        self.species = species if species is not None else ['human', ]
+        self.temp = temp if temp is not None else '/tmp'
+        self.arena = GermlineArena(self.species, isotype=True)
+        self.pool = Pool(processes=self.processes,
+                         initializer=attach_arena,
+                         initargs=(self.arena.descriptor, ))
+        self.requests = queue.Queue()
+        self.batcher = threading.Thread(target=self._batch_requests)
+        self.batcher.daemon = True
+        self.batcher.start()
+
+
+    def annotate(self, sequences, options, timeout=None):
+        '''
+        Queues sequences for annotation and waits for the results.
+
+        Args:
+        -----
+
+            sequences (list): A list of ``[seq_id, sequence]`` pairs.
+
+            options (dict): Runtime options. Only options in ``REQUEST_OPTIONS`` are used.
+
+            timeout (float): Maximum time to wait, in seconds. Default is ``None``,
+                which waits indefinitely.
+
+        Returns:
+        --------
+
+            list: Annotation results (dicts).
+
+        Raises:
+        -------
+
+            RuntimeError: If any part of the request failed, or if ``timeout`` was exceeded.
+        '''
+        options = request_options(options)
+        request = AnnotationRequest(sequences, options)
+        if not sequences:
+            return []
+        self.requests.put(request)
+        if not request.done.wait(timeout):
+            raise RuntimeError('Annotation timed out after {} seconds'.format(timeout))
+        if request.error is not None:
+            raise RuntimeError('Annotation failed: {}'.format(request.error))
+        return request.results
+
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        self.pool.terminate()
+        self.pool.join()
+        self.arena.release()
+
+
+    def _batch_requests(self):
+        '''
+        Collects requests until either the batch window has elapsed or the batch is full,
+        then dispatches the batched sequences to the worker pool.
+        '''
+        while True:
+            batch = [self.requests.get(), ]
+            batch_count = len(batch[0].sequences)
+            deadline = time.time() + self.batch_window
+            while batch_count < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                batch_count += len(request.sequences)
+            groups = collections.OrderedDict()
+            for request in batch:
+                groups.setdefault(request.batch_key, []).append(request)
+            for requests in groups.values():
+                # a batch that can't be dispatched fails its own requests, but
+                # must not stop the batcher thread
+                try:
+                    self._dispatch(requests)
+                except Exception as e:
+                    self._fail(requests, e)
+
+
+    def request_args(self, options):
+        '''
+        Builds runtime arguments for a request.
+
+        Args:
+        -----
+
+            options (dict): Runtime options. Only options in ``REQUEST_OPTIONS`` are used.
+
+        Returns:
+        --------
+
+            Args: runtime arguments for ``_process_sequence_chunk()``.
+
+        Raises:
+        -------
+
+            TypeError, ValueError: If any of the options are invalid.
+        '''
+        args = Args(temp=self.temp, **request_options(options))
+        args.output_type = ['json', ]
+        args.raw = True
+        args.padding = False
+        return args
+
+
+    def _dispatch(self, requests):
+        # sequence IDs from different requests may collide, so each sequence is
+        # renamed with its request and sequence index and the IDs are restored later
+        sequences = []
+        for r, request in enumerate(requests):
+            for s, (seq_id, seq) in enumerate(request.sequences):
+                sequences.append(['{}:{}'.format(r, s), seq])
+        # a single request can be larger than batch_size, so the batch may need to be split
+        chunks = [sequences[i:i + self.batch_size] for i in range(0, len(sequences), self.batch_size)]
+        args = self.request_args(requests[0].options)
+        for request in requests:
+            request.remaining = len(chunks)
+        for chunk in chunks:
+            self.pool.apply_async(_process_sequence_chunk,
+                                  (chunk, vars(args)),
+                                  callback=functools.partial(self._complete, requests),
+                                  error_callback=functools.partial(self._fail, requests))
+
+
+    def _complete(self, requests, results):
+        for result in results:
+            r, s = [int(i) for i in result['seq_id'].split(':')]
+            request = requests[r]
+            result['seq_id'] = request.sequences[s][0]
+            request.results.append(result)
+        for request in requests:
+            request.remaining -= 1
+            if request.remaining <= 0:
+                request.done.set()
+
+
+    def _fail(self, requests, error):
+        # a failed chunk fails every request in the batch, rather than returning partial results
+        for request in requests:
+            request.remaining -= 1
+            request.error = repr(error)
+            request.done.set()
+
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles HTTP requests.
+
+    ``POST /annotate`` accepts a JSON object containing ``sequences`` (a list of
+    ``[seq_id, sequence]`` pairs) and ``options`` (a dict of runtime options), and returns
+    a JSON list of annotations.
+
+    ``GET /status`` returns basic information about the server.
+    """
+    def do_GET(self):
+        if self.path.rstrip('/') != '/status':
+            self.send_error(404)
+            return
+        self._send_json({'processes': self.server.processes,
+                         'species': self.server.species,
+                         'queued': self.server.requests.qsize()})
+
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/annotate':
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+            sequences = [[str(s[0]), str(s[1])] for s in body.get('sequences', [])]
+            options = request_options(body.get('options', {}))
+        except:
+            self.send_error(400, 'Invalid request')
+            return
+        # invalid options are a client error, and are caught here rather than
+        # when the batch is dispatched
+        try:
+            self.server.request_args(options)
+        except (TypeError, ValueError) as e:
+            self.send_error(400, 'Invalid options: {}'.format(e))
+            return
+        species = options.get('species', 'human')
+        if not os.path.isdir(get_germline_database_directory(species)):
+            self.send_error(400, 'A germline database was not found for species: {}'.format(species))
+            return
+        try:
+            results = self.server.annotate(sequences, options)
+        except:
+            self.send_error(500, traceback.format_exc().splitlines()[-1])
+            return
+        self._send_json(results)
+
+
+    def log_message(self, format, *args):
+        # don't log every request
+        pass
+
+
+    def _send_json(self, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+#####################################################################
+#
+#                             CLIENT
+#
+#####################################################################
+
+
+
+def run_remote(*sequences, **kwargs):
+    '''
+    Annotates sequences using a running AbStar server (started with ``abstar serve``).
+
+    Input sequences can be provided in the same formats as ``abstar.run()``: individual
+    sequences as positional arguments, or a list of sequences as a single argument.
+
+    Examples:
+
+        Annotating a single sequence::
+
+            import abstar
+
+            result = abstar.run_remote(['seq1', 'ATGC'])
+
+
+    Args:
+
+        host (str): Server host. Default is ``127.0.0.1``.
+
+        port (int): Server port. Default is 8765.
+
+        timeout (float): Maximum time to wait for results, in seconds. Default is ``None``,
+            which waits indefinitely.
+
+        species (str): Species of the antibody sequences. Default is 'human'.
+
+        uid (int): Length (in nucleotides) of the Unique Molecular ID. Default is 0.
+
+        assigner (str): Germline assigner. Default is 'blastn'.
+
+        cache (bool): If ``True``, the server's annotation cache will be used. Default is ``False``.
+
+
+    Returns:
+
+        If the input is a single sequence, ``run_remote`` returns a single AbTools ``Sequence``
+        object (or ``None``, if the sequence couldn't be annotated).
+
+        If the input is a list of sequences, ``run_remote`` returns a list of AbTools ``Sequence`` objects.
+    '''
+    host = kwargs.pop('host', DEFAULT_HOST)
+    port = kwargs.pop('port', DEFAULT_PORT)
+    timeout = kwargs.pop('timeout', None)
+    single = False
+    if len(sequences) == 1:
+        try:
+            sequences = [Sequence(sequences[0]), ]
+            single = True
+        except:
+            sequences = [Sequence(s) for s in sequences[0]]
+    else:
+        sequences = [Sequence(s) for s in sequences]
+    payload = json.dumps({'sequences': [[s.id, s.sequence] for s in sequences],
+                          'options': kwargs}).encode('utf-8')
+    request = Request('http://{}:{}/annotate'.format(host, port),
+                      data=payload,
+                      headers={'Content-Type': 'application/json'})
+    response = urlopen(request, timeout=timeout)
+    processed = json.loads(response.read().decode('utf-8'),
+                           object_pairs_hook=collections.OrderedDict)
+    results = [Sequence(dict(p)) for p in processed]
+    if single:
+        return results[0] if results else None
+    return results
+
+
+
+#####################################################################
+#
+#                              MAIN
+#
+#####################################################################
+
+
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser("Runs a local AbStar annotation server.")
+    parser.add_argument('--host', dest='host', default=DEFAULT_HOST,
+                        help="Host address. Default is '127.0.0.1'.")
+    parser.add_argument('--port', dest='port', default=DEFAULT_PORT, type=int,
+                        help="Port. Default is 8765.")
+    parser.add_argument('-n', '--processes', dest='processes', default=None, type=int,
+                        help="Number of worker processes. Default is the number of available CPUs.")
+    parser.add_argument('--batch-window', dest='batch_window', default=10, type=float,
+                        help="Maximum time (in milliseconds) to wait for additional requests \
+                        before starting a batch. Default is 10.")
+    parser.add_argument('--batch-size', dest='batch_size', default=500, type=int,
+                        help="Maximum number of sequences in a single batch. Default is 500.")
+    parser.add_argument('-s', '--species', dest='species', default=['human', ], nargs='+',
+                        help="Germline databases for these species will be pre-loaded. \
+                        Requests for other species are still supported. Default is 'human'.")
+    parser.add_argument('-t', '--temp', dest='temp', default='/tmp',
+                        help="Temp directory. Default is '/tmp'.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    server = AnnotationServer(host=args.host,
+                              port=args.port,
+                              processes=args.processes,
+                              batch_window=args.batch_window,
+                              batch_size=args.batch_size,
+                              species=args.species,
+                              temp=args.temp)
+    print('AbStar server listening on {}:{} ({} worker processes)'.format(args.host,
+                                                                        args.port,
+                                                                        server.processes))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.terminate()
+        server.pool.join()
+        server.arena.release()
@@ -52,6 +52,8 @@ class VDJ(LoggingMixin):
         j (Germline): an AbStar Germline object representing the assigned Joining gene
 
     """
+    __slots__ = ('sequence', 'id', 'oriented', 'v', 'd', 'j', 'umi_count')
+
     def __init__(self, sequence, v=None, d=None, j=None):
         super(VDJ, self).__init__()
         LoggingMixin.__init__(self)
@@ -61,6 +63,7 @@ class VDJ(LoggingMixin):
         self.v = v
         self.d = d
         self.j = j
+        self.umi_count = None
         self.initialize_log()
 
 
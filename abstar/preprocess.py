@@ -29,8 +29,6 @@ import os
 from subprocess import Popen, PIPE
 import sys
 
-from Bio import SeqIO
-
 from .utils.pandaseq import pair_files
 
 from abutils.utils.log import get_logger
@@ -234,6 +232,7 @@ def adapter_trim(input_directory, output_directory=None,
     make_dir(output_directory)
     files = list_files(input_directory)
     # parse adapter FASTA files, compile adapter option list
+    from Bio import SeqIO
     adapters = []
     opts = ['-g', '-a', '-b']
     adapt_files = [adapter_5prime, adapter_3prime, adapter_both]
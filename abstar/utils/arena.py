@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# filename: arena.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gc
+import logging
+import traceback
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: worker processes use the fork-inherited copy of the germline data
+    shared_memory = None
+
+from ..core.germline import preload_germlines
+from .isotype import get_isotype_sequences
+from .prefilter import DEFAULT_KMER_SIZE, get_kmer_index
+
+
+# array offsets in the shared memory block are aligned to 64 bytes (one cache line)
+ALIGNMENT = 64
+
+# shared memory blocks that a worker process has attached to. References are kept
+# for the life of the worker, since cached indexes use the block's buffer
+_ATTACHED = []
+
+
+class GermlineArena(object):
+    '''
+    Read-only germline data that is loaded once, in the parent process, and shared with
+    all of the worker processes in a ``multiprocessing`` pool.
+
+    The germline sequences, IMGT-gapped germlines and isotype references (and k-mer indexes
+    used by the prefilter and assigners) are loaded into the parent's per-process caches before
+    the pool is started. Forked workers (including the replacement workers started when
+    a worker reaches ``maxtasksperchild``) inherit the populated caches and never re-parse
+    the germline database. Numpy arrays aren't modified after they're built, so the index
+    data stays in copy-on-write pages that are shared by all workers, and the garbage collector
+    is frozen so that collections in the workers don't touch the inherited Python objects.
+
+    When workers are started with ``spawn`` or ``forkserver`` (and nothing is inherited), the
+    index arrays are also packed into a single ``multiprocessing.shared_memory`` block (Python 3.8+),
+    and workers attach to it with ``attach_arena()`` instead of re-building the indexes.
+
+    Args:
+    -----
+
+        species (str): Species, or a list of species, for which germline data should be loaded.
+
+        assigner (str): Name of the germline assigner. Seed indexes are only built for ``'cascade'``.
+
+        isotype (bool): If ``True``, isotype reference sequences are also loaded.
+
+        k (int): k-mer size of the ``cascade`` assigner's indexes. Default is 13.
+    '''
+    def __init__(self, species, assigner='blastn', isotype=False, k=DEFAULT_KMER_SIZE):
+        super(GermlineArena, self).__init__()
+        self.species = list(species) if isinstance(species, (list, tuple)) else [species, ]
+        self.assigner = assigner
+        self.isotype = isotype
+        self.k = int(k)
+        self.size = 0
+        self._shm = None
+        self._entries = []
+        for s in self.species:
+            self._load(s)
+        self._pack()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+    @property
+    def descriptor(self):
+        '''
+        Everything a worker process needs to attach to the arena (see ``attach_arena()``).
+        '''
+        return {'name': self._shm.name if self._shm is not None else None,
+                'entries': self._entries}
+
+
+    def release(self):
+        '''
+        Frees the shared memory block. Should be called once the worker pool has been joined.
+        '''
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+
+
+    def _load(self, species):
+        preload_germlines(species)
+        if self.isotype:
+            try:
+                get_isotype_sequences(species)
+            except:
+                logging.debug('ARENA: no isotype references for {}'.format(species))
+        try:
+            self._add('kmer', get_kmer_index(species))
+            if self.assigner == 'cascade':
+                from ..assigners.cascade import get_seed_index
+                self._add('kmer', get_kmer_index(species, self.k))
+                for gene_type in ['V', 'J']:
+                    self._add('seed', get_seed_index(species, gene_type, self.k))
+        except:
+            # workers will build (or fail to build) their own indexes
+            logging.debug('ARENA ERROR: {}\n{}'.format(species, traceback.format_exc()))
+
+
+    def _add(self, cache, index):
+        key = _cache_key(cache, index)
+        if any([e['cache'] == cache and e['key'] == key for e in self._entries]):
+            return
+        arrays = dict([(a, getattr(index, a)) for a in index.SHARED_ARRAYS])
+        state = dict([(a, v) for a, v in index.__dict__.items() if a not in arrays])
+        self._entries.append({'cache': cache,
+                              'key': key,
+                              'cls': type(index),
+                              'state': state,
+                              'arrays': arrays})
+
+
+    def _pack(self):
+        offset = 0
+        for entry in self._entries:
+            layout = {}
+            for attr, array in entry['arrays'].items():
+                array = np.ascontiguousarray(array)
+                offset = -(-offset // ALIGNMENT) * ALIGNMENT
+                layout[attr] = (offset, array.dtype.str, array.shape)
+                offset += array.nbytes
+            entry['layout'] = layout
+        self.size = offset
+        if shared_memory is None or not self._entries:
+            for entry in self._entries:
+                del entry['arrays']
+            return
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.size))
+        for entry in self._entries:
+            arrays = entry.pop('arrays')
+            for attr, (offset, dtype, shape) in entry['layout'].items():
+                view = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+                view[...] = arrays[attr]
+                del view
+
+
+
+def create_arena(args):
+    '''
+    Builds a ``GermlineArena`` using the species, assigner and isotype settings in ``args``.
+    '''
+    from ..core.abstar import get_germline_assigner_name, parse_assigner_options
+    options = parse_assigner_options(args.assigner_options)
+    return GermlineArena(args.species,
+                         assigner=get_germline_assigner_name(args),
+                         isotype=bool(args.isotype),
+                         k=options.get('k', DEFAULT_KMER_SIZE))
+
+
+def attach_arena(descriptor):
+    '''
+    Worker process initializer. Indexes that are already cached (because the worker was
+    forked from the parent process that built the arena) are used as-is. Otherwise, the
+    indexes are re-assembled from the arena's shared memory block without copying.
+    '''
+    caches = _caches()
+    missing = [e for e in descriptor['entries'] if e['key'] not in caches[e['cache']]]
+    if not missing or descriptor['name'] is None:
+        return
+    try:
+        shm = shared_memory.SharedMemory(name=descriptor['name'])
+    except:
+        logging.debug('ARENA ERROR: could not attach to {}\n{}'.format(descriptor['name'],
+                                                                       traceback.format_exc()))
+        return
+    _ATTACHED.append(shm)
+    for entry in missing:
+        index = entry['cls'].__new__(entry['cls'])
+        index.__dict__.update(entry['state'])
+        for attr, (offset, dtype, shape) in entry['layout'].items():
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            setattr(index, attr, array)
+        caches[entry['cache']][entry['key']] = index
+
+
+def _caches():
+    from ..assigners import cascade
+    from . import prefilter
+    return {'kmer': prefilter._KMER_INDEXES,
+            'seed': cascade._SEED_INDEXES}
+
+
+def _cache_key(cache, index):
+    if cache == 'seed':
+        return (index.species.lower(), index.gene_type.upper(), index.k)
+    return (index.species.lower(), index.k)
@@ -30,6 +30,7 @@ import platform
 import shutil
 import subprocess as sp
 import sys
+import tempfile
 
 from Bio import SeqIO
 
@@ -153,22 +154,50 @@ def make_db_directories(addon_dir, species, isotypes):
 # -------------------------
 
 
-def make_blast_db(ungapped_germline_file, addon_directory, segment, species):
-    print('  - BLASTn')
+def make_blast_db(ungapped_germline_file, addon_directory, segment, species, db_name=None):
+    if db_name is None:
+        print('  - BLASTn')
+        db_name = segment.lower()
     bin_dir = get_binary_directory()
     mbd_binary = os.path.join(bin_dir, 'makeblastdb_{}'.format(platform.system().lower()))
-    mbd_output = os.path.join(addon_directory, '{}/blast/{}'.format(species.lower(), segment.lower()))
-    mbd_log = os.path.join(addon_directory, '{}/blast/{}.blastlog'.format(species.lower(), segment.lower()))
+    mbd_output = os.path.join(addon_directory, '{}/blast/{}'.format(species.lower(), db_name))
+    mbd_log = os.path.join(addon_directory, '{}/blast/{}.blastlog'.format(species.lower(), db_name))
     mbd_cmd = '{} -in {} -out {} -parse_seqids -dbtype nucl -title {} -logfile {}'.format(mbd_binary,
                                                                                           ungapped_germline_file,
                                                                                           mbd_output,
-                                                                                          segment.lower(),
+                                                                                          db_name,
                                                                                           mbd_log)
     p = sp.Popen(mbd_cmd, stdout=sp.PIPE, stderr=sp.PIPE, shell=True)
     stdout, stderr = p.communicate()
     return mbd_output, stdout, stderr
 
 
+def make_chain_blast_dbs(ungapped_germline_file, addon_directory, segment, species):
+    '''
+    Builds a separate BLASTn database for each chain (named ``{segment}_{chain}``, like
+    ``v_heavy``), so that queries can be searched against only the germline genes
+    of the appropriate chain.
+    '''
+    print('  - BLASTn (by chain)')
+    chains = {'H': 'heavy',
+              'K': 'kappa',
+              'L': 'lambda'}
+    chain_seqs = {}
+    for s in SeqIO.parse(open(ungapped_germline_file), 'fasta'):
+        chain = chains.get(s.id[2:3].upper(), None)
+        if chain is not None:
+            chain_seqs.setdefault(chain, []).append('>{}\n{}'.format(s.id, str(s.seq)))
+    outputs = []
+    for chain in sorted(chain_seqs.keys()):
+        chain_file = tempfile.NamedTemporaryFile(mode='w', suffix='.fasta', delete=False)
+        chain_file.write('\n'.join(chain_seqs[chain]))
+        chain_file.close()
+        db_name = '{}_{}'.format(segment.lower(), chain)
+        outputs.append(make_blast_db(chain_file.name, addon_directory, segment, species, db_name=db_name))
+        os.unlink(chain_file.name)
+    return outputs
+
+
 def make_ungapped_db(ungapped_germline_file, addon_directory, segment, species):
     print('  - ungapped FASTA')
     output_file = os.path.join(addon_directory, '{}/ungapped/{}.fasta'.format(species.lower(), segment.lower()))
@@ -264,6 +293,12 @@ def main():
         if args.debug:
             print(stdout)
             print(stderr)
+        if segment != 'Diversity':
+            for chain_blast_file, stdout, stderr in make_chain_blast_dbs(ungapped_file, addon_dir,
+                                                                         segment[0].lower(), args.species):
+                if args.debug:
+                    print(stdout)
+                    print(stderr)
     if args.isotypes is not None:
         print_segment_info('ISOTYPES', args.isotypes)
         isotype_file = make_isotype_db(args.isotypes, addon_dir, args.species)
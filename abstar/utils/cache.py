@@ -0,0 +1,305 @@
+#!/usr/bin/python
+# filename: cache.py
+
+#
+# Copyright (c) 2016 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from ..core.germline import get_germline_database_directory
+
+
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.abstar/cache')
+
+# maximum cache size, in MB
+DEFAULT_CACHE_SIZE = 2048
+
+# SQLite limits the number of variables in a single query
+QUERY_BATCH_SIZE = 500
+
+# access times of cache hits are updated in batches, so that
+# reads don't each need their own write transaction
+TOUCH_BATCH_SIZE = 5000
+
+_GERMLINE_CHECKSUMS = {}
+
+
+class AnnotationCache(object):
+    '''
+    Persistent cache of annotation results, shared by all AbStar runs on a machine.
+
+    Results are keyed by the input sequence along with everything else that determines the
+    annotation: species, assigner, UID length, whether isotypes were assigned, a checksum of
+    the germline database and the AbStar version. Updating the germline database or AbStar invalidates all prior results
+    for that species. Output formatting options (``pretty``, ``padding``, ``json_keys``) are
+    applied after a result is retrieved, so changing them doesn't invalidate the cache.
+
+    The cache is a single SQLite database in write-ahead-log mode, so it can be read and
+    updated concurrently by multiple worker processes. Once the cache grows beyond
+    ``max_size``, the least recently used results are evicted. Access times of cache hits
+    are recorded in batches (when ``TOUCH_BATCH_SIZE`` hits are pending, when results are
+    added and when the cache is closed), so eviction order is approximate.
+
+    Only JSON-formatted results are cached.
+
+    Args:
+    -----
+
+        species (str): Species of the germline database used for annotation.
+
+        assigner (str): Name of the germline assigner. Default is ``'blastn'``.
+
+        uid (int): UID length. Default is ``0``.
+
+        isotype (bool): Whether isotypes are assigned. Default is ``False``.
+
+        version (str): AbStar version.
+
+        cache_dir (str): Directory in which the cache database is stored. Default is
+            ``~/.abstar/cache``.
+
+        max_size (int): Maximum size of the cache, in MB. Default is 2048.
+    '''
+    def __init__(self, species, assigner='blastn', uid=0, isotype=False, version=None, cache_dir=None, max_size=None):
+        super(AnnotationCache, self).__init__()
+        self.species = species
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+        self.path = os.path.join(self.cache_dir, 'annotations.db')
+        self.max_size = int((max_size if max_size is not None else DEFAULT_CACHE_SIZE) * 1024 * 1024)
+        self.key_prefix = '|'.join([species.lower(),
+                                    assigner.lower(),
+                                    str(uid),
+                                    'isotype' if isotype else 'no_isotype',
+                                    germline_database_checksum(species),
+                                    str(version)])
+        self._conn = None
+        self._touched = {}
+
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            if not os.path.isdir(self.cache_dir):
+                try:
+                    os.makedirs(self.cache_dir)
+                except OSError:
+                    # another process may have created the directory in the meantime
+                    if not os.path.isdir(self.cache_dir):
+                        raise
+            # autocommit mode, so that transactions are explicitly managed
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS annotations
+                            (key TEXT PRIMARY KEY,
+                             value BLOB NOT NULL,
+                             size INTEGER NOT NULL,
+                             accessed REAL NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS annotations_accessed ON annotations (accessed)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS info
+                            (name TEXT PRIMARY KEY,
+                             value INTEGER NOT NULL)''')
+            conn.execute("INSERT OR IGNORE INTO info (name, value) VALUES ('size', 0)")
+            self._conn = conn
+        return self._conn
+
+
+    def key(self, sequence):
+        '''
+        Returns the cache key for a sequence (a ``str``).
+        '''
+        key = '{}|{}'.format(self.key_prefix, sequence)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+    def get(self, sequences):
+        '''
+        Retrieves cached annotations.
+
+        Args:
+        -----
+
+            sequences (list): An iterable of abutils ``Sequence`` objects.
+
+        Returns:
+        --------
+
+            tuple: A list of ``(Sequence, record)`` tuples for sequences with cached results,
+                and a list of ``Sequence`` objects that weren't found in the cache. Records are
+                ``OrderedDict`` objects that contain everything except ``seq_id``. They can
+                be formatted for output with ``abstar.utils.output.format_json_output()``.
+        '''
+        sequences = list(sequences)
+        keys = [self.key(s.sequence) for s in sequences]
+        found = {}
+        try:
+            for i in range(0, len(keys), QUERY_BATCH_SIZE):
+                batch = list(set(keys[i:i + QUERY_BATCH_SIZE]))
+                query = 'SELECT key, value FROM annotations WHERE key IN ({})'.format(','.join('?' * len(batch)))
+                for key, value in self.conn.execute(query, batch):
+                    found[key] = value
+        except sqlite3.Error:
+            logging.debug('ANNOTATION CACHE READ ERROR: {}'.format(self.path))
+            return [], sequences
+        if found:
+            self._touch(list(found.keys()))
+        hits = []
+        misses = []
+        for seq, key in zip(sequences, keys):
+            if key in found:
+                record = json.loads(zlib.decompress(found[key]).decode('utf-8'),
+                                    object_pairs_hook=collections.OrderedDict)
+                hits.append((seq, record))
+            else:
+                misses.append(seq)
+        return hits, misses
+
+
+    def put(self, results):
+        '''
+        Adds annotations to the cache.
+
+        Args:
+        -----
+
+            results (list): An iterable of ``(sequence, record)`` tuples, where ``sequence`` is
+                the raw input sequence (a ``str``) and ``record`` is the raw JSON output for
+                the sequence (as returned by ``AbstarResult.json_record``).
+        '''
+        rows = []
+        for sequence, record in results:
+            record = collections.OrderedDict([(k, v) for k, v in record.items() if k != 'seq_id'])
+            value = zlib.compress(json.dumps(record).encode('utf-8'))
+            rows.append((self.key(sequence), value))
+        if not rows:
+            return
+        now = time.time()
+        try:
+            conn = self.conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                added = 0
+                for key, value in rows:
+                    cursor = conn.execute('INSERT OR IGNORE INTO annotations (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                                          (key, sqlite3.Binary(value), len(value), now))
+                    if cursor.rowcount == 1:
+                        added += len(value)
+                conn.execute("UPDATE info SET value = value + ? WHERE name = 'size'", (added, ))
+                self._flush_touched()
+                self._evict()
+                conn.execute('COMMIT')
+            except:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            logging.debug('ANNOTATION CACHE WRITE ERROR: {}'.format(self.path))
+
+
+    def close(self):
+        if self._conn is not None:
+            if self._touched:
+                self._write_touched()
+            self._conn.close()
+            self._conn = None
+
+
+    def _touch(self, keys):
+        now = time.time()
+        for key in keys:
+            self._touched[key] = now
+        if len(self._touched) >= TOUCH_BATCH_SIZE:
+            self._write_touched()
+
+
+    def _write_touched(self):
+        try:
+            conn = self.conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._flush_touched()
+                conn.execute('COMMIT')
+            except:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            logging.debug('ANNOTATION CACHE WRITE ERROR: {}'.format(self.path))
+
+
+    def _flush_touched(self):
+        '''
+        Writes pending access times. Must be called within a transaction.
+        '''
+        touched = self._touched
+        self._touched = {}
+        self.conn.executemany('UPDATE annotations SET accessed = ? WHERE key = ?',
+                              [(t, k) for k, t in touched.items()])
+
+
+    def _evict(self):
+        '''
+        Removes the least recently used results until the cache is at least 10% below
+        ``max_size``. Must be called within a transaction.
+        '''
+        size = self.conn.execute("SELECT value FROM info WHERE name = 'size'").fetchone()[0]
+        if size <= self.max_size:
+            return
+        target = size - int(self.max_size * 0.9)
+        freed = 0
+        evict = []
+        for key, value_size in self.conn.execute('SELECT key, size FROM annotations ORDER BY accessed'):
+            evict.append((key, ))
+            freed += value_size
+            if freed >= target:
+                break
+        self.conn.executemany('DELETE FROM annotations WHERE key = ?', evict)
+        self.conn.execute("UPDATE info SET value = value - ? WHERE name = 'size'", (freed, ))
+
+
+
+def germline_database_checksum(species):
+    '''
+    Computes a checksum of all germline database files for a species. Checksums are
+    only computed once per process.
+    '''
+    species = species.lower()
+    if species not in _GERMLINE_CHECKSUMS:
+        germ_dir = get_germline_database_directory(species)
+        md5 = hashlib.md5()
+        for root, dirs, files in sorted(os.walk(germ_dir)):
+            for fname in sorted(files):
+                fpath = os.path.join(root, fname)
+                md5.update(os.path.relpath(fpath, germ_dir).encode('utf-8'))
+                with open(fpath, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        md5.update(block)
+        _GERMLINE_CHECKSUMS[species] = md5.hexdigest()
+    return _GERMLINE_CHECKSUMS[species]
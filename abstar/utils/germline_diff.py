@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# filename: germline_diff.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from argparse import ArgumentParser
+import collections
+import json
+import os
+
+from ..core.germline import get_germline_database_directory
+
+
+SEGMENTS = ['V', 'D', 'J']
+
+_DIFFS = {}
+
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser("Compares two germline databases and lists the alleles that were \
+                            added, removed or changed.")
+    parser.add_argument('old', help="The old germline database. Can be either a species name or \
+                        the path to a germline database directory.")
+    parser.add_argument('new', help="The new germline database. Can be either a species name or \
+                        the path to a germline database directory.")
+    parser.add_argument('--json', dest='json', default=False, action='store_true',
+                        help="If set, the differences are printed in JSON format.")
+    return parser.parse_args(argv)
+
+
+
+class GermlineDiff(object):
+    '''
+    Differences between two germline databases.
+
+    Alleles are compared by name, using the ungapped germline sequences. An allele is
+    ``changed`` if it's found in both databases with different sequences.
+    '''
+    def __init__(self, old, new):
+        super(GermlineDiff, self).__init__()
+        self.old = old
+        self.new = new
+        self.added = {}
+        self.removed = {}
+        self.changed = {}
+        old_db = read_germline_db(old)
+        new_db = read_germline_db(new)
+        for segment in SEGMENTS:
+            old_seqs = old_db[segment]
+            new_seqs = new_db[segment]
+            self.added[segment] = sorted([n for n in new_seqs if n not in old_seqs])
+            self.removed[segment] = sorted([n for n in old_seqs if n not in new_seqs])
+            self.changed[segment] = sorted([n for n in new_seqs if n in old_seqs and new_seqs[n] != old_seqs[n]])
+        # alleles for which a previous assignment may no longer be correct
+        self.modified_alleles = set()
+        for alleles in list(self.removed.values()) + list(self.changed.values()):
+            self.modified_alleles.update(alleles)
+        # genes that gained an allele, which may be a better match than the previous assignment
+        self.genes_with_new_alleles = set([gene_name(a) for alleles in self.added.values() for a in alleles])
+
+
+    def __len__(self):
+        return sum([len(self.added[s]) + len(self.removed[s]) + len(self.changed[s]) for s in SEGMENTS])
+
+
+    def affects(self, germline_names):
+        '''
+        Returns ``True`` if any of ``germline_names`` (alleles, like ``IGHV1-2*02``) were
+        removed or changed, or belong to a gene that gained a new allele.
+        '''
+        for name in germline_names:
+            if name in self.modified_alleles:
+                return True
+            if gene_name(name) in self.genes_with_new_alleles:
+                return True
+        return False
+
+
+    def as_dict(self):
+        return collections.OrderedDict([(s, collections.OrderedDict([('added', self.added[s]),
+                                                                     ('removed', self.removed[s]),
+                                                                     ('changed', self.changed[s])]))
+                                        for s in SEGMENTS])
+
+
+    def format_report(self):
+        lines = []
+        for segment in SEGMENTS:
+            lines.append('')
+            lines.append('{}-GENES'.format(segment))
+            lines.append('-------')
+            for label, alleles in [('added', self.added[segment]),
+                                   ('removed', self.removed[segment]),
+                                   ('changed', self.changed[segment])]:
+                lines.append('{}: {}'.format(label.upper(), ', '.join(alleles) if alleles else 'none'))
+        return '\n'.join(lines)
+
+
+
+def read_germline_db(db):
+    '''
+    Reads the ungapped V, D and J germline sequences from a germline database.
+
+    Args:
+    -----
+
+        db (str): Either a species name or the path to a germline database directory.
+
+    Returns:
+    --------
+
+        dict: ``OrderedDict`` mapping allele names to (uppercase) sequences, keyed by segment.
+            If an allele name is present more than once, the first sequence is used.
+    '''
+    from Bio import SeqIO
+    db_dir = db if os.path.isdir(db) else get_germline_database_directory(db)
+    germlines = {}
+    for segment in SEGMENTS:
+        germlines[segment] = collections.OrderedDict()
+        db_file = os.path.join(db_dir, 'ungapped/{}.fasta'.format(segment.lower()))
+        if not os.path.isfile(db_file):
+            continue
+        with open(db_file) as f:
+            for s in SeqIO.parse(f, 'fasta'):
+                if s.id not in germlines[segment]:
+                    germlines[segment][s.id] = str(s.seq).upper()
+    return germlines
+
+
+def get_germline_diff(old, new):
+    '''
+    Returns the ``GermlineDiff`` for two germline databases. Diffs are only computed
+    once per process.
+    '''
+    key = (old, new)
+    if key not in _DIFFS:
+        _DIFFS[key] = GermlineDiff(old, new)
+    return _DIFFS[key]
+
+
+def gene_name(allele):
+    return allele.split('*')[0]
+
+
+def is_vulnerable(record, diff, margin=0):
+    '''
+    Determines whether a stored annotation should be re-assigned after a germline
+    database update.
+
+    Args:
+    -----
+
+        record (dict): Stored annotation, in JSON format.
+
+        diff (GermlineDiff): Differences between the germline database used to create
+            ``record`` and the current germline database.
+
+        margin (float): Annotations for which the difference between the assigner scores
+            of the top V- or J-gene and the next best alternative is less than ``margin``
+            are considered vulnerable, even if none of their germline genes were affected.
+            Default is 0, which disables the margin check.
+
+    Returns:
+    --------
+
+        bool
+    '''
+    names = []
+    for segment in ['v_gene', 'd_gene', 'j_gene']:
+        gene = record.get(segment) or {}
+        if gene.get('full'):
+            names.append(gene['full'])
+        names.extend([o['full'] for o in gene.get('others', []) if o.get('full')])
+        if margin and segment != 'd_gene' and gene.get('others'):
+            top = gene.get('assigner_score')
+            runner_up = gene['others'][0].get('assigner_score', gene['others'][0].get('score'))
+            if all([top is not None, runner_up is not None]) and top - runner_up < margin:
+                return True
+    return diff.affects(names)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    diff = GermlineDiff(args.old, args.new)
+    if args.json:
+        print(json.dumps(diff.as_dict(), indent=4))
+    else:
+        print(diff.format_report())
+        print('')
+        print('{} alleles were added, removed or changed.'.format(len(diff)))
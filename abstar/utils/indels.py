@@ -34,6 +34,9 @@ from abutils.utils.decorators import lazy_property
 
 class Indel(object):
     """Base class for insertions and deletions"""
+    __slots__ = ('raw', 'length', 'raw_position', 'sequence', 'fixed',
+                 'in_frame', 'imgt_position', 'imgt_codon')
+
     def __init__(self, indel):
         super(Indel, self).__init__()
         self.raw = indel
@@ -70,9 +73,8 @@ class Indel(object):
 
 class Insertion(Indel):
     """docstring for Insertion"""
-    def __init__(self, indel):
-        super(Insertion, self).__init__(indel)
-        self.type = 'insertion'
+    __slots__ = ()
+    type = 'insertion'
 
 
     @property
@@ -104,9 +106,8 @@ class Insertion(Indel):
 
 class Deletion(Indel):
     """docstring for Deletion"""
-    def __init__(self, indel):
-        super(Deletion, self).__init__(indel)
-        self.type = 'deletion'
+    __slots__ = ()
+    type = 'deletion'
 
 
     @property
@@ -28,10 +28,6 @@ import logging
 import os
 import traceback
 
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.Alphabet import generic_dna
-
 from abutils.core.sequence import Sequence
 from abutils.utils import log
 from abutils.utils.alignment import local_alignment
@@ -40,16 +36,31 @@ from abutils.utils.decorators import lazy_property
 from ..core.germline import get_germline_database_directory
 
 
+# isotype database files are parsed once per process, keyed by file path
+_ISOTYPE_SEQS = {}
+
+
 def get_isotype(antibody):
     try:
-        germ_dir = get_germline_database_directory(antibody.species)
-        isotype_file = os.path.join(germ_dir, 'isotypes/isotypes.fasta')
-        isotype_seqs = [Sequence(s) for s in SeqIO.parse(open(isotype_file, 'r'), 'fasta')]
+        isotype_seqs = get_isotype_sequences(antibody.species)
         return Isotype(antibody, isotype_seqs)
     except:
         antibody.exception('ISOTYPING ERROR', traceback.format_exc())
 
 
+def get_isotype_sequences(species):
+    '''
+    Returns the isotype reference sequences for ``species``, as a list of ``Sequence`` objects.
+    '''
+    germ_dir = get_germline_database_directory(species)
+    isotype_file = os.path.join(germ_dir, 'isotypes/isotypes.fasta')
+    if isotype_file not in _ISOTYPE_SEQS:
+        from Bio import SeqIO
+        with open(isotype_file, 'r') as f:
+            _ISOTYPE_SEQS[isotype_file] = [Sequence(s) for s in SeqIO.parse(f, 'fasta')]
+    return _ISOTYPE_SEQS[isotype_file]
+
+
 # def get_isotype(vdj):
 #     logger = log.get_logger(__name__)
 #     try:
@@ -28,13 +28,12 @@ import math
 import os
 import traceback
 
-from Bio.Seq import Seq
-from Bio.Alphabet import generic_dna
-
 from abutils.utils import log
 from abutils.utils.alignment import global_alignment, local_alignment
 from abutils.utils.codons import codon_lookup as codons
 
+from .translation import translate
+
 
 def get_junction(antibody):
     antibody.log('')
@@ -78,7 +77,7 @@ class Junction(object):
                 antibody.log('JUNCTION NT:', self.junction_nt, len(self.junction_nt))
             if len(self.junction_nt) % 3 != 0:
                 self.in_frame = False
-        self.junction_aa = str(Seq(self.junction_nt.replace('-', ''), generic_dna).translate())
+        self.junction_aa = translate(self.junction_nt.replace('-', ''))
         antibody.log('JUNCTION AA:', self.junction_aa, len(self.junction_aa))
 
         # identify CDR3 sequence
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# filename: manifest.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+MANIFEST_VERSION = 3
+
+# args that affect the contents of job outputs. If any of these change,
+# previously completed jobs can't be re-used.
+MANIFEST_SETTINGS = ['species', 'assigner', 'chunksize', 'uid', 'output_type', 'json_keys',
+                     'padding', 'pretty', 'raw', 'debug', 'isotype', 'prefilter', 'prefilter_min_kmers',
+                     'assigner_options', 'umi_consensus', 'mongo_db', 'mongo_collection',
+                     'previous_germline_db', 'reassigner', 'reassign_margin', 'sequence_timeout']
+
+
+class RunManifest(object):
+    '''
+    Records the progress of an AbStar run, so that an interrupted run can be resumed.
+
+    For each input file, the manifest records a fingerprint of the input file (see
+    ``file_fingerprint()``), the number of sequences and the output of each completed chunk. Chunk files are created as jobs are
+    queued and deleted once they're complete, but chunk boundaries (and names) only depend on
+    the input file and the chunk size, so unfinished chunks are simply re-created when a run
+    is resumed. Once all of a file's chunks are finished and concatenated, the final output
+    files are recorded and the input file is marked as complete.
+
+    Completed chunks are appended to a journal (``path`` + ``'.journal'``), one line per
+    chunk, which is replayed when a run is resumed. The manifest itself is only re-written
+    when a file is started or completed, at which point the journal is folded into the
+    manifest and cleared, so the cost of recording a chunk doesn't grow with the number of
+    chunks. Manifest updates are atomic (the manifest is written to a temporary file, which
+    then replaces the existing manifest), and chunk outputs are flushed to disk before a
+    chunk is journaled, so a crash can never leave a chunk marked as complete without its
+    output.
+
+    Args:
+    -----
+
+        path (str): Path to the manifest file.
+
+        args (Args): Runtime arguments.
+
+        resume (bool): If ``True``, an existing manifest at ``path`` will be loaded. If the
+            existing manifest was created with different runtime settings, it is discarded.
+            Default is ``False``, which always starts a new manifest.
+    '''
+    def __init__(self, path, args, resume=False):
+        super(RunManifest, self).__init__()
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.settings = dict([(s, getattr(args, s, None)) for s in MANIFEST_SETTINGS])
+        self._lock = threading.RLock()
+        self.data = None
+        self.resumed = False
+        if resume and os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                if all([data.get('version') == MANIFEST_VERSION,
+                        data.get('settings') == json.loads(json.dumps(self.settings))]):
+                    self.data = data
+                    self.resumed = True
+                    self._replay_journal()
+            except ValueError:
+                # a corrupt manifest (which shouldn't happen, since writes are atomic)
+                pass
+        if self.data is None:
+            self.data = {'version': MANIFEST_VERSION,
+                         'settings': self.settings,
+                         'created': time.time(),
+                         'files': {}}
+            self.save()
+
+
+    def save(self):
+        '''
+        Atomically writes the manifest to disk. Chunks recorded in the journal are
+        included in the manifest, so the journal is cleared.
+        '''
+        with self._lock:
+            self.data['updated'] = time.time()
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            _replace(temp_path, self.path)
+            if os.path.isfile(self.journal_path):
+                os.unlink(self.journal_path)
+
+
+    def file_entry(self, input_file):
+        return self.data['files'].get(os.path.abspath(input_file))
+
+
+    def is_file_complete(self, input_file, fingerprint):
+        '''
+        Returns ``True`` if ``input_file`` was completely processed by a previous run,
+        and the input file and the output files are unchanged.
+        '''
+        entry = self.file_entry(input_file)
+        if entry is None or not same_fingerprint(entry.get('fingerprint'), fingerprint) or not entry.get('complete'):
+            return False
+        return all([os.path.isfile(o) for o in entry.get('outputs', [])])
+
+
+    def seq_count(self, input_file, fingerprint):
+        '''
+        Returns the number of sequences recorded for ``input_file`` by a previous run,
+        or ``None`` if the file hasn't been started or has changed since.
+        '''
+        entry = self.file_entry(input_file)
+        if entry is None or not same_fingerprint(entry.get('fingerprint'), fingerprint):
+            return None
+        return entry.get('seq_count')
+
+
+    def start_file(self, input_file, fingerprint, seq_count):
+        '''
+        Records the start of processing for ``input_file``. Chunks completed by a previous run
+        are kept if the input file is unchanged, otherwise they're discarded.
+        '''
+        with self._lock:
+            entry = self.file_entry(input_file)
+            unchanged = entry is not None and same_fingerprint(entry.get('fingerprint'), fingerprint)
+            if unchanged and entry.get('seq_count') == seq_count:
+                # keep checksums computed while resuming, so that later resumes can verify them
+                if 'md5' in fingerprint and 'md5' not in entry['fingerprint']:
+                    entry['fingerprint'] = fingerprint
+                    self.save()
+                return
+            self.data['files'][os.path.abspath(input_file)] = {'fingerprint': fingerprint,
+                                                               'seq_count': seq_count,
+                                                               'completed': {},
+                                                               'outputs': [],
+                                                               'complete': False}
+            self.save()
+
+
+    def completed_chunks(self, input_file):
+        '''
+        Returns a dict mapping completed chunk files to their job results. Chunks are
+        only included if all of their output files still exist.
+        '''
+        entry = self.file_entry(input_file)
+        if entry is None:
+            return {}
+        completed = {}
+        for chunk, result in entry['completed'].items():
+            if all([os.path.isfile(o) for o in result[0]]):
+                completed[chunk] = tuple(result)
+        return completed
+
+
+    def complete_chunk(self, input_file, chunk, result):
+        '''
+        Marks a chunk as complete. ``result`` is the tuple returned by ``run_abstar()``.
+        Output and log files are flushed to disk before the manifest is updated.
+        '''
+        if result is None:
+            return
+        output_files = result[0]
+        log_files = [l for l in result[2:5] if l]
+        for fname in output_files + log_files:
+            _fsync(fname)
+        with self._lock:
+            entry = self.file_entry(input_file)
+            entry['completed'][chunk] = list(result)
+            record = {'file': os.path.abspath(input_file),
+                      'fingerprint': entry['fingerprint'],
+                      'chunk': chunk,
+                      'result': list(result)}
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
+    def _replay_journal(self):
+        '''
+        Adds chunks recorded in the journal to the manifest. Journal records are only
+        applied if the input file is unchanged and incomplete, since the manifest may have
+        been saved without the journal being cleared (if the run was interrupted in between).
+        '''
+        if not os.path.isfile(self.journal_path):
+            return
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a partially written record, if the run was interrupted while journaling
+                    break
+                entry = self.data['files'].get(record['file'])
+                if entry is None or entry.get('complete'):
+                    continue
+                if not same_fingerprint(entry.get('fingerprint'), record['fingerprint']):
+                    continue
+                entry['completed'][record['chunk']] = record['result']
+
+
+    def complete_file(self, input_file, outputs):
+        '''
+        Marks an input file as complete, once the job outputs have been concatenated.
+        '''
+        for fname in outputs:
+            _fsync(fname)
+        with self._lock:
+            entry = self.file_entry(input_file)
+            entry['outputs'] = list(outputs)
+            entry['complete'] = True
+            entry['completed'] = {}
+            self.save()
+
+
+
+def file_fingerprint(path, checksum=False):
+    '''
+    Identifies the contents of an input file by its size and modification time, and
+    optionally by its MD5 checksum. Computing the checksum requires reading the entire
+    file, so it's only done when resuming a run.
+    '''
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if checksum:
+        fingerprint['md5'] = file_checksum(path)
+    return fingerprint
+
+
+def same_fingerprint(old, new):
+    '''
+    Compares two file fingerprints. Checksums are only compared if both fingerprints have one.
+    '''
+    if old is None or new is None:
+        return False
+    if old.get('size') != new.get('size') or old.get('mtime') != new.get('mtime'):
+        return False
+    if 'md5' in old and 'md5' in new:
+        return old['md5'] == new['md5']
+    return True
+
+
+def file_checksum(path, block_size=1024 * 1024):
+    '''
+    Computes the MD5 checksum of a file.
+    '''
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _fsync(path):
+    if not os.path.isfile(path):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _replace(src, dst):
+    # os.replace() isn't available in Python 2, but os.rename() is atomic on POSIX systems
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        os.rename(src, dst)
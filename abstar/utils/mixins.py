@@ -28,6 +28,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 class LoggingMixin(object):
     """docstring for LoggingMixin"""
+    __slots__ = ('_log', '_exceptions')
+
     def __init__(self):
         self._log = None
         self._exceptions = None
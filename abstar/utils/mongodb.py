@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# filename: mongodb.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import hashlib
+import logging
+import os
+
+import pymongo
+from pymongo.errors import BulkWriteError
+
+
+# MongoDB error code for an insert with an existing _id
+DUPLICATE_KEY_ERROR = 11000
+
+# MongoClient instances aren't fork-safe, so clients are cached by process ID
+# and each worker process creates (and re-uses) its own connection pool
+_CLIENTS = {}
+
+
+class MongoSink(object):
+    '''
+    Streams annotation records into a MongoDB collection. Records are buffered
+    and inserted with unordered ``insert_many()`` calls of ``batch_size`` records.
+
+    Records can be given a deterministic ``_id`` (see ``record_id()``), so that inserting the
+    same annotation again (when a run is resumed, or when a slow job is re-dispatched and
+    both copies finish) is skipped rather than creating a duplicate document. Skipped
+    records are counted in ``duplicates``, not ``errors``.
+
+    Args:
+    -----
+
+        collection (str): Name of the MongoDB collection.
+
+        db (str): Name of the MongoDB database.
+
+        ip (str): IP address of the MongoDB server. Default is ``'localhost'``.
+
+        port (int): MongoDB port. Default is ``27017``.
+
+        user (str): Username for the MongoDB server. Not used if not provided.
+
+        password (str): Password for the MongoDB server. Not used if not provided.
+
+        batch_size (int): Number of records in each ``insert_many()`` call. Default is ``1000``.
+    '''
+    def __init__(self, collection, db, ip='localhost', port=27017, user=None, password=None, batch_size=1000):
+        super(MongoSink, self).__init__()
+        client = get_client(ip, port, user, password)
+        self.collection = client[db][collection]
+        self.batch_size = max(1, int(batch_size))
+        self.inserted = 0
+        self.duplicates = 0
+        self.errors = 0
+        self._buffer = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def add(self, record, _id=None):
+        '''
+        Adds a single record, inserting the buffered records if the buffer is full.
+        If provided, ``_id`` is used as the record's ``_id``.
+        '''
+        if _id is not None:
+            record['_id'] = _id
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+
+    def flush(self):
+        '''
+        Inserts all buffered records. Write errors for individual records are logged
+        and counted, but don't prevent the rest of the batch from being inserted.
+        Records that are already in the collection are skipped.
+        '''
+        if not self._buffer:
+            return
+        batch = self._buffer
+        self._buffer = []
+        try:
+            result = self.collection.insert_many(batch, ordered=False)
+            self.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            self.inserted += e.details.get('nInserted', 0)
+            for error in write_errors:
+                if error.get('code') == DUPLICATE_KEY_ERROR:
+                    self.duplicates += 1
+                    continue
+                self.errors += 1
+                logging.debug('MONGODB WRITE ERROR: {}'.format(error.get('errmsg', error)))
+
+
+    def close(self):
+        self.flush()
+
+
+
+def record_id(seq_id, sequence):
+    '''
+    Returns a deterministic ``_id`` for the annotation of a single input sequence,
+    from the sequence ID and a fingerprint of the raw input sequence.
+    '''
+    fingerprint = hashlib.sha1(sequence.upper().encode('utf-8')).hexdigest()
+    return '{}:{}'.format(seq_id, fingerprint)
+
+
+def get_client(ip='localhost', port=27017, user=None, password=None):
+    '''
+    Returns a ``MongoClient``. Clients are created once per process, so repeated
+    jobs in the same worker process share a connection pool.
+    '''
+    key = (os.getpid(), ip, int(port), user, password)
+    if key not in _CLIENTS:
+        if user and password:
+            _CLIENTS[key] = pymongo.MongoClient(ip, int(port), username=user, password=password)
+        else:
+            _CLIENTS[key] = pymongo.MongoClient(ip, int(port))
+    return _CLIENTS[key]
+
+
+def create_indexes(collection, db, fields, ip='localhost', port=27017, user=None, password=None):
+    '''
+    Creates an ascending index on each of ``fields``. Building indexes once all records
+    have been loaded is much faster than updating the indexes with every insert.
+    '''
+    coll = get_client(ip, port, user, password)[db][collection]
+    for field in fields:
+        coll.create_index([(field, pymongo.ASCENDING)])
@@ -24,16 +24,22 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import errno
 import itertools
 import multiprocessing as mp
 import os
 import subprocess
 import sys
-import time
-import uuid
+import tempfile
 
 from abutils.utils import progbar
-from abutils.utils.pipeline import make_dir
+
+
+# byte ranges are streamed to mongoimport in blocks of this size (in bytes)
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# number of lines used to estimate the average JSON document size
+SAMPLE_LINES = 1000
 
 
 def parse_arguments():
@@ -56,8 +62,7 @@ def parse_arguments():
     parser.add_argument('-l', '--log', dest='log', default='sys.stdout',
                         help="Log file for the mongoimport stdout.")
     parser.add_argument('-t', '--temp', dest='temp', default=None,
-                        help="Temp directory if splitting JSON files prior to mongoimport. \
-                        if not provided, a temp directory will be created in the --in directory.")
+                        help="No longer used. Split files are streamed to mongoimport, so no temp files are written.")
     parser.add_argument('-e', '--delim1', dest='delim1', default=None,
                         help="The first character delimiter used to split the filename to get the collection name. \
                         If splitting with a single delimiter, use this option to provide the delimiter. Required.")
@@ -73,7 +78,8 @@ def parse_arguments():
                         second delimiter at which to split. \
                         Required if splitting with two different delimiters.")
     parser.add_argument('--split-file', dest='split_file', action='store_true', default=False,
-                        help="Splits each input file into subfiles containing --split_file_lines lines. \
+                        help="Splits each input file into byte ranges of approximately --split-file-lines lines, \
+                        which are imported in parallel. \
                         Useful when performing mongoimport via an SSH tunnel, where for some reason MongoDB \
                         errors when importing files greater than 16MB (even if no individual documents are >16MB).")
     parser.add_argument('--split=file-lines', dest='split_file_lines', type=int, default=500,
@@ -108,56 +114,106 @@ class Args(object):
 
 def mongo_import(json, db, coll, log, args):
     if args.split_file:
-        jsons = split_file(json, args)
-        multiprocess_mongoimport(jsons, db, coll, args)
+        byte_ranges = get_byte_ranges(json, args.split_file_lines)
+        failed = multiprocess_mongoimport(json, byte_ranges, db, coll, args)
     else:
-        do_mongoimport(json, args.ip, args.port, db, coll, args.user, args.password)
-
-    #     jsons = [json, ]
-    # username = " -u {}".format(args.user) if args.user else ""
-    # password = " -p {}".format(args.password) if args.password else ""
-    # # user_password = "{}{} --authenticationDatabase admin".format(username, password)
-    # for i, json in enumerate(jsons):
-    #     mongo_cmd = "mongoimport --host {}:27017{}{} --db {} --collection {} --file {}".format(
-    #         args.ip, username, password, db, coll, json)
-    #     mongo = subprocess.Popen(mongo_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    #     mongo.communicate()
-    #     if args.split_file:
-    #         progbar.progress_bar(i + 1, len(jsons))
-    # if args.split_file:
-    #     print('')
-    #     remove_temp_files(args)
-
-
-def multiprocess_mongoimport(jsons, db, coll, args):
-    progbar.progress_bar(0, len(jsons))
-    async_results = []
+        returncode, stderr = do_mongoimport(json, args.ip, args.port, db, coll, args.user, args.password)
+        failed = [(None, None, returncode, stderr)] if returncode != 0 else []
+    for start, end, returncode, stderr in failed:
+        if start is None:
+            msg = 'ERROR: mongoimport failed (exit status {})'.format(returncode)
+        else:
+            msg = 'ERROR: mongoimport failed for bytes {}-{} (exit status {})'.format(start, end, returncode)
+        print(msg)
+        log.write('\n{}\n{}\n'.format(msg, stderr.strip()))
+    return failed
+
+
+def multiprocess_mongoimport(json, byte_ranges, db, coll, args):
+    '''
+    Imports byte ranges of a JSON file in parallel.
+
+    Returns:
+    --------
+
+        list: ``(start, end, returncode, stderr)`` tuples for the byte ranges that failed to import.
+    '''
+    progbar.progress_bar(0, len(byte_ranges))
+    jobs = [(json, args.ip, args.port, db, coll, args.user, args.password, start, end)
+            for start, end in byte_ranges]
+    failed = []
     p = mp.Pool()
-    for j in jsons:
-        async_results.append(p.apply_async(do_mongoimport, args=(j, args.ip, args.port, db, coll, args.user, args.password)))
-    monitor_results(async_results)
-    remove_temp_files(args)
+    # progress is updated as each byte range finishes importing, in whatever order they finish
+    for finished, (start, end, returncode, stderr) in enumerate(p.imap_unordered(_do_mongoimport, jobs), 1):
+        if returncode != 0:
+            failed.append((start, end, returncode, stderr))
+        progbar.progress_bar(finished, len(byte_ranges))
+    p.close()
+    p.join()
     print('')
+    return sorted(failed)
 
 
-def monitor_results(results):
-    finished = 0
-    jobs = len(results)
-    while finished < jobs:
-        time.sleep(1)
-        ready = [ar for ar in results if ar.ready()]
-        finished = len(ready)
-        progbar.progress_bar(finished, jobs)
-    progbar.progress_bar(finished, jobs)
+def _do_mongoimport(job):
+    start, end = job[-2:]
+    returncode, stderr = do_mongoimport(*job)
+    return start, end, returncode, stderr
 
 
-def do_mongoimport(json, ip, port, db, coll, user, password):
+def do_mongoimport(json, ip, port, db, coll, user, password, start=None, end=None):
+    '''
+    Imports a JSON file (or a byte range of a JSON file) into MongoDB.
+
+    If ``start`` and ``end`` are provided, only the bytes in the range ``[start, end)`` are
+    imported. The byte range is streamed to ``mongoimport`` through stdin, so no temp files
+    are written. Byte ranges should begin and end at line boundaries (see ``get_byte_ranges()``).
+
+    Returns:
+    --------
+
+        tuple: The ``mongoimport`` exit status and its stderr output (as a string).
+    '''
     username = " -u {}".format(user) if user else ""
     password = " -p {}".format(password) if password else ""
-    mongo_cmd = "mongoimport --host {}:{}{}{} --db {} --collection {} --file {} --numInsertionWorkers 12 --batchSize 100".format(
-        ip, port, username, password, db, coll, json)
-    mongo = subprocess.Popen(mongo_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    mongo.communicate()
+    if start is None:
+        mongo_cmd = "mongoimport --host {}:{}{}{} --db {} --collection {} --file {} --numInsertionWorkers 12 --batchSize 100".format(
+            ip, port, username, password, db, coll, json)
+        mongo = subprocess.Popen(mongo_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, stderr = mongo.communicate()
+        return mongo.returncode, stderr.decode('utf-8', 'replace')
+    mongo_cmd = "mongoimport --host {}:{}{}{} --db {} --collection {} --numInsertionWorkers 4 --batchSize 100".format(
+        ip, port, username, password, db, coll)
+    devnull = open(os.devnull, 'w')
+    # stderr goes to a temp file rather than a pipe, since mongoimport could block
+    # on a full stderr pipe while we're blocked writing to its stdin
+    errfile = tempfile.TemporaryFile()
+    mongo = subprocess.Popen(mongo_cmd, shell=True, stdin=subprocess.PIPE, stdout=devnull, stderr=errfile)
+    broken_pipe = False
+    try:
+        with open(json, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                mongo.stdin.write(block)
+                remaining -= len(block)
+        mongo.stdin.close()
+    except (IOError, OSError) as e:
+        # mongoimport exited before reading all of its input
+        if e.errno != errno.EPIPE:
+            raise
+        broken_pipe = True
+    returncode = mongo.wait()
+    devnull.close()
+    errfile.seek(0)
+    stderr = errfile.read().decode('utf-8', 'replace')
+    errfile.close()
+    if broken_pipe and returncode == 0:
+        returncode = 1
+        stderr += '\nmongoimport exited before the entire byte range was imported'
+    return returncode, stderr
 
 
 
@@ -173,24 +229,32 @@ def listdir_fullpath(d):
     sys.exit(1)
 
 
-def split_file(json, args):
-    split_files = []
-    temp_dir = args.temp if args.temp is not None else os.path.join(args.mongo_input_dir, 'temp')
-    make_dir(temp_dir)
-    with open(json) as f:
-        for chunk in itertools.izip_longest(*[f] * args.split_file_lines):
-            chunk = [c for c in chunk if c is not None]
-            fname = os.path.join(temp_dir, str(uuid.uuid4()) + '.json')
-            open(fname, 'w').write(''.join(chunk))
-            split_files.append(fname)
-    return split_files
-
-
-def remove_temp_files(args):
-    temp_dir = args.temp if args.temp is not None else os.path.join(args.mongo_input_dir, 'temp')
-    files = listdir_fullpath(temp_dir)
-    for f in files:
-        os.unlink(f)
+def get_byte_ranges(json, lines_per_range):
+    '''
+    Splits a JSON file into byte ranges of approximately ``lines_per_range`` lines. The
+    average line length is estimated from the start of the file, and each range is extended
+    to the end of the line in which it would otherwise end, so that no JSON document is
+    split between two ranges.
+
+    Returns:
+    --------
+
+        list: ``(start, end)`` tuples of byte offsets.
+    '''
+    size = os.path.getsize(json)
+    with open(json, 'rb') as f:
+        sample = [len(line) for line in itertools.islice(f, SAMPLE_LINES)]
+        range_size = max(1, int(sum(sample) / max(1, len(sample)) * lines_per_range))
+        byte_ranges = []
+        start = 0
+        while start < size:
+            end = min(size, start + range_size)
+            if end < size:
+                f.seek(end)
+                end += len(f.readline())
+            byte_ranges.append((start, end))
+            start = end
+    return byte_ranges
 
 
 
@@ -24,15 +24,22 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-import math
 import re
 import traceback
 
+import numpy as np
+
 from abutils.utils import log
 from abutils.utils.codons import codon_lookup as codons
 
 from .regions import IMGT_REGION_START_POSITIONS_AA, IMGT_REGION_END_POSITIONS_AA
+from .translation import NUCLEOTIDES, codon_indexes
+
+
+GAP = ord('-')
 
+CODON_TABLE = np.array([ord(codons.get(a + b + c, 'X')) for a in NUCLEOTIDES for b in NUCLEOTIDES for c in NUCLEOTIDES],
+                       dtype=np.uint8)
 
 
 def nt_mutations(antibody):
@@ -42,19 +49,31 @@ def nt_mutations(antibody):
             if segment is None:
                 continue
             mutations = Mutations()
-            for i, (q, g) in enumerate(zip(segment.query_alignment, segment.germline_alignment)):
-                if q != g:
-                    raw_pos = i + segment.query_start
-                    imgt_pos = segment.get_imgt_position_from_raw(raw_pos)
-                    # we don't want to count indels as mutations
-                    if any([q == '-', g == '-', imgt_pos is None]):
-                        continue
-                    imgt_codon = int(math.ceil(imgt_pos / 3.0))
-                    if segment.gene_type == 'J':
-                        imgt_pos = segment.correct_imgt_nt_position_from_imgt(imgt_pos)
-                    mutations.add(Mutation(g, q, raw_pos, imgt_pos, imgt_codon))
+            query = _as_array(segment.query_alignment)
+            germline = _as_array(segment.germline_alignment)
+            length = min(len(query), len(germline))
+            query = query[:length]
+            germline = germline[:length]
+            imgt_positions = _imgt_positions_by_alignment_index(segment, length)
+            # we don't want to count indels as mutations
+            mismatches = np.flatnonzero((query != germline) &
+                                        (query != GAP) &
+                                        (germline != GAP) &
+                                        (imgt_positions >= 0))
+            mutated_imgt_positions = imgt_positions[mismatches]
+            # integer equivalent of ceil(imgt_pos / 3)
+            mutated_imgt_codons = (mutated_imgt_positions + 2) // 3
+            for i, imgt_pos, imgt_codon in zip(mismatches.tolist(),
+                                               mutated_imgt_positions.tolist(),
+                                               mutated_imgt_codons.tolist()):
+                raw_pos = i + segment.query_start
+                if segment.gene_type == 'J':
+                    imgt_pos = segment.correct_imgt_nt_position_from_imgt(imgt_pos)
+                mutations.add(Mutation(segment.germline_alignment[i],
+                                       segment.query_alignment[i],
+                                       raw_pos, imgt_pos, imgt_codon))
             segment.nt_mutations = mutations
-            segment.nt_identity = 100. - (100. * mutations.count / min(len(segment.query_alignment), len(segment.germline_alignment)))
+            segment.nt_identity = 100. - (100. * mutations.count / length)
             all_mutations.add_many(mutations.mutations)
         antibody.log('')
         antibody.log('NT MUTATIONS')
@@ -77,38 +96,28 @@ def aa_mutations(antibody):
         all_mutations = Mutations()
         for segment in [antibody.v, antibody.j]:
             mutations = Mutations()
-            for i, (q, g) in enumerate(zip(segment.query_alignment, segment.germline_alignment)):
-                raw_nt_pos = i + segment.query_start
-                imgt_nt_pos = segment.get_imgt_position_from_raw(raw_nt_pos)
-                if imgt_nt_pos is None:
-                    continue
-                if imgt_nt_pos % 3 != 1:
-                    continue
-                if any([q == '-', g == '-']):
-                    continue
-                q_codon_end_pos = i + 3
-                if q_codon_end_pos >= len(segment.query_alignment):
-                    continue
-                q_codon = segment.query_alignment[i:q_codon_end_pos]
-                while len(q_codon.replace('-', '')) < 3:
-                    q_codon_end_pos += 1
-                    q_codon = segment.query_alignment[i:q_codon_end_pos]
-                    if q_codon_end_pos >= len(segment.query_alignment):
-                        break
-                if len(q_codon.replace('-', '')) < 3:
-                    continue
-                g_codon_end_pos = i + 3
-                g_codon = segment.germline_alignment[i:g_codon_end_pos]
-                while len(g_codon.replace('-', '')) < 3:
-                    g_codon_end_pos += 1
-                    g_codon = segment.germline_alignment[i:g_codon_end_pos]
-                q_aa = codons.get(q_codon.replace('-', ''), 'X')
-                g_aa = codons.get(g_codon.replace('-', ''), 'X')
-                if q_aa != g_aa:
-                    imgt_aa_pos = int(math.ceil(imgt_nt_pos / 3.0))
-                    if segment.gene_type == 'J':
-                        imgt_aa_pos = segment.correct_imgt_aa_position_from_imgt(imgt_aa_pos)
-                    mutations.add(Mutation(g_aa, q_aa, None, imgt_aa_pos, imgt_aa_pos))
+            query = _as_array(segment.query_alignment)
+            germline = _as_array(segment.germline_alignment)
+            length = min(len(query), len(germline))
+            imgt_positions = _imgt_positions_by_alignment_index(segment, length)
+            # codons start at the first nucleotide of an IMGT codon, and
+            # neither the query nor the germline can be gapped at the start
+            starts = np.flatnonzero((imgt_positions >= 0) &
+                                    (imgt_positions % 3 == 1) &
+                                    (query[:length] != GAP) &
+                                    (germline[:length] != GAP) &
+                                    (np.arange(length) + 3 < len(query)))
+            q_valid, q_codons = _ungapped_codons(query, starts)
+            g_valid, g_codons = _ungapped_codons(germline, starts)
+            q_aas = _translate_codons(q_codons)
+            g_aas = _translate_codons(g_codons)
+            mutated = np.flatnonzero(q_valid & g_valid & (q_aas != g_aas))
+            for m in mutated.tolist():
+                imgt_nt_pos = int(imgt_positions[starts[m]])
+                imgt_aa_pos = (imgt_nt_pos + 2) // 3
+                if segment.gene_type == 'J':
+                    imgt_aa_pos = segment.correct_imgt_aa_position_from_imgt(imgt_aa_pos)
+                mutations.add(Mutation(chr(g_aas[m]), chr(q_aas[m]), None, imgt_aa_pos, imgt_aa_pos))
             segment.aa_mutations = mutations
             segment.aa_identity = 100. - (100. * mutations.count / len(segment.aa_sequence))
             all_mutations.add_many(mutations.mutations)
@@ -128,6 +137,63 @@ def aa_mutations(antibody):
         return Mutations()
 
 
+def _as_array(sequence):
+    '''
+    Returns an aligned sequence as a uint8 array of ASCII codes.
+    '''
+    return np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+
+
+def _imgt_positions_by_alignment_index(segment, length):
+    '''
+    Returns an int array containing the IMGT nucleotide position for each of the first
+    ``length`` alignment positions of a germline segment, using -1 for alignment
+    positions that don't have an IMGT position (insertions, unnumbered positions, etc).
+    '''
+    return segment.get_imgt_positions_from_raw(np.arange(length) + segment.query_start)
+
+
+def _ungapped_codons(sequence, starts):
+    '''
+    For each codon start position, finds the first three ungapped nucleotides at or after
+    the start position.
+
+    Args:
+    -----
+
+        sequence (np.ndarray): aligned sequence, as returned by ``_as_array()``
+
+        starts (np.ndarray): codon start positions. Each start position must be ungapped.
+
+    Returns:
+    --------
+
+        tuple: a boolean array indicating whether a complete codon was found for each
+            start position, and an Nx3 array of the codon nucleotides.
+    '''
+    ungapped = np.flatnonzero(sequence != GAP)
+    if ungapped.size == 0:
+        return np.zeros(len(starts), dtype=bool), np.zeros((len(starts), 3), dtype=np.uint8)
+    rank = np.searchsorted(ungapped, starts)
+    valid = rank + 2 < ungapped.size
+    indexes = np.minimum(rank[:, np.newaxis] + np.arange(3), ungapped.size - 1)
+    return valid, sequence[ungapped[indexes]]
+
+
+def _translate_codons(codon_array):
+    '''
+    Translates an Nx3 array of codons into a uint8 array of amino acid ASCII codes.
+    Codons containing anything other than uppercase ``ACGT`` fall back to a direct
+    codon lookup, so translations are identical to ``codons.get(codon, 'X')``.
+    '''
+    indexes, nonstandard = codon_indexes(codon_array)
+    aas = CODON_TABLE[indexes]
+    for i in np.flatnonzero(nonstandard).tolist():
+        codon = codon_array[i].tobytes().decode('ascii')
+        aas[i] = ord(codons.get(codon, 'X'))
+    return aas
+
+
 def _get_joining_imgt_mutation_position(codon_num, j):
     pass
 
@@ -135,6 +201,8 @@ def _get_joining_imgt_mutation_position(codon_num, j):
 
 class Mutation(object):
     """docstring for Mutation"""
+    __slots__ = ('was', 'now', 'raw_position', 'imgt_position', 'imgt_codon')
+
     def __init__(self, was, now, raw_position, imgt_position, imgt_codon):
         super(Mutation, self).__init__()
         self.was = was
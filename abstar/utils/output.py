@@ -31,6 +31,8 @@ import traceback
 
 from abutils.utils import log
 
+from .sqlite import sqlite_row, write_sqlite
+
 
 
 def get_abstar_results(antibodies, pretty=False, padding=True, raw=False, keys=None):
@@ -52,6 +54,9 @@ class AbstarResult(object):
         self.keys = keys
         # property vars
         self._json_output = None
+        self._json_record = None
+        self._mongodb_output = None
+        self._sqlite_output = None
         self._imgt_output = None
         self._minimal_output = None
         self._imgt_header = None
@@ -73,6 +78,42 @@ class AbstarResult(object):
         self._json_output = json
 
 
+    @property
+    def json_record(self):
+        if self._json_record is None:
+            self._json_record = self._build_json_record()
+        return self._json_record
+
+
+    @property
+    def mongodb_output(self):
+        if self._mongodb_output is None:
+            try:
+                self._mongodb_output = format_json_output(self.json_record,
+                                                          padding=self.padding,
+                                                          raw=True,
+                                                          keys=self.keys)
+            except:
+                self.antibody.exception('MONGODB RECORD CREATION EXCEPTION', traceback.format_exc())
+                self._mongodb_output = None
+        return self._mongodb_output
+
+
+    @property
+    def sqlite_output(self):
+        if self._sqlite_output is None:
+            try:
+                record = format_json_output(self.json_record,
+                                            padding=False,
+                                            raw=True,
+                                            keys=self.keys)
+                self._sqlite_output = sqlite_row(record)
+            except:
+                self.antibody.exception('SQLITE ROW CREATION EXCEPTION', traceback.format_exc())
+                self._sqlite_output = None
+        return self._sqlite_output
+
+
     @property
     def imgt_output(self):
         if self._imgt_output is None:
@@ -96,14 +137,26 @@ class AbstarResult(object):
         self._minimal_output = minimal
 
 
-    def _build_json_output(self, raw=False):
+    def _build_json_output(self):
         '''
         Assembles AbAnalyze output in JSON format.
 
-        Input is a VDJ object.
-
         Output is a JSON-formatted output string that should be suitable
-        for writing to an output file.
+        for writing to an output file (or a dict, if ``raw`` is ``True``).
+        '''
+        return format_json_output(self.json_record,
+                                  pretty=self.pretty,
+                                  padding=self.padding,
+                                  raw=self.raw,
+                                  keys=self.keys)
+
+
+    def _build_json_record(self):
+        '''
+        Assembles the complete JSON record, before any output formatting
+        (key filtering, padding, removal of empty fields) is applied.
+
+        Output is an ``OrderedDict``.
         '''
         d_info = {}
         mut_count_nt = self.antibody.v.nt_mutations.count + self.antibody.j.nt_mutations.count
@@ -187,6 +240,7 @@ class AbstarResult(object):
             ('seq_id', self.antibody.id),
             ('uid', self.antibody.uid),
             ('uaid', self.antibody.uid),
+            ('umi_count', self.antibody.umi_count),
             ('chain', self.antibody.chain),
             ('v_gene', {'full': self.antibody.v.full,
                         'fam': self.antibody.v.family,
@@ -323,28 +377,7 @@ class AbstarResult(object):
             ('align_info', align_info),  # TODO!!  Add things like V/D/J start and end positions, etc.
         ])
 
-        if self.keys is not None:
-            output = collections.OrderedDict([(k, v) for k, v in output.items() if k in self.keys])
-
-        if self.padding:
-            output['padding'] = ['n' * 100] * 10
-
-        # remove empty entries to save MongoDB space
-        for i in list(output.keys()):
-            if output[i] == "":
-                del output[i]
-            elif output[i] == []:
-                del output[i]
-            elif output[i] == {}:
-                del output[i]
-            elif output[i] == None:
-                del output[i]
-        if self.raw:
-            return output
-        if self.pretty:
-            return json.dumps(output, indent=4)
-        else:
-            return json.dumps(output)
+        return output
 
 
     def _build_minimal_output(self):
@@ -401,6 +434,56 @@ class AbstarResult(object):
         return ','.join(output.values())
 
 
+def format_json_output(record, pretty=False, padding=True, raw=False, keys=None):
+    '''
+    Formats a complete JSON record (as returned by ``AbstarResult.json_record``) for output.
+
+    Args:
+    -----
+
+        record (dict): JSON record.
+
+        pretty (bool): If ``True``, the JSON string will be indented. Default is ``False``.
+
+        padding (bool): If ``True``, adds padding to the output. Default is ``True``.
+
+        raw (bool): If ``True``, returns the formatted record as a dict rather than a JSON
+            string. Default is ``False``.
+
+        keys (list): Only the keys in ``keys`` will be included in the output. Default is
+            ``None``, which includes all keys.
+
+    Returns:
+    --------
+
+        str: JSON-formatted output string (or a dict, if ``raw`` is ``True``).
+    '''
+    if keys is not None:
+        output = collections.OrderedDict([(k, v) for k, v in record.items() if k in keys])
+    else:
+        output = collections.OrderedDict(record)
+
+    if padding:
+        output['padding'] = ['n' * 100] * 10
+
+    # remove empty entries to save MongoDB space
+    for i in list(output.keys()):
+        if output[i] == "":
+            del output[i]
+        elif output[i] == []:
+            del output[i]
+        elif output[i] == {}:
+            del output[i]
+        elif output[i] == None:
+            del output[i]
+    if raw:
+        return output
+    if pretty:
+        return json.dumps(output, indent=4)
+    else:
+        return json.dumps(output)
+
+
 def get_header(output_type):
     if output_type == 'minimal':
         return ','.join(MINIMAL_HEADER)
@@ -416,12 +499,21 @@ def get_output(result, output_type):
         return result.imgt_output
     elif output_type.lower() == 'minimal':
         return result.minimal_output
+    elif output_type.lower() == 'mongodb':
+        return result.mongodb_output
+    elif output_type.lower() == 'sqlite':
+        return result.sqlite_output
     else:
         return result.json_output
 
 
-def write_output(outputs, outfiles):
-    for _outputs, outfile in zip(outputs, outfiles):
+def write_output(outputs, outfiles, output_types=None):
+    if output_types is None:
+        output_types = [None] * len(outfiles)
+    for _outputs, outfile, output_type in zip(outputs, outfiles, output_types):
+        if output_type == 'sqlite':
+            write_sqlite(_outputs, outfile)
+            continue
         with open(outfile, 'w') as f:
             f.write('\n'.join(_outputs))
 
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# filename: payload.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import base64
+import os
+import zlib
+
+
+# Celery's JSON serializer can't send bytes, so file contents are
+# zlib-compressed and base64-encoded before they're added to a message
+COMPRESSION_LEVEL = 6
+
+
+def encode_payload(data):
+    '''
+    Compresses and encodes ``data`` (bytes) as an ASCII string.
+    '''
+    return base64.b64encode(zlib.compress(data, COMPRESSION_LEVEL)).decode('ascii')
+
+
+def decode_payload(payload):
+    '''
+    Decodes a string created by ``encode_payload()``.
+    '''
+    return zlib.decompress(base64.b64decode(payload.encode('ascii')))
+
+
+def encode_file(path):
+    '''
+    Returns the encoded contents of ``path``, or ``None`` if ``path`` doesn't exist.
+    '''
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return encode_payload(f.read())
+
+
+def decode_file(payload, path):
+    '''
+    Writes the decoded contents of ``payload`` to ``path``. If ``payload`` is ``None``,
+    an empty file is written.
+    '''
+    with open(path, 'wb') as f:
+        if payload is not None:
+            f.write(decode_payload(payload))
+    return path
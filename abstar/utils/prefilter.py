@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# filename: prefilter.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from ..core.germline import get_ungapped_germline_sequences
+
+
+DEFAULT_KMER_SIZE = 13
+
+DEFAULT_MIN_KMERS = 3
+
+# each germline k-mer is tagged with a bitmask of the chains it was found in,
+# using the chain's index in CHAINS as the bit position
+CHAINS = ['heavy', 'kappa', 'lambda']
+
+# a read is only routed to a single chain if the top chain has at least
+# CHAIN_MARGIN times as many k-mer matches as any other chain
+CHAIN_MARGIN = 2
+
+# similarly, a read's orientation is only determined if one orientation has at
+# least STRAND_MARGIN times as many k-mer matches as the other
+STRAND_MARGIN = 2
+
+# nucleotides are encoded as 2-bit values (A=0, C=1, G=2, T=3), so the
+# complement of a nucleotide is (3 - code). Everything else is encoded as 4.
+NT_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _nt in enumerate('ACGT'):
+    NT_CODES[ord(_nt)] = _i
+    NT_CODES[ord(_nt.lower())] = _i
+
+_KMER_INDEXES = {}
+
+
+class KmerIndex(object):
+    '''
+    Index of all k-mers found in a species' V-gene germline database.
+
+    Germline k-mers are stored as sorted arrays of 2-bit encoded integers: one for the
+    germline sequences and one for their reverse complements. Querying the forward read
+    against the reverse complement germline k-mers is equivalent to querying the reverse
+    complement of the read against the germline k-mers, so reads never need to be
+    reverse complemented. Each germline k-mer array has a matching array of chain bitmasks
+    (see ``CHAINS``), which is used to determine the likely chain of a read.
+    '''
+    # read-only arrays that can be shared between processes (see ``utils.arena``)
+    SHARED_ARRAYS = ['forward', 'forward_chains', 'reverse', 'reverse_chains']
+
+    def __init__(self, species, k=DEFAULT_KMER_SIZE):
+        super(KmerIndex, self).__init__()
+        if not 0 < k < 32:
+            raise ValueError('k-mer size must be between 1 and 31, got {}'.format(k))
+        self.species = species
+        self.k = k
+        germlines = get_ungapped_germline_sequences(species, 'V')
+        self.forward, self.forward_chains = _build_index(germlines, k)
+        self.reverse, self.reverse_chains = _build_index(germlines, k, reverse_complement=True)
+
+
+    def __len__(self):
+        return len(self.forward)
+
+
+    def count(self, sequences):
+        '''
+        Counts the k-mers shared by each sequence and the germline database.
+
+        Args:
+        -----
+
+            sequences (list): An iterable of sequences (as strings).
+
+        Returns:
+        --------
+
+            tuple: Two integer arrays, containing the number of k-mers that match
+                germline k-mers in the forward orientation and in the reverse
+                complement orientation, respectively.
+        '''
+        sequences = list(sequences)
+        if not sequences:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        starts, codes, valid = self._query_kmers(sequences)
+        forward, _ = _lookup(codes, self.forward, self.forward_chains)
+        reverse, _ = _lookup(codes, self.reverse, self.reverse_chains)
+        return (np.add.reduceat((valid & forward).astype(np.int64), starts),
+                np.add.reduceat((valid & reverse).astype(np.int64), starts))
+
+
+    def chain_counts(self, sequences):
+        '''
+        Counts the k-mers shared by each sequence and the germline genes of each chain.
+
+        Args:
+        -----
+
+            sequences (list): An iterable of sequences (as strings).
+
+        Returns:
+        --------
+
+            np.ndarray: An integer array with a row for each sequence and a column for each
+                chain in ``CHAINS``. Counts are from the orientation (forward or reverse
+                complement) with the most matches for that chain.
+        '''
+        sequences = list(sequences)
+        if not sequences:
+            return np.zeros((0, len(CHAINS)), dtype=np.int64)
+        starts, codes, valid = self._query_kmers(sequences)
+        forward, forward_chains = _lookup(codes, self.forward, self.forward_chains)
+        reverse, reverse_chains = _lookup(codes, self.reverse, self.reverse_chains)
+        counts = np.zeros((len(sequences), len(CHAINS)), dtype=np.int64)
+        for i in range(len(CHAINS)):
+            bit = np.uint8(1 << i)
+            f = np.add.reduceat((valid & forward & ((forward_chains & bit) > 0)).astype(np.int64), starts)
+            r = np.add.reduceat((valid & reverse & ((reverse_chains & bit) > 0)).astype(np.int64), starts)
+            counts[:, i] = np.maximum(f, r)
+        return counts
+
+
+    def classify(self, sequences, min_kmers=DEFAULT_MIN_KMERS):
+        '''
+        Determines the likely chain of each sequence.
+
+        Returns:
+        --------
+
+            list: The chain (``'heavy'``, ``'kappa'`` or ``'lambda'``) of each sequence, or ``None``
+                if the sequence has fewer than ``min_kmers`` matches to any chain, or if the top chain
+                doesn't have at least ``CHAIN_MARGIN`` times as many matches as the next best chain.
+        '''
+        counts = self.chain_counts(sequences)
+        chains = []
+        for row in counts.tolist():
+            ranked = sorted(range(len(CHAINS)), key=lambda i: row[i], reverse=True)
+            best = row[ranked[0]]
+            runner_up = row[ranked[1]]
+            if best >= min_kmers and best >= CHAIN_MARGIN * runner_up:
+                chains.append(CHAINS[ranked[0]])
+            else:
+                chains.append(None)
+        return chains
+
+
+    def orient(self, sequences, min_kmers=DEFAULT_MIN_KMERS):
+        '''
+        Determines the orientation of each sequence, relative to the germline genes.
+
+        Args:
+        -----
+
+            sequences (list): An iterable of sequences (as strings).
+
+            min_kmers (int): Minimum number of matching k-mers for a confident orientation.
+
+        Returns:
+        --------
+
+            list: The orientation of each sequence: ``'plus'`` if the sequence is in the same
+                orientation as the germline genes, ``'minus'`` if it is the reverse complement,
+                or ``None`` if the orientation couldn't be confidently determined.
+        '''
+        forward, reverse = self.count(sequences)
+        strands = []
+        for f, r in zip(forward.tolist(), reverse.tolist()):
+            if f >= min_kmers and f >= STRAND_MARGIN * r:
+                strands.append('plus')
+            elif r >= min_kmers and r >= STRAND_MARGIN * f:
+                strands.append('minus')
+            else:
+                strands.append(None)
+        return strands
+
+
+    def _query_kmers(self, sequences):
+        '''
+        Computes k-mers for a list of sequences. All sequences are joined (separated by
+        an ambiguous nucleotide) into a single array, so that k-mers spanning two sequences
+        are always invalid.
+
+        Returns:
+        --------
+
+            tuple: The position of each sequence's first k-mer, the k-mer codes and a boolean
+                array indicating which k-mers are valid.
+        '''
+        lengths = np.array([len(s) + 1 for s in sequences], dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        joined = 'N'.join(sequences) + 'N' * self.k
+        codes, valid = kmer_codes(encode_sequence(joined), self.k)
+        return starts, codes, valid
+
+
+
+class Prefilter(object):
+    '''
+    Screens out reads that don't contain an antibody V-gene before germline assignment.
+
+    Reads that share fewer than ``min_kmers`` k-mers with every V-gene in the germline
+    database (in either orientation) are removed. Primer dimers, PhiX and off-target
+    amplicons share few, if any, k-mers with the V-gene database, but even a heavily mutated
+    V-gene will share dozens of k-mers with its germline gene.
+    '''
+    def __init__(self, species, k=DEFAULT_KMER_SIZE, min_kmers=DEFAULT_MIN_KMERS):
+        super(Prefilter, self).__init__()
+        self.index = get_kmer_index(species, k)
+        self.min_kmers = min_kmers
+
+
+    def __call__(self, sequences):
+        '''
+        Filters a list of sequences.
+
+        Args:
+        -----
+
+            sequences (list): A list of abutils ``Sequence`` objects.
+
+        Returns:
+        --------
+
+            tuple: A list of the sequences that passed the prefilter and a list
+                of the sequences that were removed.
+        '''
+        forward, reverse = self.index.count([s.sequence for s in sequences])
+        passed = np.maximum(forward, reverse) >= self.min_kmers
+        kept = [s for s, p in zip(sequences, passed.tolist()) if p]
+        removed = [s for s, p in zip(sequences, passed.tolist()) if not p]
+        return kept, removed
+
+
+
+def get_kmer_index(species, k=DEFAULT_KMER_SIZE):
+    '''
+    Returns the ``KmerIndex`` for ``species``. Indexes are only built once per process.
+    '''
+    key = (species.lower(), k)
+    if key not in _KMER_INDEXES:
+        _KMER_INDEXES[key] = KmerIndex(species, k)
+    return _KMER_INDEXES[key]
+
+
+def kmers(sequence, k, reverse_complement=False):
+    '''
+    Returns a sorted array of the unique, 2-bit encoded k-mers in ``sequence``.
+    K-mers that contain ambiguous nucleotides are ignored.
+    '''
+    encoded = encode_sequence(sequence)
+    if reverse_complement:
+        encoded = np.where(encoded < 4, 3 - encoded, encoded)[::-1]
+    codes, valid = kmer_codes(encoded, k)
+    return np.unique(codes[valid])
+
+
+def encode_sequence(sequence):
+    '''
+    Encodes a nucleotide sequence as a uint8 array of 2-bit nucleotide codes (see ``NT_CODES``).
+    '''
+    return NT_CODES[np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)]
+
+
+def kmer_codes(encoded, k):
+    '''
+    Computes the 2-bit encoded k-mer starting at each position of an encoded sequence.
+
+    Returns:
+    --------
+
+        tuple: A uint64 array of k-mer codes, and a boolean array indicating which
+            k-mers are valid (contain only ``ACGT``).
+    '''
+    n = len(encoded) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    codes = np.zeros(n, dtype=np.uint64)
+    valid = np.ones(n, dtype=bool)
+    two = np.uint64(2)
+    for i in range(k):
+        window = encoded[i:i + n]
+        valid &= window < 4
+        codes = (codes << two) | (window & 3).astype(np.uint64)
+    return codes, valid
+
+
+def _build_index(germlines, k, reverse_complement=False):
+    '''
+    Builds a sorted array of unique germline k-mers, and a matching array of chain bitmasks.
+    '''
+    codes = []
+    chains = []
+    for g in germlines:
+        c = kmers(g.sequence, k, reverse_complement=reverse_complement)
+        chain = germline_chain(g.id)
+        bit = 1 << CHAINS.index(chain) if chain in CHAINS else 0
+        codes.append(c)
+        chains.append(np.full(len(c), bit, dtype=np.uint8))
+    if not codes:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint8)
+    index, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+    masks = np.zeros(len(index), dtype=np.uint8)
+    np.bitwise_or.at(masks, inverse.ravel(), np.concatenate(chains))
+    return index, masks
+
+
+def germline_chain(name):
+    '''
+    Returns the chain of a germline gene, using IMGT-style names (like IGHV1-2*02).
+    '''
+    c = {'H': 'heavy',
+         'K': 'kappa',
+         'L': 'lambda'}
+    return c.get(name[2:3].upper(), None)
+
+
+def _lookup(codes, index, chains):
+    '''
+    Looks up k-mer codes in a germline k-mer index.
+
+    Returns:
+    --------
+
+        tuple: A boolean array indicating which k-mers were found, and the chain bitmask
+            for each k-mer (0 for k-mers that weren't found).
+    '''
+    if len(index) == 0:
+        return np.zeros(len(codes), dtype=bool), np.zeros(len(codes), dtype=np.uint8)
+    positions = np.minimum(np.searchsorted(index, codes), len(index) - 1)
+    found = index[positions] == codes
+    return found, np.where(found, chains[positions], 0).astype(np.uint8)
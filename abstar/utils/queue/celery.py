@@ -28,5 +28,14 @@ celery = Celery(include=['abstar.core.abstar'])
 celery.config_from_object('abstar.celeryconfig')
 
 
+# AbStar tasks are registered here, rather than with a decorator where they're defined,
+# so that Celery only needs to be imported when AbStar is running on a cluster.
+# Task names are unchanged, so existing workers remain compatible. Task start times
+# are tracked so that straggling tasks can be identified and re-dispatched.
+from abstar.core.abstar import run_abstar, run_abstar_batch
+run_abstar_task = celery.task(name='abstar.core.abstar.run_abstar', track_started=True)(run_abstar)
+run_abstar_batch_task = celery.task(name='abstar.core.abstar.run_abstar_batch', track_started=True)(run_abstar_batch)
+
+
 if __name__ == '__main__':
     celery.start()
@@ -29,11 +29,12 @@ import re
 import sys
 import traceback
 
-from Bio.Seq import Seq
-from Bio.Alphabet import generic_dna
+import numpy as np
 
 from abutils.utils import log
 
+from .translation import translate
+
 
 
 # Both IMGT_REGION_END_POSITIONS_AA and IMGT_REGION_END_POSITIONS_NT use the actual
@@ -92,10 +93,9 @@ class BaseRegions(object):
         means that the end point of FR1 should be identical to the start point of CDR1.
         '''
         if self._raw_nt_positions is None:
+            starts, ends = self._raw_region_positions_nt()
             pos = {}
-            for region in self.region_names:
-                start = self._raw_region_start_position_nt(region)
-                end = self._raw_region_end_position_nt(region)
+            for region, start, end in zip(self.region_names, starts, ends):
                 pos[region] = [start, end]
             self._raw_nt_positions = pos
         return self._raw_nt_positions
@@ -188,55 +188,52 @@ class BaseRegions(object):
                     to_translate[region] = region_nt
             # translate the sequences for each region
             for region, nt_seq in to_translate.items():
-                aa_seq = str(Seq(nt_seq, generic_dna).translate())
+                aa_seq = translate(nt_seq)
                 aa_seqs[region] = aa_seq
             self._aa_seqs = aa_seqs
         return self._aa_seqs
 
 
-    def _raw_region_start_position_nt(self, region):
-        # get the raw start position of the region
-        imgt_start = IMGT_REGION_START_POSITIONS_NT[region]
-        # if there isn't a direct equivalent to the IMGT region start position,
-        # that could be because the qyuery sequence is truncated (and the start of the
-        # region isn't present in the query sequence) or it could be because a deletion
-        # removed the region start position.
-        # First, let's check to see if there's any query sequence prior to the start of
-        # the region.
-        if imgt_start > max([p for p in self.segment._imgt_position_from_raw.values() if p is not None]):
-            return None
-        # If there's sequence prior to the start of the region but the region start position
-        # isn't present, we must have a deletion that removed the region start position. In
-        # this case, we just scan forward in the sequence to find the earliest non-deleted
-        # position in the region and use that as the region start position
-        while self.segment.get_raw_position_from_imgt(imgt_start) is None:
-            # we don't want to keep going past the end of the region so only keep looking
-            # for the end of the deletion until we reach the start of the next region
-            if imgt_start >= IMGT_REGION_END_POSITIONS_NT[region]:
-                break
-            imgt_start += 1
-        return self.segment.get_raw_position_from_imgt(imgt_start)
-
-
-
-    def _raw_region_end_position_nt(self, region):
-        imgt_end = IMGT_REGION_END_POSITIONS_NT[region]
-        # if the end position of the region just happens to be part of a deletion,
-        # or if the query sequence doesn't contain the region, then there isn't a
-        # corresponding raw sequence position.
-        # First, check to see if the query sequence begins after the end of the region
-        if imgt_end < min([p for p in self.segment._imgt_position_from_raw.values() if p is not None]):
-            return None
-        # Now we need to try to find the start of a deletion that includes the region
-        # end position
-        while self.segment.get_raw_position_from_imgt(imgt_end) is None:
-            imgt_end -= 1
-            # we don't want to move all the way back into a different region,
-            # so only keep looking for the start of the deletion until we
-            # reach the start of the region
-            if imgt_end < IMGT_REGION_START_POSITIONS_NT[region]:
-                break
-        return self.segment.get_raw_position_from_imgt(imgt_end) + 1
+    def _raw_region_positions_nt(self):
+        '''
+        Computes the raw start and end positions for all regions in a single pass
+        over the segment's IMGT-to-raw position map.
+
+        Returns:
+        --------
+
+            tuple: lists of start and end positions, in the same order as ``region_names``.
+                Positions that couldn't be identified are ``None``.
+        '''
+        raw_from_imgt = self.segment._raw_position_from_imgt
+        # IMGT positions (in ascending order) that have an equivalent raw position
+        numbered = np.flatnonzero(raw_from_imgt >= 0)
+        if numbered.size == 0:
+            return [None] * len(self.region_names), [None] * len(self.region_names)
+        imgt_starts = np.array([IMGT_REGION_START_POSITIONS_NT[r] for r in self.region_names])
+        imgt_ends = np.array([IMGT_REGION_END_POSITIONS_NT[r] for r in self.region_names])
+
+        # If there isn't a direct equivalent to the IMGT region start position, that
+        # could be because the query sequence is truncated (and the start of the region isn't
+        # present in the query sequence) or it could be because a deletion removed the region
+        # start position. In the latter case, we use the earliest non-deleted position in the
+        # region as the region start position. So the start is the first numbered position at
+        # or after the IMGT region start, as long as it doesn't run past the end of the region.
+        start_index = np.searchsorted(numbered, imgt_starts, side='left')
+        start_imgt = numbered[np.minimum(start_index, numbered.size - 1)]
+        has_start = (start_index < numbered.size) & (start_imgt <= imgt_ends)
+
+        # Similarly, if the end position of the region is part of a deletion (or the query
+        # sequence doesn't contain the end of the region), we look back for the start of the
+        # deletion, but not past the position immediately before the start of the region.
+        end_index = np.searchsorted(numbered, imgt_ends, side='right') - 1
+        end_imgt = numbered[np.maximum(end_index, 0)]
+        has_end = (end_index >= 0) & (end_imgt >= imgt_starts - 1)
+
+        starts = [int(raw_from_imgt[p]) if h else None for p, h in zip(start_imgt, has_start)]
+        # end points are designed for slicing, so they're 1 position beyond the actual end
+        ends = [int(raw_from_imgt[p]) + 1 if h else None for p, h in zip(end_imgt, has_end)]
+        return starts, ends
 
 
     def _get_first_region(self):
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# filename: sqlite.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import sqlite3
+
+
+SQLITE_TABLE = 'annotations'
+
+# core fields get their own (indexable) columns. The complete JSON record,
+# including all of the nested data, is stored in the 'data' column and can
+# be queried with SQLite's JSON functions (for example, json_extract(data, '$.v_gene.score'))
+SQLITE_COLUMNS = [('seq_id', 'TEXT'),
+                  ('chain', 'TEXT'),
+                  ('v_full', 'TEXT'),
+                  ('v_gene', 'TEXT'),
+                  ('d_full', 'TEXT'),
+                  ('d_gene', 'TEXT'),
+                  ('j_full', 'TEXT'),
+                  ('j_gene', 'TEXT'),
+                  ('cdr3_aa', 'TEXT'),
+                  ('cdr3_len', 'INTEGER'),
+                  ('v_identity_nt', 'REAL'),
+                  ('v_identity_aa', 'REAL'),
+                  ('productive', 'TEXT'),
+                  ('isotype', 'TEXT'),
+                  ('umi_count', 'INTEGER'),
+                  ('data', 'TEXT')]
+
+SQLITE_INDEXES = ['seq_id', 'v_gene', 'd_gene', 'j_gene', 'cdr3_aa']
+
+
+def sqlite_row(record):
+    '''
+    Builds a row for the annotations table from a formatted JSON record.
+
+    Args:
+    -----
+
+        record (dict): JSON record, as returned by ``format_json_output(raw=True)``.
+
+    Returns:
+    --------
+
+        tuple: Column values, in the same order as ``SQLITE_COLUMNS``.
+    '''
+    v = record.get('v_gene', {})
+    d = record.get('d_gene', {})
+    j = record.get('j_gene', {})
+    return (record.get('seq_id'),
+            record.get('chain'),
+            v.get('full'),
+            v.get('gene'),
+            d.get('full'),
+            d.get('gene'),
+            j.get('full'),
+            j.get('gene'),
+            record.get('cdr3_aa'),
+            record.get('cdr3_len'),
+            record.get('nt_identity', {}).get('v'),
+            record.get('aa_identity', {}).get('v'),
+            record.get('prod'),
+            record.get('isotype'),
+            record.get('umi_count'),
+            json.dumps(record))
+
+
+def write_sqlite(rows, db_file):
+    '''
+    Writes annotation rows (see ``sqlite_row()``) to a new SQLite database. No indexes
+    are created, since per-job databases are only used to build the merged output.
+    '''
+    if os.path.isfile(db_file):
+        os.unlink(db_file)
+    conn = sqlite3.connect(db_file)
+    with conn:
+        _create_table(conn)
+        conn.executemany(_insert_statement(), rows)
+    conn.close()
+
+
+def merge_sqlite(db_files, output_file):
+    '''
+    Merges per-job SQLite databases into a single, indexed SQLite database. Each job
+    database is attached and bulk-copied into the output database, and indexes are
+    built once all of the rows have been loaded.
+
+    Args:
+    -----
+
+        db_files (list): Paths to the job databases.
+
+        output_file (str): Path to the merged database. If it exists, it will be overwritten.
+    '''
+    if os.path.isfile(output_file):
+        os.unlink(output_file)
+    conn = sqlite3.connect(output_file, isolation_level=None)
+    # the output file is rebuilt from scratch if anything goes wrong,
+    # so there's no need for a rollback journal during the load
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    _create_table(conn)
+    columns = ', '.join([c[0] for c in SQLITE_COLUMNS])
+    for db_file in db_files:
+        if not os.path.isfile(db_file):
+            continue
+        conn.execute('ATTACH DATABASE ? AS job', (db_file, ))
+        conn.execute('BEGIN')
+        conn.execute('INSERT INTO {0} ({1}) SELECT {1} FROM job.{0}'.format(SQLITE_TABLE, columns))
+        conn.execute('COMMIT')
+        conn.execute('DETACH DATABASE job')
+    for column in SQLITE_INDEXES:
+        conn.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(SQLITE_TABLE, column))
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def _create_table(conn):
+    columns = ', '.join(['{} {}'.format(name, dtype) for name, dtype in SQLITE_COLUMNS])
+    conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(SQLITE_TABLE, columns))
+
+
+def _insert_statement():
+    return 'INSERT INTO {} VALUES ({})'.format(SQLITE_TABLE, ', '.join(['?'] * len(SQLITE_COLUMNS)))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# filename: stragglers.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from contextlib import contextmanager
+import signal
+import threading
+import time
+
+
+# jobs are only compared to the median job time once this many jobs have finished
+MIN_FINISHED_JOBS = 3
+
+# straggling jobs are split into (at most) this many sub-jobs when they're re-dispatched
+SPECULATIVE_SPLITS = 4
+
+
+class SequenceTimeout(Exception):
+    pass
+
+
+
+@contextmanager
+def time_limit(seconds):
+    '''
+    Raises ``SequenceTimeout`` if the body of the ``with`` block runs for longer than ``seconds``.
+
+    The time limit is enforced with ``SIGALRM``, so it's only used in the main thread
+    of a process (which is where AbStar jobs run, in both multiprocessing and Celery workers)
+    and on platforms that support ``signal.setitimer()``. Otherwise, or if ``seconds`` is 0,
+    there is no time limit.
+
+    The limit is best-effort. Python only handles the signal between bytecode instructions,
+    so a call into C code (or a wait on a subprocess, like BLASTn) isn't interrupted, and
+    ``SequenceTimeout`` is raised once the call returns.
+    '''
+    if not seconds or not _alarm_available():
+        yield
+        return
+
+    def _timeout(signum, frame):
+        raise SequenceTimeout('time limit of {} seconds was exceeded'.format(seconds))
+
+    previous = signal.signal(signal.SIGALRM, _timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+
+class StragglerTracker(object):
+    '''
+    Tracks job run times and identifies stragglers.
+
+    A running job is a straggler if it has been running for longer than ``timeout`` seconds,
+    or for more than ``factor`` times the median run time of finished jobs. Each job is only
+    reported as a straggler once.
+
+    Args:
+    -----
+
+        factor (float): Jobs that run for more than ``factor`` times the median job time
+            are stragglers. Default is 0, which disables the comparison to the median.
+
+        timeout (float): Jobs that run for longer than this (in seconds) are stragglers.
+            Default is 0, which disables the time limit.
+
+        min_finished (int): The median job time is only used once this many jobs have finished.
+    '''
+    def __init__(self, factor=0, timeout=0, min_finished=MIN_FINISHED_JOBS):
+        super(StragglerTracker, self).__init__()
+        self.factor = float(factor)
+        self.timeout = float(timeout)
+        self.min_finished = int(min_finished)
+        self.starts = {}
+        self.durations = {}
+        self.flagged = set()
+
+
+    @property
+    def enabled(self):
+        return any([self.factor > 0, self.timeout > 0])
+
+
+    @property
+    def median(self):
+        if not self.durations:
+            return None
+        durations = sorted(self.durations.values())
+        mid = len(durations) // 2
+        if len(durations) % 2:
+            return durations[mid]
+        return (durations[mid - 1] + durations[mid]) / 2.
+
+
+    def started(self, job, start_time=None):
+        if job not in self.starts:
+            self.starts[job] = start_time if start_time is not None else time.time()
+
+
+    def finished(self, job, end_time=None):
+        if job in self.starts and job not in self.durations:
+            end_time = end_time if end_time is not None else time.time()
+            self.durations[job] = end_time - self.starts[job]
+
+
+    def stragglers(self, now=None):
+        '''
+        Returns the running jobs that have become stragglers since the last call.
+        '''
+        now = now if now is not None else time.time()
+        limits = []
+        if self.timeout > 0:
+            limits.append(self.timeout)
+        if self.factor > 0 and len(self.durations) >= self.min_finished:
+            limits.append(self.factor * self.median)
+        if not limits:
+            return []
+        limit = min(limits)
+        stragglers = []
+        for job, start_time in self.starts.items():
+            if job in self.durations or job in self.flagged:
+                continue
+            if now - start_time > limit:
+                self.flagged.add(job)
+                stragglers.append(job)
+        return stragglers
+
+
+
+def _alarm_available():
+    if not hasattr(signal, 'setitimer'):
+        return False
+    return isinstance(threading.current_thread(), threading._MainThread)
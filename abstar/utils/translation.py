@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# filename: translation.py
+
+#
+# Copyright (c) 2016 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+
+# Nucleotides are indexed in TCAG order, so a codon's index in the 64-codon
+# table is (16 * first) + (4 * second) + third.
+NUCLEOTIDES = 'TCAG'
+
+STANDARD_CODON_TABLE = 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'
+
+NT_INDEXES = np.full(256, -1, dtype=np.int64)
+for _i, _nt in enumerate(NUCLEOTIDES):
+    NT_INDEXES[ord(_nt)] = _i
+
+CODON_TABLE = np.frombuffer(STANDARD_CODON_TABLE.encode('ascii'), dtype=np.uint8)
+
+CODONS = dict(zip([a + b + c for a in NUCLEOTIDES for b in NUCLEOTIDES for c in NUCLEOTIDES],
+                  STANDARD_CODON_TABLE))
+
+# below this length, per-codon dict lookups are faster than the array setup
+ARRAY_TRANSLATION_MIN_LENGTH = 150
+
+# translations of codons containing ambiguous (or otherwise non-ACGT) nucleotides
+_NONSTANDARD_CODON_CACHE = {}
+
+
+def translate(sequence):
+    '''
+    Translates a nucleotide sequence using the standard genetic code.
+
+    Translation is equivalent to ``str(Seq(sequence, generic_dna).translate())``:
+    the sequence is translated in the first reading frame, a partial codon at the
+    end of the sequence is ignored, and stop codons are translated as ``'*'``.
+    Codons composed entirely of ``ACGT`` are translated with a lookup table (using an
+    array lookup over the entire sequence for longer sequences). Codons
+    that contain anything else (ambiguous nucleotides, gaps, etc) are translated by
+    Biopython, so they're handled (or rejected) exactly as before. Those translations
+    are cached, since the same handful of ambiguous codons show up over and over.
+
+    Args:
+    -----
+
+        sequence (str): Nucleotide sequence to be translated.
+
+    Returns:
+    --------
+
+        str: Translated amino acid sequence.
+    '''
+    coding_length = len(sequence) - (len(sequence) % 3)
+    if coding_length == 0:
+        return ''
+    coding = sequence[:coding_length].upper()
+    if coding_length < ARRAY_TRANSLATION_MIN_LENGTH:
+        return ''.join([CODONS.get(coding[i:i + 3]) or _translate_nonstandard_codon(coding[i:i + 3])
+                        for i in range(0, coding_length, 3)])
+    codon_array = np.frombuffer(coding.encode('ascii'), dtype=np.uint8).reshape(-1, 3)
+    indexes, nonstandard = codon_indexes(codon_array)
+    aas = CODON_TABLE[indexes]
+    for i in np.flatnonzero(nonstandard).tolist():
+        aas[i] = ord(_translate_nonstandard_codon(coding[i * 3:i * 3 + 3]))
+    return aas.tobytes().decode('ascii')
+
+
+def codon_indexes(codon_array):
+    '''
+    Computes 64-codon table indexes for an array of codons.
+
+    Args:
+    -----
+
+        codon_array (np.ndarray): Nx3 uint8 array of (uppercase) codon ASCII codes.
+
+    Returns:
+    --------
+
+        tuple: an array of codon table indexes and a boolean array indicating which
+            codons contain something other than ``ACGT``. Table indexes for those
+            codons are set to 0, so they must be translated separately.
+    '''
+    nt_indexes = NT_INDEXES[codon_array]
+    nonstandard = (nt_indexes < 0).any(axis=1)
+    indexes = nt_indexes[:, 0] * 16 + nt_indexes[:, 1] * 4 + nt_indexes[:, 2]
+    indexes[nonstandard] = 0
+    return indexes, nonstandard
+
+
+def _translate_nonstandard_codon(codon):
+    if codon not in _NONSTANDARD_CODON_CACHE:
+        from Bio.Seq import Seq
+        from Bio.Alphabet import generic_dna
+        _NONSTANDARD_CODON_CACHE[codon] = str(Seq(codon, generic_dna).translate())
+    return _NONSTANDARD_CODON_CACHE[codon]
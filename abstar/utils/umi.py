@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# filename: umi.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import Counter
+import os
+import re
+import zlib
+
+import numpy as np
+
+
+# consensus sequence IDs are the ID of the first read in the UMI group,
+# followed by the number of reads in the group (usearch-style)
+UMI_COUNT_SUFFIX = ';size={}'
+UMI_COUNT_PATTERN = re.compile(r';size=(\d+)$')
+
+# reads are distributed across bucket files by UMI, so that only
+# a single bucket needs to be held in memory at a time
+DEFAULT_BUCKETS = 64
+
+CONSENSUS_BASES = 'ACGTN'
+
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _nt in enumerate('ACGT'):
+    BASE_CODES[ord(_nt)] = _i
+    BASE_CODES[ord(_nt.lower())] = _i
+
+
+def build_umi_consensus(seq_file, file_format, uid, temp_dir, buckets=DEFAULT_BUCKETS):
+    '''
+    Groups reads by UMI and builds a single consensus sequence for each UMI.
+
+    Args:
+    -----
+
+        seq_file (str): Path to a FASTA or FASTQ-formatted sequence file.
+
+        file_format (str): Format of ``seq_file``. Either ``'fasta'`` or ``'fastq'``.
+
+        uid (int): Length of the UMI. If positive, the UMI is the start of each read. If
+            negative, the UMI is the end of each read.
+
+        temp_dir (str): Directory for the bucket and consensus files.
+
+        buckets (int): Number of bucket files. Default is 64.
+
+    Returns:
+    --------
+
+        tuple: The path to a FASTA-formatted file of consensus sequences, the number of input
+            reads, the number of consensus sequences and the number of reads that were excluded
+            from their group's consensus because their length differed from the group's most common
+            length. Consensus sequence IDs are the ID of the first read in each UMI group, followed
+            by ``;size=N``, where ``N`` is the number of reads that contributed to the consensus.
+    '''
+    from Bio import SeqIO
+    prefix = os.path.join(temp_dir, os.path.basename(seq_file))
+    bucket_files = ['{}.umi_{}'.format(prefix, i) for i in range(buckets)]
+    handles = [open(b, 'w') for b in bucket_files]
+    read_count = 0
+    try:
+        with open(seq_file, 'r') as f:
+            for read in SeqIO.parse(f, file_format.lower()):
+                seq = str(read.seq)
+                umi = seq[:uid] if uid >= 0 else seq[uid:]
+                if 'phred_quality' in read.letter_annotations:
+                    qual = ','.join([str(q) for q in read.letter_annotations['phred_quality']])
+                else:
+                    qual = ''
+                b = zlib.crc32(umi.encode('ascii')) % buckets
+                handles[b].write('\t'.join([umi, read.id, seq, qual]) + '\n')
+                read_count += 1
+    finally:
+        for h in handles:
+            h.close()
+    consensus_file = prefix + '.umi_consensus'
+    consensus_count = 0
+    dropped_count = 0
+    with open(consensus_file, 'w') as f:
+        for bucket_file in bucket_files:
+            for seq_id, seq, dropped in _bucket_consensus(bucket_file):
+                f.write('>{}\n{}\n'.format(seq_id, seq))
+                consensus_count += 1
+                dropped_count += dropped
+            os.unlink(bucket_file)
+    return consensus_file, read_count, consensus_count, dropped_count
+
+
+def consensus(sequences, qualities=None):
+    '''
+    Computes a consensus sequence by (quality-weighted) majority vote at each position.
+
+    Args:
+    -----
+
+        sequences (list): Sequences, as strings. Only sequences with the most common
+            length are used to compute the consensus.
+
+        qualities (list): Phred quality scores (a list of ints) for each sequence. If not
+            provided, each base gets an equal vote.
+
+    Returns:
+    --------
+
+        str: The consensus sequence. Positions at which ``N`` gets the most votes (or with
+            no votes at all) are ``N``.
+    '''
+    length = modal_length(sequences)
+    keep = [i for i, s in enumerate(sequences) if len(s) == length]
+    if len(keep) == 1:
+        return sequences[keep[0]]
+    codes = np.array([BASE_CODES[np.frombuffer(sequences[i].encode('ascii'), dtype=np.uint8)] for i in keep])
+    if qualities is not None:
+        weights = np.array([qualities[i] for i in keep], dtype=np.float64)
+    else:
+        weights = np.ones(codes.shape, dtype=np.float64)
+    votes = np.zeros((len(CONSENSUS_BASES), length), dtype=np.float64)
+    positions = np.broadcast_to(np.arange(length), codes.shape)
+    np.add.at(votes, (codes.ravel(), positions.ravel()), weights.ravel())
+    # ambiguous bases don't get a vote unless nothing else does
+    best = np.argmax(votes[:4], axis=0)
+    best[votes[:4].max(axis=0) == 0] = 4
+    return ''.join([CONSENSUS_BASES[b] for b in best.tolist()])
+
+
+def modal_length(sequences):
+    '''
+    Returns the most common sequence length. Ties go to the length that appears first.
+    '''
+    return Counter([len(s) for s in sequences]).most_common(1)[0][0]
+
+
+def parse_umi_count(seq_id):
+    '''
+    Parses the number of reads from a consensus sequence ID.
+
+    Returns:
+    --------
+
+        tuple: The sequence ID (without the read count) and the read count, or the
+            unmodified sequence ID and ``None`` if the ID doesn't contain a read count.
+    '''
+    match = UMI_COUNT_PATTERN.search(seq_id)
+    if match is None:
+        return seq_id, None
+    return seq_id[:match.start()], int(match.group(1))
+
+
+def _bucket_consensus(bucket_file):
+    groups = {}
+    order = []
+    with open(bucket_file) as f:
+        for line in f:
+            umi, seq_id, seq, qual = line.rstrip('\n').split('\t')
+            if umi not in groups:
+                groups[umi] = []
+                order.append(umi)
+            groups[umi].append((seq_id, seq, qual))
+    for umi in order:
+        reads = groups[umi]
+        seqs = [r[1] for r in reads]
+        if all([r[2] for r in reads]):
+            quals = [[int(q) for q in r[2].split(',')] for r in reads]
+        else:
+            quals = None
+        # only reads with the most common length contribute to the consensus
+        length = modal_length(seqs)
+        used = len([s for s in seqs if len(s) == length])
+        seq_id = reads[0][0] + UMI_COUNT_SUFFIX.format(used)
+        yield seq_id, consensus(seqs, quals), len(reads) - used
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# filename: version.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+
+_VERSION = []
+
+
+def get_version():
+    '''
+    Returns the installed AbStar version, or ``None`` if AbStar isn't installed.
+
+    Uses ``importlib.metadata`` when it's available (Python 3.8+), which is much faster
+    than ``pkg_resources``. Older versions of Python fall back to the ``importlib_metadata``
+    backport or, failing that, ``pkg_resources``. The version is only looked up once.
+    '''
+    if not _VERSION:
+        _VERSION.append(_get_version())
+    return _VERSION[0]
+
+
+def _get_version():
+    try:
+        try:
+            from importlib.metadata import version
+        except ImportError:
+            from importlib_metadata import version
+        return version('abstar')
+    except ImportError:
+        pass
+    except Exception:
+        # importlib.metadata.PackageNotFoundError
+        return None
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('abstar').version
+    except Exception:
+        return None
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# filename: startup_time.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+'''
+Measures AbStar startup time.
+
+Each statement is run repeatedly in a fresh Python interpreter, so the timings include
+all module imports. This is the overhead paid by every CLI invocation, every spawned
+worker process and every short-lived ``abstar.run()`` call.
+
+Usage::
+
+    python benchmarks/startup_time.py [--repeats 10] [--importtime]
+'''
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from argparse import ArgumentParser
+import subprocess as sp
+import sys
+import time
+
+
+STATEMENTS = [('python', 'pass'),
+              ('import abstar', 'import abstar'),
+              ('abstar.__version__', 'import abstar; abstar.__version__'),
+              ('import abstar.core.abstar', 'import abstar.core.abstar'),
+              ('import Bio.SeqIO', 'import Bio.SeqIO'),
+              ('import celery', 'import celery'),
+              ('import pkg_resources', 'import pkg_resources')]
+
+
+def parse_arguments():
+    parser = ArgumentParser("Measures AbStar startup time.")
+    parser.add_argument('-r', '--repeats', dest='repeats', default=10, type=int,
+                        help="Number of times each statement is run. Default is 10.")
+    parser.add_argument('--importtime', dest='importtime', default=False, action='store_true',
+                        help="Also prints the 20 slowest imports for 'import abstar' \
+                        (requires Python 3.7+).")
+    return parser.parse_args()
+
+
+def time_statement(statement, repeats):
+    '''
+    Runs ``statement`` in ``repeats`` fresh interpreters. Returns a list of run times
+    (in milliseconds), or ``None`` if the statement fails (for example, if an optional
+    dependency isn't installed).
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        p = sp.Popen([sys.executable, '-c', statement], stdout=sp.PIPE, stderr=sp.PIPE)
+        p.communicate()
+        if p.returncode != 0:
+            return None
+        times.append(1000. * (time.time() - start))
+    return times
+
+
+def print_slowest_imports(n=20):
+    p = sp.Popen([sys.executable, '-X', 'importtime', '-c', 'import abstar'], stdout=sp.PIPE, stderr=sp.PIPE)
+    stdout, stderr = p.communicate()
+    imports = []
+    for line in stderr.decode('utf-8').split('\n'):
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, module = line.split('|')
+        imports.append((int(cumulative.strip()), module.rstrip()))
+    print('')
+    print('slowest imports (cumulative, ms):')
+    for cumulative, module in sorted(imports, reverse=True)[:n]:
+        print('{:>10.1f}  {}'.format(cumulative / 1000., module))
+
+
+def main():
+    args = parse_arguments()
+    print('')
+    print('{:<30}{:>12}{:>12}'.format('statement', 'min (ms)', 'median (ms)'))
+    print('-' * 54)
+    for name, statement in STATEMENTS:
+        times = time_statement(statement, args.repeats)
+        if times is None:
+            print('{:<30}{:>12}{:>12}'.format(name, '-', '-'))
+            continue
+        times.sort()
+        print('{:<30}{:>12.1f}{:>12.1f}'.format(name, times[0], times[len(times) // 2]))
+    if args.importtime:
+        print_slowest_imports()
+
+
+if __name__ == '__main__':
+    main()
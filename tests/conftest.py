@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# filename: conftest.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import random
+
+import pytest
+
+from abstar.core.germline import GermlineSegment, get_imgt_germlines
+
+
+class FakeAlignment(object):
+    def __init__(self, target_begin):
+        self.target_begin = target_begin
+
+
+
+class FakeAntibody(object):
+    '''
+    Just enough of an ``Antibody`` for mutation calling and region identification.
+    '''
+    def __init__(self, v=None, j=None, oriented_input=None, v_rf_offset=0):
+        self.v = v
+        self.j = j
+        self.oriented_input = oriented_input
+        self.v_rf_offset = v_rf_offset
+        self.logs = []
+        self.exceptions = []
+
+    def log(self, *args, **kwargs):
+        self.logs.append(' '.join([str(a) for a in args]))
+
+    def exception(self, *args, **kwargs):
+        self.exceptions.append('\n'.join([str(a) for a in args]))
+
+
+
+def germline_alignment(gene, species='human', target_begin=0):
+    '''
+    Returns the ungapped germline sequence that IMGT numbering expects to be aligned
+    to the gapped IMGT germline, starting at ``target_begin``.
+    '''
+    imgt_germline = get_imgt_germlines(species, gene[3], gene=gene)
+    return imgt_germline.gapped_nt_sequence[target_begin + 1:].replace('.', '')
+
+
+def edit_alignment(germline, substitutions=None, deletions=None, insertions=None):
+    '''
+    Builds a (query, germline) alignment from an ungapped germline sequence.
+
+    Args:
+    -----
+
+        substitutions (dict): Maps germline positions to the query nucleotide.
+
+        deletions (list): ``(start, end)`` germline positions deleted from the query.
+
+        insertions (dict): Maps germline positions to a sequence that's inserted
+            into the query before that position.
+    '''
+    query = list(germline)
+    germ = list(germline)
+    for i, nt in (substitutions or {}).items():
+        query[i] = nt
+    for start, end in (deletions or []):
+        for i in range(start, end):
+            query[i] = '-'
+    for i in sorted(insertions or {}, reverse=True):
+        query[i:i] = list(insertions[i])
+        germ[i:i] = ['-'] * len(insertions[i])
+    return ''.join(query), ''.join(germ)
+
+
+def random_substitutions(germline, rate, seed, alphabet='ACGT'):
+    rng = random.Random(seed)
+    subs = {}
+    for i, nt in enumerate(germline):
+        if rng.random() < rate:
+            subs[i] = rng.choice([a for a in alphabet if a != nt])
+    return subs
+
+
+def build_segment(gene, query_alignment, germline_alignment, species='human', query_start=0, target_begin=0):
+    '''
+    Builds a ``GermlineSegment`` from a pre-computed alignment and numbers it with the
+    real IMGT-gapped germline, without needing to run the realignment.
+    '''
+    segment = GermlineSegment(gene, species)
+    segment.query_alignment = query_alignment
+    segment.germline_alignment = germline_alignment
+    segment.query_start = query_start
+    segment.query_end = query_start + len(query_alignment.replace('-', '')) - 1
+    segment.imgt_germline = get_imgt_germlines(species, segment.gene_type, gene=gene)
+    segment.imgt_gapped_alignment = FakeAlignment(target_begin)
+    segment._imgt_numbering()
+    return segment
+
+
+# V and J genes from each chain, along with alignments covering
+# substitutions, ambiguous and lowercase nucleotides, and indels
+GENES = ['IGHV1-2*02', 'IGKV1-39*01', 'IGLV2-14*01', 'IGHJ4*02', 'IGKJ1*01']
+
+
+def _merge(*dicts):
+    merged = {}
+    for d in dicts:
+        merged.update(d)
+    return merged
+
+
+def _alignment_cases(gene):
+    germline = germline_alignment(gene)
+    length = len(germline)
+    cases = {'germline': ({}, [], {}),
+             'substitutions': (random_substitutions(germline, 0.1, gene), [], {}),
+             'ambiguous': (_merge(random_substitutions(germline, 0.05, gene), {length // 3: 'N', length // 2: 'R'}), [], {}),
+             'lowercase': (dict([(i, germline[i].lower()) for i in range(length // 4, length // 4 + 6)]), [], {}),
+             'codon_deletion': (random_substitutions(germline, 0.05, gene), [(length // 2, length // 2 + 3)], {}),
+             'frameshift_deletion': ({}, [(length // 3, length // 3 + 1)], {}),
+             'codon_insertion': (random_substitutions(germline, 0.05, gene), [], {length // 2: 'GGC'}),
+             'frameshift_insertion': ({}, [], {length // 3: 'TA'}),
+             'indels': (random_substitutions(germline, 0.05, gene), [(length // 4, length // 4 + 2)],
+                        {(3 * length) // 4: 'A'})}
+    alignments = [(name, edit_alignment(germline, *edits), 0) for name, edits in sorted(cases.items())]
+    # the query starts partway through the germline gene
+    truncated = germline_alignment(gene, target_begin=20)
+    alignments.append(('truncated', edit_alignment(truncated, random_substitutions(truncated, 0.1, gene)), 20))
+    return alignments
+
+
+ALIGNMENT_CASES = [(gene, name, alignment, target_begin) for gene in GENES
+                   for name, alignment, target_begin in _alignment_cases(gene)]
+
+
+@pytest.fixture(params=ALIGNMENT_CASES, ids=['{}-{}'.format(c[0], c[1]) for c in ALIGNMENT_CASES])
+def aligned_segment(request):
+    '''
+    A function that builds a freshly numbered segment for each alignment case, since
+    mutation calling and region identification update the segment.
+    '''
+    gene, _, (query, germline), target_begin = request.param
+
+    def _build(query_start=0):
+        return build_segment(gene, query, germline, query_start=query_start, target_begin=target_begin)
+    return _build
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# filename: test_aio.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import sys
+
+import pytest
+
+if sys.version_info < (3, 7):
+    pytest.skip('the asyncio interface requires Python 3.7', allow_module_level=True)
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from abutils.core.sequence import Sequence
+
+from abstar.core import aio
+from abstar.core.abstar import Args
+from abstar.utils import cache as cache_module
+
+
+def cache_args(tmpdir):
+    cache_module._GERMLINE_CHECKSUMS['human'] = 'test-checksum'
+    return Args(cache=True, cache_dir=str(tmpdir), raw=True, padding=False, temp=str(tmpdir))
+
+
+def record(seq_id):
+    return collections.OrderedDict([('seq_id', seq_id), ('cdr3_aa', 'ARGG')])
+
+
+def test_cache_calls_can_run_on_different_threads(tmpdir):
+    args = cache_args(tmpdir)
+    sequences = [Sequence(['seq1', 'ACGTACGTAC']), Sequence(['seq2', 'TTTTGGGGCC'])]
+
+    async def _run():
+        loop = asyncio.get_running_loop()
+        # separate executors guarantee that the put and the get run on different threads
+        with ThreadPoolExecutor(1) as put_executor, ThreadPoolExecutor(1) as get_executor:
+            await loop.run_in_executor(put_executor, aio._cache_put, [('ACGTACGTAC', record('seq1'))], args)
+            return await loop.run_in_executor(get_executor, aio._cache_get, sequences, args)
+
+    hits, misses = asyncio.run(_run())
+    assert [s.id for s, _ in hits] == ['seq1']
+    assert [s.id for s in misses] == ['seq2']
+
+
+def test_cache_calls_close_the_cache(tmpdir, monkeypatch):
+    closed = []
+    real_close = cache_module.AnnotationCache.close
+
+    def close(self):
+        closed.append(self)
+        real_close(self)
+
+    monkeypatch.setattr(cache_module.AnnotationCache, 'close', close)
+    args = cache_args(tmpdir)
+    aio._cache_put([('ACGTACGTAC', record('seq1'))], args)
+    aio._cache_get([Sequence(['seq1', 'ACGTACGTAC'])], args)
+    assert len(closed) == 2
+    assert all([c._conn is None for c in closed])
+
+
+def test_fully_cached_requests_skip_assignment(tmpdir, monkeypatch):
+    def no_assignment(*args, **kwargs):
+        raise AssertionError('cached sequences should not be assigned')
+
+    monkeypatch.setattr(aio, 'Blastn', no_assignment)
+    args = cache_args(tmpdir)
+    aio._cache_put([('ACGTACGTAC', record('seq1'))], args)
+
+    async def _run():
+        loop = asyncio.get_running_loop()
+        return await aio._process_sequences_async([Sequence(['renamed', 'ACGTACGTAC'])], args, loop, None)
+
+    outputs = asyncio.run(_run())
+    assert len(outputs) == 1
+    assert 'renamed' in str(outputs[0])
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# filename: test_blastn.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+from abutils.core.sequence import Sequence
+
+from abstar.assigners.blastn import Blastn
+from abstar.core.germline import get_ungapped_germlines
+
+
+class HSP(object):
+    def __init__(self, query_start, query_end, sbjct_start=1, sbjct_end=2):
+        self.query_start = query_start
+        self.query_end = query_end
+        # BLASTn reverses the subject coordinates of minus-strand alignments
+        self.sbjct_start = sbjct_start
+        self.sbjct_end = sbjct_end
+
+
+class Alignment(object):
+    def __init__(self, hsp):
+        self.hsps = [hsp]
+
+
+class BlastRecord(object):
+    def __init__(self, query_start, query_end, minus=False):
+        sbjct = (2, 1) if minus else (1, 2)
+        self.alignments = [Alignment(HSP(query_start, query_end, *sbjct))]
+
+
+class FakeVDJ(object):
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.oriented = sequence
+
+
+def test_queries_are_oriented_before_blasting():
+    heavy = Sequence(['heavy', get_ungapped_germlines('human', 'V')['IGHV1-2*02']])
+    reverse = Sequence(['reverse', heavy.reverse_complement])
+    unknown = Sequence(['unknown', 'ACGT' * 5])
+    oriented, strands = Blastn('human').orient_queries([heavy, reverse, unknown])
+    # queries in the germline orientation are returned unchanged
+    assert oriented[0] is heavy
+    assert oriented[1].id == 'reverse'
+    assert oriented[1].sequence == heavy.sequence
+    # queries with an uncertain orientation are unchanged, and both strands are searched
+    assert oriented[2] is unknown
+    assert strands == ['plus', 'plus', 'both']
+
+
+def test_unresolved_queries_are_searched_separately(tmpdir, monkeypatch):
+    blastn = Blastn('human')
+    searches = []
+
+    def blast(seq_file, species, segment, database=None, strand='plus'):
+        with open(seq_file) as f:
+            ids = [line[1:].strip() for line in f if line.startswith('>')]
+        searches.append((seq_file, strand, ids))
+        return ids
+
+    monkeypatch.setattr(blastn, 'blast', blast)
+    seqs = [Sequence([name, 'ACGT' * 5]) for name in ['seq0', 'seq1', 'seq2']]
+    records = blastn.blast_by_chain(seqs, 'V', [None] * 3, strands=['plus', 'both', 'plus'])
+    assert sorted([(strand, ids) for _, strand, ids in searches]) == [('both', ['seq1']),
+                                                                      ('plus', ['seq0', 'seq2'])]
+    assert records == ['seq0', 'seq1', 'seq2']
+    # the input file is re-used if all queries are searched against a single database and strand
+    seq_file = str(tmpdir.join('input.fasta'))
+    with open(seq_file, 'w') as f:
+        f.write(''.join(['>{}\n{}\n'.format(s.id, s.sequence) for s in seqs]))
+    searches[:] = []
+    blastn.blast_by_chain(seqs, 'V', [None] * 3, strands=['plus'] * 3, seq_file=seq_file)
+    assert searches == [(seq_file, 'plus', ['seq0', 'seq1', 'seq2'])]
+
+
+def test_minus_strand_hits_are_reoriented():
+    # only queries with an uncertain orientation are searched against both strands
+    oriented = 'A' * 290 + 'CCCGGGTTT'
+    seq = Sequence(['seq1', oriented])
+    vdj = FakeVDJ(Sequence(['seq1', seq.reverse_complement]))
+    # the V-gene alignment is at the 3' end of the raw (reverse complemented) input
+    vbr = BlastRecord(10, 299, minus=True)
+    Blastn.orient_query(vdj, vbr)
+    assert vdj.oriented.sequence == oriented
+    jquery = Blastn.get_jquery_sequence(vdj.oriented, vbr)
+    assert jquery.id == 'seq1'
+    assert jquery.sequence.endswith('CCCGGGTTT')
+    # plus strand hits are left alone
+    vdj = FakeVDJ(seq)
+    Blastn.orient_query(vdj, BlastRecord(1, 290))
+    assert vdj.oriented is seq
+
+
+def test_jquery_is_downstream_of_the_vgene_alignment():
+    seq = Sequence(['seq1', 'A' * 290 + 'CCCGGGTTT'])
+    jquery = Blastn.get_jquery_sequence(seq, BlastRecord(1, 290))
+    assert jquery.id == 'seq1'
+    assert jquery.sequence == 'CCCGGGTTT'
+
+
+def chain_specific_blastn(tmpdir, chains):
+    # an empty file is enough for a database to be found (only the files are checked)
+    blast_dir = tmpdir.mkdir('blast')
+    blast_dir.join('v.nsq').write('')
+    for chain in chains:
+        blast_dir.join('v_{}.nsq'.format(chain)).write('')
+    blastn = Blastn('human')
+    blastn.germline_directory = str(tmpdir)
+    return blastn
+
+
+def test_chain_specific_databases_are_found(tmpdir):
+    blastn = chain_specific_blastn(tmpdir, ['heavy'])
+    blast_dir = os.path.join(str(tmpdir), 'blast')
+    assert blastn.blast_database('V', 'heavy') == os.path.join(blast_dir, 'v_heavy')
+    # chains without their own database use the combined database
+    assert blastn.blast_database('V', 'kappa') == os.path.join(blast_dir, 'v')
+    assert blastn.blast_database('V') == os.path.join(blast_dir, 'v')
+
+
+def test_queries_are_grouped_by_database(tmpdir):
+    blastn = chain_specific_blastn(tmpdir, ['heavy'])
+    blast_dir = os.path.join(str(tmpdir), 'blast')
+    groups = blastn.group_by_database('V', ['heavy', None, 'heavy', 'kappa'])
+    assert groups == [(os.path.join(blast_dir, 'v'), 'plus', [1, 3]),
+                      (os.path.join(blast_dir, 'v_heavy'), 'plus', [0, 2])]
+    # queries with an uncertain orientation are searched separately
+    groups = blastn.group_by_database('V', ['heavy', None, 'heavy', 'kappa'], ['plus', 'plus', 'both', 'plus'])
+    assert groups == [(os.path.join(blast_dir, 'v'), 'plus', [1, 3]),
+                      (os.path.join(blast_dir, 'v_heavy'), 'both', [2]),
+                      (os.path.join(blast_dir, 'v_heavy'), 'plus', [0])]
+
+
+def test_databases_are_resolved_once_per_chain(tmpdir, monkeypatch):
+    blastn = chain_specific_blastn(tmpdir, ['heavy', 'kappa'])
+    lookups = []
+    real_blast_database = blastn.blast_database
+
+    def blast_database(segment, chain=None):
+        lookups.append((segment, chain))
+        return real_blast_database(segment, chain)
+
+    monkeypatch.setattr(blastn, 'blast_database', blast_database)
+    groups = blastn.group_by_database('V', ['heavy', 'kappa', None] * 10)
+    assert [len(indexes) for _, _, indexes in groups] == [10, 10, 10]
+    assert sorted(lookups, key=str) == sorted([('V', 'heavy'), ('V', 'kappa'), ('V', None)], key=str)
+
+
+def test_queries_are_routed_to_chain_specific_databases(tmpdir):
+    heavy = Sequence(['heavy', get_ungapped_germlines('human', 'V')['IGHV1-2*02']])
+    kappa = Sequence(['kappa', get_ungapped_germlines('human', 'V')['IGKV1-39*01']])
+    # without chain-specific databases, queries aren't classified
+    assert Blastn('human').route_queries([heavy, kappa]) == [None, None]
+    blastn = chain_specific_blastn(tmpdir, ['heavy', 'kappa'])
+    chains = blastn.route_queries([heavy, kappa])
+    assert chains == ['heavy', 'kappa']
+    blast_dir = os.path.join(str(tmpdir), 'blast')
+    assert blastn.group_by_database('V', chains) == [(os.path.join(blast_dir, 'v_heavy'), 'plus', [0]),
+                                                     (os.path.join(blast_dir, 'v_kappa'), 'plus', [1])]
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# filename: test_cache.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+
+from abutils.core.sequence import Sequence
+
+from abstar.utils import cache as cache_module
+from abstar.utils.cache import AnnotationCache
+
+
+def make_cache(tmpdir, **kwargs):
+    # germline database checksums are computed once per process,
+    # so a precomputed checksum avoids needing a germline database
+    cache_module._GERMLINE_CHECKSUMS['human'] = 'test-checksum'
+    return AnnotationCache('human', version='0.0.0', cache_dir=str(tmpdir), **kwargs)
+
+
+def record(i):
+    return collections.OrderedDict([('seq_id', 'seq{}'.format(i)),
+                                    ('v_gene', {'full': 'IGHV1-2*02'}),
+                                    ('cdr3_aa', 'AR' + 'G' * i)])
+
+
+def test_cache_miss_then_hit(tmpdir):
+    cache = make_cache(tmpdir)
+    seqs = [Sequence(['seq{}'.format(i), 'ACGT' * (i + 5)]) for i in range(3)]
+    hits, misses = cache.get(seqs)
+    assert hits == []
+    assert [s.id for s in misses] == ['seq0', 'seq1', 'seq2']
+    cache.put([(seqs[0].sequence, record(0)), (seqs[2].sequence, record(2))])
+    hits, misses = cache.get(seqs)
+    assert [s.id for s, _ in hits] == ['seq0', 'seq2']
+    assert [s.id for s in misses] == ['seq1']
+    # sequence IDs aren't cached
+    assert 'seq_id' not in hits[1][1]
+    assert hits[1][1]['cdr3_aa'] == 'ARGG'
+    cache.close()
+
+
+def test_cache_is_shared_between_instances(tmpdir):
+    cache = make_cache(tmpdir)
+    cache.put([('ACGTACGTAC', record(1))])
+    cache.close()
+    hits, misses = make_cache(tmpdir).get([Sequence(['other_name', 'ACGTACGTAC'])])
+    assert len(hits) == 1
+    assert hits[0][0].id == 'other_name'
+
+
+def test_cache_key_includes_isotype(tmpdir):
+    with_isotype = make_cache(tmpdir, isotype=True)
+    with_isotype.put([('ACGTACGTAC', record(1))])
+    with_isotype.close()
+    hits, misses = make_cache(tmpdir, isotype=False).get([Sequence(['s', 'ACGTACGTAC'])])
+    assert hits == []
+    hits, misses = make_cache(tmpdir, isotype=True).get([Sequence(['s', 'ACGTACGTAC'])])
+    assert len(hits) == 1
+
+
+def test_cache_eviction_removes_least_recently_used(tmpdir):
+    # ~2KB cache
+    cache = make_cache(tmpdir, max_size=2. / 1024)
+    seqs = ['ACGT' * 10 + 'A' * i for i in range(40)]
+    cache.put([(seqs[0], record(0))])
+    cache.put([(s, record(i + 1)) for i, s in enumerate(seqs[1:20])])
+    # reading the first result makes it more recently used than the others
+    hits, _ = cache.get([Sequence(['s0', seqs[0]])])
+    assert len(hits) == 1
+    cache.put([(s, record(i + 20)) for i, s in enumerate(seqs[20:])])
+    size = cache.conn.execute("SELECT value FROM info WHERE name = 'size'").fetchone()[0]
+    stored = cache.conn.execute('SELECT SUM(size) FROM annotations').fetchone()[0]
+    assert size == stored
+    assert size <= cache.max_size
+    hits, misses = cache.get([Sequence(['s{}'.format(i), s]) for i, s in enumerate(seqs)])
+    hit_ids = [s.id for s, _ in hits]
+    assert 's0' in hit_ids
+    assert 's1' not in hit_ids
+    assert 's39' in hit_ids
+    assert len(misses) > 0
+    cache.close()
+
+
+def test_cache_hits_are_touched_in_batches(tmpdir, monkeypatch):
+    monkeypatch.setattr(cache_module, 'TOUCH_BATCH_SIZE', 3)
+    cache = make_cache(tmpdir)
+    seqs = ['ACGT' * 10 + 'A' * i for i in range(4)]
+    cache.put([(s, record(i)) for i, s in enumerate(seqs)])
+    accessed = dict(cache.conn.execute('SELECT key, accessed FROM annotations'))
+    cache.get([Sequence(['s0', seqs[0]]), Sequence(['s1', seqs[1]])])
+    # not enough hits to write access times yet
+    assert dict(cache.conn.execute('SELECT key, accessed FROM annotations')) == accessed
+    cache.get([Sequence(['s2', seqs[2]])])
+    updated = dict(cache.conn.execute('SELECT key, accessed FROM annotations'))
+    assert [k for k in updated if updated[k] > accessed[k]] != []
+    assert updated[cache.key(seqs[3])] == accessed[cache.key(seqs[3])]
+    assert cache._touched == {}
+    cache.close()
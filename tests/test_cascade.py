@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# filename: test_cascade.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import random
+
+import pytest
+
+from abutils.core.sequence import Sequence
+
+from abstar.assigners import cascade
+from abstar.assigners.blastn import Blastn
+from abstar.core import abstar
+from abstar.core.germline import get_ungapped_germlines
+
+
+def blasted_ids(monkeypatch):
+    # records which reads are sent to BLASTn, without running BLASTn
+    ids = []
+
+    def blastn_call(self, sequence_file, file_format):
+        ids.extend([s.id for s in self.read_input(sequence_file, file_format)])
+        self.assigned = []
+        self.unassigned = []
+
+    monkeypatch.setattr(Blastn, '__call__', blastn_call)
+    return ids
+
+
+def input_file(tmpdir):
+    vgenes = get_ungapped_germlines('human', 'V')
+    jgenes = get_ungapped_germlines('human', 'J')
+    rng = random.Random(0)
+    seqs = [Sequence(['seed{}'.format(i), vgenes[v] + 'GGGTAC' + jgenes['IGHJ4*02']])
+            for i, v in enumerate(['IGHV1-2*02', 'IGHV3-23*01', 'IGHV4-34*01'])]
+    seqs += [Sequence(['random{}'.format(i), ''.join([rng.choice('ACGT') for _ in range(350)])])
+             for i in range(2)]
+    path = str(tmpdir.join('input.fasta'))
+    with open(path, 'w') as f:
+        f.write(''.join(['>{}\n{}\n'.format(s.id, s.sequence) for s in seqs]))
+    return path
+
+
+@pytest.mark.parametrize('concordance', [False, True])
+def test_each_read_is_counted_once(tmpdir, monkeypatch, concordance):
+    blasted = blasted_ids(monkeypatch)
+    assigner = cascade.Cascade('human', concordance=concordance)
+    assigner(input_file(tmpdir), 'fasta')
+    stats = assigner.stats
+    assert stats['cascade_reads'] == 5
+    assert stats['cascade_seed'] + stats['cascade_blastn'] + stats['cascade_checked'] == 5
+    assert stats['cascade_blastn'] == 2
+    assert len(blasted) == stats['cascade_blastn'] + stats['cascade_checked']
+    if concordance:
+        assert (stats['cascade_seed'], stats['cascade_checked']) == (0, 3)
+    else:
+        assert (stats['cascade_seed'], stats['cascade_checked']) == (3, 0)
+
+
+def test_cascade_stats_add_up_to_100_percent(monkeypatch, caplog):
+    monkeypatch.setattr(abstar, 'logger', logging.getLogger('abstar'), raising=False)
+    stats = {'cascade_reads': 10, 'cascade_seed': 0, 'cascade_blastn': 4, 'cascade_checked': 6,
+             'concordance_compared': 6, 'concordance_v_gene': 6, 'concordance_v_allele': 6,
+             'concordance_j_gene': 6, 'concordance_j_allele': 6}
+    with caplog.at_level(logging.INFO, logger='abstar'):
+        abstar.print_job_stats(10, [10], 0, 1, [stats])
+    assert '0 sequences (0.0%) were assigned with seeds, 4 sequences (40.0%) with BLASTn' in caplog.text
+    assert '6 sequences (60.0%) were assigned with seeds and checked with BLASTn' in caplog.text
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# filename: test_celery.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import os
+
+import pytest
+
+pytest.importorskip('celery')
+
+# the broker and result backend are read when the Celery app is configured,
+# so they need to be set before abstar.utils.queue.celery is imported
+os.environ['ABSTAR_BROKER_URL'] = 'memory://'
+os.environ['ABSTAR_RESULT_BACKEND'] = 'cache+memory://'
+
+from celery.contrib.testing.worker import start_worker
+
+from abstar.core import abstar
+from abstar.utils.queue.celery import celery, run_abstar_batch_task
+
+
+def fake_run_abstar(seq_file, output_dir, log_dir, file_format, arg_dict):
+    with open(seq_file) as f:
+        contents = f.read()
+    if 'bad' in contents:
+        raise ValueError('{} could not be annotated'.format(seq_file))
+    output = os.path.join(output_dir, os.path.basename(seq_file) + '.json')
+    with open(output, 'w') as f:
+        f.write(contents.upper())
+    return ([output, ], 1, '', '', '', {'assigned': 1})
+
+
+@pytest.fixture(scope='module')
+def worker():
+    with start_worker(celery, pool='solo', perform_ping_check=False):
+        yield
+
+
+@pytest.fixture
+def jobs(tmpdir, monkeypatch, worker):
+    monkeypatch.setattr(abstar, 'run_abstar', fake_run_abstar)
+    monkeypatch.setattr(abstar, 'update_progress', lambda *a, **k: None)
+    monkeypatch.setattr(abstar, 'logger', logging.getLogger('abstar'), raising=False)
+    input_dir = tmpdir.mkdir('input')
+    output_dir = tmpdir.mkdir('output')
+    tmpdir.mkdir('log').mkdir('temp')
+    files = []
+    for name, contents in [('chunk_0', 'acgt'), ('chunk_1', 'tttt'), ('chunk_2', 'bad')]:
+        path = str(input_dir.join(name))
+        with open(path, 'w') as f:
+            f.write(contents)
+        files.append(path)
+    return files, str(output_dir), str(tmpdir.join('log'))
+
+
+def run(files, output_dir, log_dir, inline):
+    args = abstar.Args(cluster=True, fuse_chunks=2, inline_payloads=inline, output_type=['json'])
+    runner = abstar._CeleryBatchRunner(run_abstar_batch_task, fuse=2, inline=inline)
+    finished = []
+    results = abstar.monitor_jobs(runner, files, output_dir, log_dir, 'fasta', args,
+                                  callback=lambda f, r: finished.append(f), total=len(files))
+    return runner, results, finished
+
+
+@pytest.mark.parametrize('inline', [False, True])
+def test_fused_jobs(jobs, inline):
+    files, output_dir, log_dir = jobs
+    runner, results, finished = run(files, output_dir, log_dir, inline)
+    # the first two jobs share a task, and the failed third job doesn't affect them
+    assert finished == files[:2]
+    assert len(results) == 2
+    for seq_file, result in zip(files, results):
+        output = result[0][0]
+        assert output == os.path.join(output_dir, os.path.basename(seq_file) + '.json')
+        with open(output) as f, open(seq_file) as s:
+            assert f.read() == s.read().upper()
+        assert result[1] == 1
+        assert result[5] == {'assigned': 1}
+    assert not runner.batches
+
+
+class FakeAsyncResult(object):
+    def __init__(self, state):
+        self.state = state
+
+
+def test_batch_starts_are_reported_once():
+    runner = abstar._CeleryBatchRunner(run_abstar_batch_task, fuse=2)
+    pending = abstar._CeleryBatch(FakeAsyncResult('PENDING'), [abstar._BatchedJob('c')])
+    started = abstar._CeleryBatch(FakeAsyncResult('STARTED'), [abstar._BatchedJob('a'), abstar._BatchedJob('b')])
+    runner.batches = [pending, started]
+    assert [f for f, _ in runner.started({})] == ['a', 'b']
+    assert runner.started({}) == []
+    pending.async_result.state = 'STARTED'
+    assert [f for f, _ in runner.started({})] == ['c']
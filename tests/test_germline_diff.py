@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# filename: test_germline_diff.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+
+from abstar.core.abstar import Args, partition_stored_annotations
+from abstar.utils.germline_diff import GermlineDiff, is_vulnerable
+
+
+OLD_DB = {'v': [('IGHV1-2*02', 'CAGGTGCAGCTGGTGCAG'),
+                ('IGHV1-2*04', 'CAGGTGCAGCTGGTGCAA'),
+                ('IGHV3-23*01', 'GAGGTGCAGCTGTTGGAG')],
+          'd': [('IGHD3-10*01', 'GTATTACTATGGTTCGGG')],
+          'j': [('IGHJ4*02', 'ACTACTTTGACTACTGG')]}
+
+NEW_DB = {'v': [('IGHV1-2*02', 'CAGGTGCAGCTGGTGCAG'),
+                # changed
+                ('IGHV1-2*04', 'CAGGTGCAGCTGGTGCAT'),
+                ('IGHV3-23*01', 'GAGGTGCAGCTGTTGGAG'),
+                # added
+                ('IGHV3-23*05', 'GAGGTGCAGCTGTTGGAA')],
+          'd': [],
+          'j': [('IGHJ4*02', 'ACTACTTTGACTACTGG')]}
+
+
+def make_db(tmpdir, name, db):
+    ungapped = tmpdir.mkdir(name).mkdir('ungapped')
+    for segment, alleles in db.items():
+        ungapped.join('{}.fasta'.format(segment)).write(''.join(['>{}\n{}\n'.format(n, s) for n, s in alleles]))
+    return str(tmpdir.join(name))
+
+
+def annotation(seq_id, v, others=None, d=None, score=300):
+    record = {'seq_id': seq_id,
+              'raw_input': 'ACGT' * 30,
+              'v_gene': {'full': v, 'assigner_score': score, 'others': others or []},
+              'j_gene': {'full': 'IGHJ4*02', 'assigner_score': 40}}
+    if d is not None:
+        record['d_gene'] = {'full': d}
+    return record
+
+
+def test_germline_diff(tmpdir):
+    diff = GermlineDiff(make_db(tmpdir, 'old', OLD_DB), make_db(tmpdir, 'new', NEW_DB))
+    assert diff.added['V'] == ['IGHV3-23*05']
+    assert diff.changed['V'] == ['IGHV1-2*04']
+    assert diff.removed['D'] == ['IGHD3-10*01']
+    assert diff.removed['V'] == diff.added['J'] == []
+    assert len(diff) == 3
+    assert diff.modified_alleles == set(['IGHV1-2*04', 'IGHD3-10*01'])
+    assert diff.genes_with_new_alleles == set(['IGHV3-23'])
+
+
+def test_is_vulnerable(tmpdir):
+    diff = GermlineDiff(make_db(tmpdir, 'old', OLD_DB), make_db(tmpdir, 'new', NEW_DB))
+    # unchanged germline genes
+    assert not is_vulnerable(annotation('s1', 'IGHV1-2*02'), diff)
+    # changed allele
+    assert is_vulnerable(annotation('s2', 'IGHV1-2*04'), diff)
+    # changed allele in the alternative assignments
+    assert is_vulnerable(annotation('s3', 'IGHV1-2*02', others=[{'full': 'IGHV1-2*04', 'assigner_score': 250}]), diff)
+    # gene that gained an allele
+    assert is_vulnerable(annotation('s4', 'IGHV3-23*01'), diff)
+    # removed D-gene
+    assert is_vulnerable(annotation('s5', 'IGHV1-2*02', d='IGHD3-10*01'), diff)
+    # close runner-up
+    close = annotation('s6', 'IGHV1-2*02', others=[{'full': 'IGHV1-3*01', 'assigner_score': 295}])
+    assert not is_vulnerable(close, diff)
+    assert is_vulnerable(close, diff, margin=10)
+
+
+def test_partition_stored_annotations(tmpdir):
+    old = make_db(tmpdir, 'old', OLD_DB)
+    new = make_db(tmpdir, 'new', NEW_DB)
+    records = [annotation('s1', 'IGHV1-2*02'),
+               annotation('s2', 'IGHV1-2*04'),
+               annotation('s3', 'IGHV3-23*01')]
+    records[2]['umi_count'] = 4
+    stored = tmpdir.join('stored.json')
+    stored.write('\n'.join([json.dumps(r) for r in records]) + '\n')
+    args = Args(species=new, assigner='stored', previous_germline_db=old, output_type=['json'])
+    carried, reassign_file, reassigned, umi_counts = partition_stored_annotations(str(stored), 'json', args)
+    assert [json.loads(l)['seq_id'] for l in carried] == ['s1']
+    assert reassigned == ['s2', 's3']
+    assert umi_counts == {'s3': 4}
+    with open(reassign_file) as f:
+        assert [l[1:] for l in f.read().splitlines() if l.startswith('>')] == ['s2', 's3']
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# filename: test_manifest.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+from abstar.core.abstar import Args
+from abstar.utils.manifest import RunManifest, file_fingerprint, same_fingerprint
+
+
+def write(path, contents):
+    with open(path, 'w') as f:
+        f.write(contents)
+    return path
+
+
+def start_run(tmpdir, resume=False, **kwargs):
+    args = Args(output=str(tmpdir), temp=str(tmpdir), **kwargs)
+    return RunManifest(os.path.join(str(tmpdir), 'abstar_manifest.json'), args, resume=resume)
+
+
+def complete_chunk(tmpdir, manifest, input_file, chunk):
+    output = write(os.path.join(str(tmpdir), os.path.basename(chunk) + '.json'), '{}\n')
+    manifest.complete_chunk(input_file, chunk, ([output], 1, '', '', '', {}))
+
+
+def test_resume_keeps_completed_chunks(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    manifest = start_run(tmpdir)
+    assert not manifest.resumed
+    manifest.start_file(input_file, file_fingerprint(input_file), 1)
+    complete_chunk(tmpdir, manifest, input_file, 'input_0')
+    resumed = start_run(tmpdir, resume=True)
+    assert resumed.resumed
+    resumed.start_file(input_file, file_fingerprint(input_file, checksum=True), 1)
+    assert list(resumed.completed_chunks(input_file).keys()) == ['input_0']
+    # the checksum computed while resuming is recorded
+    assert 'md5' in resumed.file_entry(input_file)['fingerprint']
+
+
+def test_resume_requires_matching_settings(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    manifest = start_run(tmpdir, isotype='human')
+    manifest.start_file(input_file, file_fingerprint(input_file), 1)
+    complete_chunk(tmpdir, manifest, input_file, 'input_0')
+    resumed = start_run(tmpdir, resume=True, isotype=False)
+    assert not resumed.resumed
+    assert resumed.completed_chunks(input_file) == {}
+
+
+def test_changed_input_discards_completed_chunks(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    manifest = start_run(tmpdir)
+    manifest.start_file(input_file, file_fingerprint(input_file), 1)
+    complete_chunk(tmpdir, manifest, input_file, 'input_0')
+    write(input_file, '>seq1\nACGT\n>seq2\nTTTT\n')
+    resumed = start_run(tmpdir, resume=True)
+    resumed.start_file(input_file, file_fingerprint(input_file, checksum=True), 2)
+    assert resumed.completed_chunks(input_file) == {}
+
+
+def test_chunks_with_missing_outputs_are_rerun(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    manifest = start_run(tmpdir)
+    manifest.start_file(input_file, file_fingerprint(input_file), 2)
+    complete_chunk(tmpdir, manifest, input_file, 'input_0')
+    complete_chunk(tmpdir, manifest, input_file, 'input_1')
+    os.unlink(str(tmpdir.join('input_1.json')))
+    resumed = start_run(tmpdir, resume=True)
+    resumed.start_file(input_file, file_fingerprint(input_file), 2)
+    assert list(resumed.completed_chunks(input_file).keys()) == ['input_0']
+
+
+def test_completed_files_are_skipped(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    output = write(str(tmpdir.join('input.json')), '{}\n')
+    manifest = start_run(tmpdir)
+    fingerprint = file_fingerprint(input_file)
+    manifest.start_file(input_file, fingerprint, 1)
+    assert not manifest.is_file_complete(input_file, fingerprint)
+    manifest.complete_file(input_file, [output])
+    resumed = start_run(tmpdir, resume=True)
+    assert resumed.is_file_complete(input_file, file_fingerprint(input_file, checksum=True))
+    os.unlink(output)
+    assert not resumed.is_file_complete(input_file, file_fingerprint(input_file, checksum=True))
+
+
+def test_seq_count_is_cached(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n>seq2\nTTTT\n')
+    manifest = start_run(tmpdir)
+    assert manifest.seq_count(input_file, file_fingerprint(input_file)) is None
+    manifest.start_file(input_file, file_fingerprint(input_file), 2)
+    resumed = start_run(tmpdir, resume=True)
+    assert resumed.seq_count(input_file, file_fingerprint(input_file, checksum=True)) == 2
+    write(input_file, '>seq1\nACGT\n')
+    assert resumed.seq_count(input_file, file_fingerprint(input_file, checksum=True)) is None
+
+
+def test_completed_chunks_are_journaled(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    manifest = start_run(tmpdir)
+    manifest.start_file(input_file, file_fingerprint(input_file), 3)
+    with open(manifest.path) as f:
+        saved = f.read()
+    for i in range(3):
+        complete_chunk(tmpdir, manifest, input_file, 'input_{}'.format(i))
+    # completing a chunk appends to the journal, rather than re-writing the manifest
+    with open(manifest.path) as f:
+        assert f.read() == saved
+    with open(manifest.journal_path) as f:
+        assert len(f.readlines()) == 3
+    resumed = start_run(tmpdir, resume=True)
+    resumed.start_file(input_file, file_fingerprint(input_file), 3)
+    assert sorted(resumed.completed_chunks(input_file).keys()) == ['input_0', 'input_1', 'input_2']
+
+
+def test_partial_journal_records_are_ignored(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    manifest = start_run(tmpdir)
+    manifest.start_file(input_file, file_fingerprint(input_file), 2)
+    complete_chunk(tmpdir, manifest, input_file, 'input_0')
+    with open(manifest.journal_path, 'a') as f:
+        f.write('{"file": "')
+    resumed = start_run(tmpdir, resume=True)
+    resumed.start_file(input_file, file_fingerprint(input_file), 2)
+    assert list(resumed.completed_chunks(input_file).keys()) == ['input_0']
+
+
+def test_saving_clears_the_journal(tmpdir):
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    output = write(str(tmpdir.join('input.json')), '{}\n')
+    manifest = start_run(tmpdir)
+    manifest.start_file(input_file, file_fingerprint(input_file), 1)
+    complete_chunk(tmpdir, manifest, input_file, 'input_0')
+    assert os.path.isfile(manifest.journal_path)
+    manifest.complete_file(input_file, [output])
+    assert not os.path.isfile(manifest.journal_path)
+    # a new (non-resumed) run also discards the journal
+    complete_chunk(tmpdir, manifest, input_file, 'input_1')
+    start_run(tmpdir)
+    assert not os.path.isfile(manifest.journal_path)
+
+
+def test_stale_journal_records_are_ignored(tmpdir):
+    # the manifest can be saved without clearing the journal if a run is interrupted in between
+    input_file = write(str(tmpdir.join('input.fasta')), '>seq1\nACGT\n')
+    output = write(str(tmpdir.join('input.json')), '{}\n')
+    manifest = start_run(tmpdir)
+    manifest.start_file(input_file, file_fingerprint(input_file), 1)
+    complete_chunk(tmpdir, manifest, input_file, 'input_0')
+    with open(manifest.journal_path) as f:
+        journal = f.read()
+    manifest.complete_file(input_file, [output])
+    write(manifest.journal_path, journal)
+    resumed = start_run(tmpdir, resume=True)
+    assert resumed.file_entry(input_file)['completed'] == {}
+    assert resumed.is_file_complete(input_file, file_fingerprint(input_file))
+
+
+def test_same_fingerprint():
+    old = {'size': 10, 'mtime': 1.5}
+    assert same_fingerprint(old, {'size': 10, 'mtime': 1.5, 'md5': 'abc'})
+    assert not same_fingerprint(old, {'size': 11, 'mtime': 1.5})
+    assert not same_fingerprint(dict(old, md5='abc'), dict(old, md5='def'))
+    assert not same_fingerprint(None, old)
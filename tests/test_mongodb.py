@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# filename: test_mongodb.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from abutils.core.sequence import Sequence
+
+from abstar.assigners.assigner import BaseAssigner
+from abstar.core import abstar
+from abstar.core.vdj import VDJ
+from abstar.utils import mongodb
+from abstar.utils.mongodb import MongoSink, create_indexes, get_client, record_id
+
+
+@pytest.fixture
+def mongod(monkeypatch):
+    '''
+    An in-memory MongoDB server (mongomock), shared by all clients created during a test.
+    '''
+    server = mongomock.MongoClient()
+    monkeypatch.setattr(mongodb, '_CLIENTS', {})
+    monkeypatch.setattr(mongodb.pymongo, 'MongoClient', lambda *args, **kwargs: server)
+    return server
+
+
+def test_sink_inserts_in_batches(mongod):
+    inserts = []
+    sink = MongoSink('coll', 'db', batch_size=3)
+    original = sink.collection.insert_many
+    sink.collection.insert_many = lambda docs, **kwargs: inserts.append(len(docs)) or original(docs, **kwargs)
+    with sink:
+        for i in range(7):
+            sink.add({'seq_id': 'seq{}'.format(i)})
+        assert mongod['db']['coll'].count_documents({}) == 6
+    assert inserts == [3, 3, 1]
+    assert sink.inserted == 7
+    assert sink.errors == 0
+
+
+def test_sink_skips_duplicates(mongod):
+    with MongoSink('coll', 'db', batch_size=10) as sink:
+        for _id in [1, 2, 2, 3]:
+            sink.add({'seq_id': 'seq{}'.format(_id)}, _id=_id)
+    assert (sink.inserted, sink.duplicates, sink.errors) == (3, 1, 0)
+    assert mongod['db']['coll'].count_documents({}) == 3
+
+
+def test_record_id():
+    assert record_id('seq1', 'ACGT') == record_id('seq1', 'acgt')
+    assert record_id('seq1', 'ACGT') != record_id('seq2', 'ACGT')
+    assert record_id('seq1', 'ACGT') != record_id('seq1', 'ACGA')
+
+
+def test_clients_are_reused(mongod):
+    assert get_client('localhost', 27017) is get_client('localhost', '27017')
+    assert len(mongodb._CLIENTS) == 1
+
+
+def test_create_indexes(mongod):
+    mongod['db']['coll'].insert_one({'seq_id': 'seq1', 'v_gene': {'gene': 'IGHV1-2'}})
+    create_indexes('coll', 'db', ['seq_id', 'v_gene.gene'])
+    index_keys = [[k for k, _ in i['key']] for i in mongod['db']['coll'].index_information().values()]
+    assert ['seq_id'] in index_keys
+    assert ['v_gene.gene'] in index_keys
+
+
+
+class EveryOther(BaseAssigner):
+    '''
+    Assigns every other sequence, without germline assignment.
+    '''
+    def __call__(self, sequence_file, file_format):
+        from Bio import SeqIO
+        with open(sequence_file) as f:
+            for i, s in enumerate(SeqIO.parse(f, file_format)):
+                (self.assigned if i % 2 == 0 else self.unassigned).append(VDJ(Sequence(s)))
+
+
+
+class FakeAntibody(object):
+    def __init__(self, vdj, species):
+        self.id = vdj.id
+        self.sequence = vdj.sequence.sequence
+        self.raw_input = vdj.sequence
+
+    def annotate(self, uid, umi_consensus=False):
+        pass
+
+    def format_log(self):
+        return ''
+
+
+
+class FakeResult(object):
+    def __init__(self, ab):
+        self.mongodb_output = {'seq_id': ab.id, 'raw_input': ab.sequence}
+        self.json_record = None
+
+
+def test_run_abstar_streams_into_mongodb(mongod, tmpdir, monkeypatch):
+    # annotation itself isn't under test, just the MongoDB output path
+    monkeypatch.setitem(abstar.ASSIGNERS, 'every_other', EveryOther)
+    monkeypatch.setattr(abstar, 'Antibody', FakeAntibody)
+    monkeypatch.setattr(abstar, 'get_abstar_result', lambda ab, **kwargs: FakeResult(ab))
+    tmpdir.mkdir('temp')
+    seq_file = str(tmpdir.join('chunk_0'))
+    with open(seq_file, 'w') as f:
+        f.write(''.join(['>seq{}\nACGTACGTAC\n'.format(i) for i in range(9)]))
+    args = abstar.Args(output=str(tmpdir), temp=str(tmpdir), assigner='every_other', output_type=['mongodb'],
+                       mongo_db='db', mongo_collection='coll', mongo_batch_size=2)
+    output_files, successful, _, _, _, stats = abstar.run_abstar(seq_file, str(tmpdir), str(tmpdir),
+                                                                 'fasta', vars(args))
+    # MongoDB output isn't written to a file
+    assert output_files == []
+    assert successful == 5
+    assert stats['mongodb_inserted'] == 5
+    assert stats['mongodb_errors'] == 0
+    docs = list(mongod['db']['coll'].find({}, {'_id': False}).sort('seq_id'))
+    assert [d['seq_id'] for d in docs] == ['seq0', 'seq2', 'seq4', 'seq6', 'seq8']
+    assert not os.path.isfile(seq_file + '.json')
+    # re-running the job (a resumed run, or a re-dispatched straggler) doesn't create duplicates
+    _, _, _, _, _, stats = abstar.run_abstar(seq_file, str(tmpdir), str(tmpdir), 'fasta', vars(args))
+    assert (stats['mongodb_inserted'], stats['mongodb_duplicates'], stats['mongodb_errors']) == (0, 5, 0)
+    assert mongod['db']['coll'].count_documents({}) == 5
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# filename: test_mongoimport.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import stat
+
+from abstar.utils.mongoimport import do_mongoimport, get_byte_ranges
+
+
+def write_json(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(json.dumps({'seq_id': 'seq{}'.format(i), 'cdr3_aa': 'AR' + 'G' * (i % 17)}) + '\n')
+    return path
+
+
+def fake_mongoimport(tmpdir, monkeypatch, script):
+    '''
+    Puts a fake ``mongoimport`` executable at the front of the PATH.
+    '''
+    bin_dir = tmpdir.mkdir('bin')
+    path = str(bin_dir.join('mongoimport'))
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\n' + script + '\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ.get('PATH', ''))
+
+
+def test_byte_ranges_cover_the_file_at_line_boundaries(tmpdir):
+    path = write_json(str(tmpdir.join('input.json')), 1000)
+    with open(path, 'rb') as f:
+        contents = f.read()
+    byte_ranges = get_byte_ranges(path, 64)
+    assert byte_ranges[0][0] == 0
+    assert byte_ranges[-1][1] == len(contents)
+    for (_, end), (start, _) in zip(byte_ranges[:-1], byte_ranges[1:]):
+        assert end == start
+    lines = []
+    for start, end in byte_ranges:
+        chunk = contents[start:end]
+        assert chunk.endswith(b'\n')
+        lines.extend(chunk.decode('utf-8').splitlines())
+    assert [json.loads(l)['seq_id'] for l in lines] == ['seq{}'.format(i) for i in range(1000)]
+    assert 10 <= len(byte_ranges) <= 22
+
+
+def test_byte_ranges_for_small_files(tmpdir):
+    path = write_json(str(tmpdir.join('input.json')), 3)
+    assert get_byte_ranges(path, 100) == [(0, os.path.getsize(path))]
+    empty = str(tmpdir.join('empty.json'))
+    open(empty, 'w').close()
+    assert get_byte_ranges(empty, 100) == []
+
+
+def test_byte_range_is_streamed_to_mongoimport(tmpdir, monkeypatch):
+    received = str(tmpdir.join('received'))
+    fake_mongoimport(tmpdir, monkeypatch, 'cat > {}'.format(received))
+    path = write_json(str(tmpdir.join('input.json')), 100)
+    start, end = get_byte_ranges(path, 10)[2]
+    returncode, stderr = do_mongoimport(path, 'localhost', 27017, 'db', 'coll', None, None, start, end)
+    assert returncode == 0
+    with open(path, 'rb') as f, open(received, 'rb') as r:
+        f.seek(start)
+        assert r.read() == f.read(end - start)
+
+
+def test_failed_byte_range_is_reported(tmpdir, monkeypatch):
+    # exits without reading its input, so writing the byte range hits a broken pipe
+    fake_mongoimport(tmpdir, monkeypatch, 'echo "connection refused" >&2; exit 3')
+    path = write_json(str(tmpdir.join('input.json')), 50000)
+    returncode, stderr = do_mongoimport(path, 'localhost', 27017, 'db', 'coll', None, None,
+                                        0, os.path.getsize(path))
+    assert returncode == 3
+    assert 'connection refused' in stderr
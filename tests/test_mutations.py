@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# filename: test_mutations.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import math
+
+import pytest
+
+from abutils.utils.codons import codon_lookup as codons
+
+from abstar.utils.mutations import aa_mutations, nt_mutations
+
+from .conftest import FakeAntibody
+
+
+# Reference implementations: the per-position loops that mutation calling used
+# before it was vectorized. Mutations are returned as tuples of
+# (was, now, raw_position, imgt_position, imgt_codon).
+
+def reference_nt_mutations(segment):
+    mutations = []
+    for i, (q, g) in enumerate(zip(segment.query_alignment, segment.germline_alignment)):
+        if q != g:
+            raw_pos = i + segment.query_start
+            imgt_pos = segment.get_imgt_position_from_raw(raw_pos)
+            if any([q == '-', g == '-', imgt_pos is None]):
+                continue
+            imgt_codon = int(math.ceil(imgt_pos / 3.0))
+            if segment.gene_type == 'J':
+                imgt_pos = segment.correct_imgt_nt_position_from_imgt(imgt_pos)
+            mutations.append((g, q, raw_pos, imgt_pos, imgt_codon))
+    return mutations
+
+
+def reference_aa_mutations(segment):
+    mutations = []
+    for i, (q, g) in enumerate(zip(segment.query_alignment, segment.germline_alignment)):
+        raw_nt_pos = i + segment.query_start
+        imgt_nt_pos = segment.get_imgt_position_from_raw(raw_nt_pos)
+        if imgt_nt_pos is None:
+            continue
+        if imgt_nt_pos % 3 != 1:
+            continue
+        if any([q == '-', g == '-']):
+            continue
+        q_codon_end_pos = i + 3
+        if q_codon_end_pos >= len(segment.query_alignment):
+            continue
+        q_codon = segment.query_alignment[i:q_codon_end_pos]
+        while len(q_codon.replace('-', '')) < 3:
+            q_codon_end_pos += 1
+            q_codon = segment.query_alignment[i:q_codon_end_pos]
+            if q_codon_end_pos >= len(segment.query_alignment):
+                break
+        if len(q_codon.replace('-', '')) < 3:
+            continue
+        g_codon_end_pos = i + 3
+        g_codon = segment.germline_alignment[i:g_codon_end_pos]
+        while len(g_codon.replace('-', '')) < 3:
+            g_codon_end_pos += 1
+            g_codon = segment.germline_alignment[i:g_codon_end_pos]
+            # the original loop had no exit here (and never finished if the germline
+            # ran out of codons), so incomplete germline codons are skipped instead
+            if g_codon_end_pos > len(segment.germline_alignment):
+                break
+        if len(g_codon.replace('-', '')) < 3:
+            continue
+        q_aa = codons.get(q_codon.replace('-', ''), 'X')
+        g_aa = codons.get(g_codon.replace('-', ''), 'X')
+        if q_aa != g_aa:
+            imgt_aa_pos = int(math.ceil(imgt_nt_pos / 3.0))
+            if segment.gene_type == 'J':
+                imgt_aa_pos = segment.correct_imgt_aa_position_from_imgt(imgt_aa_pos)
+            mutations.append((g_aa, q_aa, None, imgt_aa_pos, imgt_aa_pos))
+    return mutations
+
+
+def as_tuples(mutations):
+    return [(m.was, m.now, m.raw_position, m.imgt_position, m.imgt_codon) for m in mutations]
+
+
+def prepare(segment):
+    # J-gene positions are corrected once the junction has been identified
+    if segment.gene_type == 'J':
+        segment._correct_imgt_nt_position_from_imgt = dict((p, p + 1) for p in range(300, 400))
+        segment._correct_imgt_aa_position_from_imgt = dict((p, p + 1) for p in range(100, 135))
+    segment.aa_sequence = 'X' * 100
+    return segment
+
+
+@pytest.mark.parametrize('query_start', [0, 7])
+def test_nt_mutations_match_reference(aligned_segment, query_start):
+    segment = prepare(aligned_segment(query_start))
+    expected = reference_nt_mutations(segment)
+    antibody = FakeAntibody(v=segment if segment.gene_type == 'V' else None,
+                            j=segment if segment.gene_type == 'J' else None)
+    nt_mutations(antibody)
+    assert antibody.exceptions == []
+    assert as_tuples(segment.nt_mutations) == expected
+    length = min(len(segment.query_alignment), len(segment.germline_alignment))
+    assert segment.nt_identity == 100. - (100. * len(expected) / length)
+
+
+@pytest.mark.parametrize('query_start', [0, 7])
+def test_aa_mutations_match_reference(aligned_segment, query_start):
+    segment = prepare(aligned_segment(query_start))
+    expected = reference_aa_mutations(segment)
+    # aa_mutations() annotates both the V and J genes
+    antibody = FakeAntibody(v=segment, j=prepare(aligned_segment(query_start)))
+    aa_mutations(antibody)
+    assert antibody.exceptions == []
+    assert as_tuples(segment.aa_mutations) == expected
+
+
+def test_mutations_are_found(aligned_segment):
+    # make sure the cases actually exercise mutation calling
+    segment = prepare(aligned_segment())
+    antibody = FakeAntibody(v=segment, j=prepare(aligned_segment()))
+    nt_mutations(antibody)
+    # indels aren't mutations
+    substituted = any([q != g and '-' not in [q, g] for q, g in zip(segment.query_alignment,
+                                                                    segment.germline_alignment)])
+    assert (segment.nt_mutations.count > 0) == substituted
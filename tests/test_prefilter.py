@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# filename: test_prefilter.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import random
+
+from abutils.core.sequence import Sequence
+
+from abstar.core.germline import get_ungapped_germlines
+from abstar.utils.prefilter import Prefilter, get_kmer_index, kmers
+
+
+def mutate(sequence, rate=0.08, seed=0):
+    rand = random.Random(seed)
+    return ''.join([rand.choice('ACGT'.replace(nt, '')) if rand.random() < rate else nt for nt in sequence])
+
+
+def reverse_complement(sequence):
+    return Sequence(['rc', sequence]).reverse_complement
+
+
+def random_sequence(length, seed=0):
+    rand = random.Random(seed)
+    return ''.join([rand.choice('ACGT') for _ in range(length)])
+
+
+def germline(name):
+    return get_ungapped_germlines('human', 'V')[name]
+
+
+def test_kmers_ignore_ambiguous_nucleotides():
+    assert len(kmers('ACGTACGT', 4)) == 4
+    assert len(kmers('ACGTNACGT', 4)) == 1
+    assert kmers('AAAC', 4).tolist() == [1]
+    assert kmers('GTTT', 4, reverse_complement=True).tolist() == [1]
+
+
+def test_prefilter_removes_non_antibody_reads():
+    heavy = Sequence(['heavy', mutate(germline('IGHV1-2*02'))])
+    kappa = Sequence(['kappa', reverse_complement(mutate(germline('IGKV1-39*01'), seed=1))])
+    phix = Sequence(['phix', random_sequence(300)])
+    dimer = Sequence(['dimer', 'ACACTCTTTCCCTACACGACGCTCTTCCGATCT'])
+    kept, removed = Prefilter('human')([heavy, phix, kappa, dimer])
+    assert [s.id for s in kept] == ['heavy', 'kappa']
+    assert [s.id for s in removed] == ['phix', 'dimer']
+
+
+def test_orientation():
+    index = get_kmer_index('human')
+    heavy = mutate(germline('IGHV3-23*01'))
+    strands = index.orient([heavy, reverse_complement(heavy), random_sequence(300), ''])
+    assert strands == ['plus', 'minus', None, None]
+
+
+def test_chain_classification():
+    index = get_kmer_index('human')
+    chains = index.classify([mutate(germline('IGHV1-2*02')),
+                             reverse_complement(mutate(germline('IGKV1-39*01'))),
+                             mutate(germline('IGLV2-14*01')),
+                             random_sequence(300)])
+    assert chains == ['heavy', 'kappa', 'lambda', None]
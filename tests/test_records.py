@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# filename: test_records.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import pickle
+
+import numpy as np
+import pytest
+
+from abstar.core.germline import GermlineHit, GermlineSegment
+from abstar.core.vdj import VDJ
+from abstar.utils.indels import Deletion, Insertion
+from abstar.utils.mutations import Mutation, Mutations, nt_mutations
+
+from .conftest import FakeAntibody, build_segment, edit_alignment, germline_alignment
+
+
+PROTOCOLS = list(range(2, pickle.HIGHEST_PROTOCOL + 1))
+
+
+def slot_values(obj):
+    '''
+    Returns the values of all of the slots of ``obj`` (and its base classes) that are set.
+    '''
+    values = {}
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            if hasattr(obj, slot):
+                values[slot] = getattr(obj, slot)
+    return values
+
+
+def assert_same_values(a, b):
+    assert sorted(a.keys()) == sorted(b.keys())
+    for key in a:
+        if isinstance(a[key], np.ndarray):
+            assert np.array_equal(a[key], b[key]), key
+        elif isinstance(a[key], Mutations):
+            assert [m.json_formatted for m in a[key]] == [m.json_formatted for m in b[key]], key
+        elif key in ['imgt_germline', 'imgt_gapped_alignment']:
+            assert type(a[key]) == type(b[key]), key
+        else:
+            assert a[key] == b[key], key
+
+
+def mutated_segment():
+    germline = germline_alignment('IGHV1-2*02')
+    query, germ = edit_alignment(germline, {10: 'T', 50: 'C', 120: 'A'}, [(150, 153)], {200: 'GGG'})
+    segment = build_segment('IGHV1-2*02', query, germ, query_start=4)
+    segment.others = [GermlineHit('IGHV1-2*04', 400.0), GermlineHit('IGHV1-2*06', 390.5)]
+    segment.aa_sequence = 'X' * 100
+    nt_mutations(FakeAntibody(v=segment))
+    return segment
+
+
+@pytest.mark.parametrize('cls', [Mutation, Insertion, Deletion, VDJ, GermlineSegment])
+def test_records_have_no_instance_dict(cls):
+    instances = {Mutation: lambda: Mutation('A', 'G', 10, 12, 4),
+                 Insertion: lambda: Insertion({'len': 3, 'pos': 10, 'seq': 'GGG', 'in frame': True}),
+                 Deletion: lambda: Deletion({'len': 1, 'pos': 10, 'seq': 'A', 'in frame': 'no'}),
+                 VDJ: lambda: VDJ(['seq1', 'ACGT']),
+                 GermlineSegment: lambda: GermlineSegment('IGHV1-2*02', 'human')}
+    obj = instances[cls]()
+    assert not hasattr(obj, '__dict__')
+    with pytest.raises(AttributeError):
+        obj.not_an_attribute = 1
+
+
+def test_germline_segment_attributes():
+    segment = GermlineSegment('IGKV1-39*01', 'human', score=250.0, strand='+',
+                              others=[GermlineHit('IGKV1-39*02', 240.0)], assigner_name='BLASTn')
+    assert segment.gene_type == 'V'
+    assert segment.chain == 'kappa'
+    assert segment.family == 'IGKV1'
+    assert segment.gene == 'IGKV1-39'
+    assert segment.assigner == 'blastn'
+    assert segment.others[0].full == 'IGKV1-39*02'
+    assert segment.others[0].assigner_score == 240.0
+    # attributes populated by mutation calling are declared and initialized
+    for attr in ['nt_mutations', 'nt_identity', 'aa_mutations', 'aa_identity', 'regions']:
+        assert getattr(segment, attr) is None
+    assert segment.insertions == []
+    assert segment.deletions == []
+    assert segment.logs == ['GERMLINE: IGKV1-39*01']
+    segment.log('realigned')
+    assert segment.logs[-1] == 'realigned'
+
+
+def test_indel_attributes():
+    insertion = Insertion({'len': 3, 'pos': 10, 'seq': 'GGG', 'in frame': True, 'fixed': False})
+    deletion = Deletion({'len': 1, 'pos': 20, 'seq': 'A', 'in frame': 'no'})
+    assert insertion.type == 'insertion'
+    assert deletion.type == 'deletion'
+    assert insertion.in_frame == 'yes'
+    assert deletion.in_frame == 'no'
+    assert insertion['seq'] == 'GGG'
+    assert 'fixed' in insertion
+    insertion.imgt_position = 30
+    insertion.imgt_codon = 10
+    assert insertion.imgt_formatted == '30^31>ins^ggg'
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_mutation_pickle_round_trip(protocol):
+    mutation = Mutation('A', 'G', 10, 12, 4)
+    copy = pickle.loads(pickle.dumps(mutation, protocol))
+    assert slot_values(copy) == slot_values(mutation)
+    assert copy.abstar_formatted == '12:A>G'
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_indel_pickle_round_trip(protocol):
+    for indel in [Insertion({'len': 3, 'pos': 10, 'seq': 'GGG', 'in frame': True}),
+                  Deletion({'len': 2, 'pos': 20, 'seq': 'AC', 'in frame': False})]:
+        indel.imgt_position = 40
+        indel.imgt_codon = 14
+        copy = pickle.loads(pickle.dumps(indel, protocol))
+        assert type(copy) == type(indel)
+        assert slot_values(copy) == slot_values(indel)
+        assert copy.imgt_formatted == indel.imgt_formatted
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_germline_segment_pickle_round_trip(protocol):
+    segment = mutated_segment()
+    assert segment.nt_mutations.count == 3
+    copy = pickle.loads(pickle.dumps(segment, protocol))
+    assert_same_values(slot_values(copy), slot_values(segment))
+    # position lookups still work on the copy
+    assert copy.get_imgt_position_from_raw(10) == segment.get_imgt_position_from_raw(10)
+    assert copy.others[0] == GermlineHit('IGHV1-2*04', 400.0)
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_vdj_pickle_round_trip(protocol):
+    segment = mutated_segment()
+    vdj = VDJ(['seq1', 'ACGTACGT'], v=segment)
+    vdj.umi_count = 3
+    vdj.log('assigned')
+    copy = pickle.loads(pickle.dumps(vdj, protocol))
+    assert copy.id == 'seq1'
+    assert copy.sequence.sequence == 'ACGTACGT'
+    assert copy.umi_count == 3
+    assert copy.v.full == 'IGHV1-2*02'
+    assert copy.d is None
+    assert copy.logs == vdj.logs
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# filename: test_regions.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import pytest
+
+from abstar.utils.regions import (IMGT_REGION_END_POSITIONS_NT, IMGT_REGION_START_POSITIONS_NT,
+                                  JoiningRegions, VariableRegions)
+
+from .conftest import FakeAntibody
+
+
+# Reference implementations: IMGT numbering and region boundaries as they were computed
+# with dict-based position maps, before the maps became dense arrays.
+
+def reference_numbering(segment):
+    '''
+    Returns the (raw_position_from_imgt, imgt_position_from_raw) dicts, along with
+    the IMGT nt and aa position lists.
+    '''
+    aln_start = segment.query_start
+    aln_pos = 0
+    imgt_start = segment.imgt_gapped_alignment.target_begin + 1
+    imgt_pos = imgt_start
+    raw_position_from_imgt = {}
+    imgt_position_from_raw = {}
+    imgt_nt_positions = []
+    imgt_aa_positions = []
+    imgt_start_offset = segment._get_imgt_start_offset()
+    query_del_adjustment = 0
+    for gl in segment.imgt_germline.gapped_nt_sequence[imgt_start:]:
+        if (imgt_pos + imgt_start_offset) % 3 == 1:
+            codon = segment.germline_alignment[aln_pos:aln_pos + 3]
+            if codon.count('-') >= 2:
+                imgt_aa_positions.append(None)
+            else:
+                imgt_aa_positions.append((imgt_pos + imgt_start_offset + 2) / 3)
+        if gl == '.':
+            raw_position_from_imgt[imgt_pos + imgt_start_offset] = None
+            imgt_pos += 1
+            continue
+        if segment.query_alignment[aln_pos] == '-':
+            raw_position_from_imgt[imgt_pos + imgt_start_offset] = None
+            aln_pos += 1
+            imgt_pos += 1
+            query_del_adjustment += 1
+            continue
+        if segment.germline_alignment[aln_pos] == '-':
+            while segment.germline_alignment[aln_pos] == '-':
+                imgt_position_from_raw[aln_pos + segment.query_start - query_del_adjustment] = None
+                imgt_nt_positions.append(None)
+                aln_pos += 1
+        raw_position_from_imgt[imgt_pos + imgt_start_offset] = aln_pos + aln_start - query_del_adjustment
+        imgt_position_from_raw[aln_pos + aln_start - query_del_adjustment] = imgt_pos + imgt_start_offset
+        imgt_nt_positions.append(imgt_pos + imgt_start_offset)
+        aln_pos += 1
+        imgt_pos += 1
+        if aln_pos >= len(segment.germline_alignment):
+            break
+    return raw_position_from_imgt, imgt_position_from_raw, imgt_nt_positions, imgt_aa_positions
+
+
+def reference_region_positions(region, raw_from_imgt, imgt_from_raw):
+    numbered = [p for p in imgt_from_raw.values() if p is not None]
+    # start
+    imgt_start = IMGT_REGION_START_POSITIONS_NT[region]
+    if imgt_start > max(numbered):
+        start = None
+    else:
+        while raw_from_imgt.get(imgt_start) is None:
+            if imgt_start >= IMGT_REGION_END_POSITIONS_NT[region]:
+                break
+            imgt_start += 1
+        start = raw_from_imgt.get(imgt_start)
+    # end
+    imgt_end = IMGT_REGION_END_POSITIONS_NT[region]
+    if imgt_end < min(numbered):
+        end = None
+    else:
+        while raw_from_imgt.get(imgt_end) is None:
+            imgt_end -= 1
+            if imgt_end < IMGT_REGION_START_POSITIONS_NT[region]:
+                break
+        # previously, an end that couldn't be found raised a TypeError here
+        end = raw_from_imgt.get(imgt_end)
+        end = end + 1 if end is not None else None
+    return [start, end]
+
+
+def reference_closest_imgt_position(raw, imgt_from_raw):
+    while imgt_from_raw.get(raw) is None:
+        raw -= 1
+        if raw < 0:
+            return None
+    return imgt_from_raw[raw]
+
+
+def as_dict(position_map):
+    return dict((i, int(p)) for i, p in enumerate(position_map) if p >= 0)
+
+
+def numbered(position_dict):
+    return dict((k, v) for k, v in position_dict.items() if v is not None)
+
+
+@pytest.mark.parametrize('query_start', [0, 7])
+def test_imgt_numbering_matches_reference(aligned_segment, query_start):
+    segment = aligned_segment(query_start)
+    raw_from_imgt, imgt_from_raw, nt_positions, aa_positions = reference_numbering(segment)
+    assert as_dict(segment._raw_position_from_imgt) == numbered(raw_from_imgt)
+    assert as_dict(segment._imgt_position_from_raw) == numbered(imgt_from_raw)
+    assert segment.imgt_nt_positions == nt_positions
+    assert segment.imgt_aa_positions == aa_positions
+
+
+def test_position_lookups_match_reference(aligned_segment):
+    segment = aligned_segment(7)
+    raw_from_imgt, imgt_from_raw, _, _ = reference_numbering(segment)
+    raw_positions = list(range(-2, max(imgt_from_raw) + 5))
+    imgt_positions = list(range(-2, max(raw_from_imgt) + 5))
+    assert [segment.get_imgt_position_from_raw(r) for r in raw_positions] == \
+        [imgt_from_raw.get(r) for r in raw_positions]
+    assert [segment.get_raw_position_from_imgt(i) for i in imgt_positions] == \
+        [raw_from_imgt.get(i) for i in imgt_positions]
+    # vectorized lookups use -1 for missing positions
+    assert segment.get_imgt_positions_from_raw(raw_positions).tolist() == \
+        [-1 if imgt_from_raw.get(r) is None else imgt_from_raw[r] for r in raw_positions]
+    assert segment.get_raw_positions_from_imgt(imgt_positions).tolist() == \
+        [-1 if raw_from_imgt.get(i) is None else raw_from_imgt[i] for i in imgt_positions]
+    assert segment.get_imgt_position_from_raw(None) is None
+
+
+def test_region_positions_match_reference(aligned_segment):
+    segment = aligned_segment(7)
+    raw_from_imgt, imgt_from_raw, _, _ = reference_numbering(segment)
+    if segment.gene_type == 'V':
+        regions = VariableRegions(FakeAntibody(v=segment))
+    else:
+        regions = JoiningRegions(FakeAntibody(j=segment))
+    expected = dict((r, reference_region_positions(r, raw_from_imgt, imgt_from_raw)) for r in regions.region_names)
+    assert regions.raw_nt_positions == expected
+
+
+def test_region_positions_cover_the_alignment(aligned_segment):
+    # V-gene regions are contiguous: each region ends where the next one starts
+    segment = aligned_segment()
+    if segment.gene_type != 'V':
+        pytest.skip('J genes only contain FR4')
+    positions = VariableRegions(FakeAntibody(v=segment)).raw_nt_positions
+    names = ['FR1', 'CDR1', 'FR2', 'CDR2', 'FR3']
+    for region, next_region in zip(names, names[1:]):
+        if positions[region][1] is not None and positions[next_region][0] is not None:
+            assert positions[region][1] == positions[next_region][0]
+
+
+def test_region_deletion_uses_neighboring_positions(aligned_segment):
+    # delete the start of CDR1 (IMGT 79-81) from the query
+    segment = aligned_segment()
+    if segment.gene_type != 'V':
+        pytest.skip('J genes only contain FR4')
+    start = segment.get_raw_position_from_imgt(IMGT_REGION_START_POSITIONS_NT['CDR1'])
+    if start is None or '-' in segment.query_alignment:
+        pytest.skip('the alignment already contains an indel, or CDR1 is missing')
+    segment.query_alignment = segment.query_alignment[:start] + '---' + segment.query_alignment[start + 3:]
+    segment.imgt_nt_positions = []
+    segment.imgt_aa_positions = []
+    segment._imgt_numbering()
+    raw_from_imgt, imgt_from_raw, _, _ = reference_numbering(segment)
+    positions = VariableRegions(FakeAntibody(v=segment)).raw_nt_positions
+    assert positions['CDR1'] == reference_region_positions('CDR1', raw_from_imgt, imgt_from_raw)
+    assert positions['CDR1'][0] == segment.get_raw_position_from_imgt(IMGT_REGION_START_POSITIONS_NT['CDR1'] + 3)
+
+
+def test_closest_imgt_position_matches_reference(aligned_segment):
+    segment = aligned_segment(7)
+    _, imgt_from_raw, _, _ = reference_numbering(segment)
+    for raw in range(0, max(imgt_from_raw) + 5):
+        assert segment._closest_imgt_position_from_raw(raw) == reference_closest_imgt_position(raw, imgt_from_raw)
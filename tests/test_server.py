@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# filename: test_server.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import sys
+import threading
+
+import pytest
+
+from abstar.core import abstar
+from abstar.core import server as server_module
+from abstar.core.server import AnnotationServer, AnnotationRequestHandler
+
+if sys.version_info[0] > 2:
+    from http.server import HTTPServer
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+    import queue
+else:
+    from BaseHTTPServer import HTTPServer
+    from urllib2 import HTTPError, Request, urlopen
+    import Queue as queue
+
+
+
+class SynchronousPool(object):
+    '''
+    Stands in for ``multiprocessing.Pool``, running jobs in the calling thread.
+    '''
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        try:
+            result = func(*args)
+        except Exception as e:
+            error_callback(e)
+        else:
+            callback(result)
+
+
+def fake_process_sequences(sequences, args):
+    return [{'seq_id': s.id, 'uid': args.uid} for s in sequences]
+
+
+def failing_process_sequences(sequences, args):
+    raise ValueError('annotation failed')
+
+
+@pytest.fixture
+def annotation_server(tmpdir):
+    # skips the worker pool and germline arena, which aren't needed to test request handling
+    srv = AnnotationServer.__new__(AnnotationServer)
+    HTTPServer.__init__(srv, ('127.0.0.1', 0), AnnotationRequestHandler)
+    srv.processes = 1
+    srv.batch_window = 0.001
+    srv.batch_size = 500
+    srv.species = ['human', ]
+    srv.temp = str(tmpdir)
+    srv.pool = SynchronousPool()
+    srv.requests = queue.Queue()
+    srv.batcher = threading.Thread(target=srv._batch_requests)
+    srv.batcher.daemon = True
+    srv.batcher.start()
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def post(srv, sequences, options=None):
+    payload = json.dumps({'sequences': sequences, 'options': options or {}}).encode('utf-8')
+    request = Request('http://127.0.0.1:{}/annotate'.format(srv.server_address[1]),
+                      data=payload,
+                      headers={'Content-Type': 'application/json'})
+    return json.loads(urlopen(request, timeout=30).read().decode('utf-8'))
+
+
+def test_annotate(annotation_server, monkeypatch):
+    monkeypatch.setattr(abstar, 'process_sequences', fake_process_sequences)
+    results = post(annotation_server, [['seq1', 'ACGT'], ['seq2', 'GGCC']], {'uid': 4})
+    assert sorted([(r['seq_id'], r['uid']) for r in results]) == [('seq1', 4), ('seq2', 4)]
+
+
+def test_invalid_options_return_400(annotation_server, monkeypatch):
+    monkeypatch.setattr(abstar, 'process_sequences', fake_process_sequences)
+    with pytest.raises(HTTPError) as e:
+        post(annotation_server, [['seq1', 'ACGT']], {'uid': 'not-a-number'})
+    assert e.value.code == 400
+    # the batcher thread is still running
+    assert annotation_server.batcher.is_alive()
+    assert post(annotation_server, [['seq1', 'ACGT']])[0]['seq_id'] == 'seq1'
+
+
+def test_worker_exceptions_return_500(annotation_server, monkeypatch):
+    monkeypatch.setattr(abstar, 'process_sequences', failing_process_sequences)
+    with pytest.raises(HTTPError) as e:
+        post(annotation_server, [['seq1', 'ACGT']])
+    assert e.value.code == 500
+
+
+def test_dispatch_errors_fail_the_batch(annotation_server, monkeypatch):
+    def failing_request_args(options):
+        raise ValueError('invalid options')
+    monkeypatch.setattr(abstar, 'process_sequences', fake_process_sequences)
+    monkeypatch.setattr(annotation_server, 'request_args', failing_request_args)
+    with pytest.raises(RuntimeError):
+        annotation_server.annotate([['seq1', 'ACGT']], {}, timeout=30)
+    monkeypatch.undo()
+    monkeypatch.setattr(abstar, 'process_sequences', fake_process_sequences)
+    assert annotation_server.batcher.is_alive()
+    assert annotation_server.annotate([['seq1', 'ACGT']], {}, timeout=30)[0]['seq_id'] == 'seq1'
+
+
+def test_request_options_are_filtered():
+    options = server_module.request_options({'uid': 4, 'output': '/etc', 'species': 'mouse'})
+    assert options == {'uid': 4, 'species': 'mouse'}
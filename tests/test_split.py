@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# filename: test_split.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+from Bio import SeqIO
+
+from abstar.core.abstar import Args, count_sequences, get_chunk_names, iter_split_file
+
+
+def write(path, contents):
+    with open(path, 'w') as f:
+        f.write(contents)
+    return path
+
+
+def split(path, fmt, tmpdir, chunksize, skip=None):
+    args = Args(chunksize=chunksize)
+    return list(iter_split_file(path, fmt, str(tmpdir), args, skip=skip))
+
+
+def test_split_fasta(tmpdir):
+    # wrapped sequences and descriptions are preserved
+    path = write(str(tmpdir.join('input.fasta')),
+                 '>seq1 first\nACGT\nACGT\n>seq2\nTTTT\n>seq3\nGGGG\n>seq4\nCCCC\n>seq5\nAAAA\n')
+    assert count_sequences(path, 'fasta') == 5
+    chunks = split(path, 'fasta', tmpdir, 2)
+    assert chunks == get_chunk_names(path, str(tmpdir), 5, Args(chunksize=2))
+    records = [r for c in chunks for r in SeqIO.parse(c, 'fasta')]
+    assert [r.description for r in records] == ['seq1 first', 'seq2', 'seq3', 'seq4', 'seq5']
+    assert str(records[0].seq) == 'ACGTACGT'
+
+
+def test_split_fastq(tmpdir):
+    reads = ''.join(['@read{}\nACGT\n+\nIIII\n'.format(i) for i in range(3)])
+    path = write(str(tmpdir.join('input.fastq')), reads)
+    assert count_sequences(path, 'fastq') == 3
+    chunks = split(path, 'fastq', tmpdir, 2)
+    assert [len(list(SeqIO.parse(c, 'fastq'))) for c in chunks] == [2, 1]
+    assert ''.join([open(c).read() for c in chunks]) == reads
+
+
+def test_split_minimal(tmpdir):
+    path = write(str(tmpdir.join('input.csv')), 'seq_id,vdj_nt\na,ACGT\n\nb,TTTT\nc,GGGG')
+    assert count_sequences(path, 'minimal') == 3
+    chunks = split(path, 'minimal', tmpdir, 2)
+    assert [open(c).read() for c in chunks] == ['seq_id,vdj_nt\na,ACGT\nb,TTTT\n', 'seq_id,vdj_nt\nc,GGGG\n']
+
+
+def test_split_skips_completed_chunks(tmpdir):
+    path = write(str(tmpdir.join('input.fasta')), ''.join(['>seq{}\nACGT\n'.format(i) for i in range(4)]))
+    names = get_chunk_names(path, str(tmpdir), 4, Args(chunksize=1))
+    chunks = split(path, 'fasta', tmpdir, 1, skip=names[:2])
+    assert chunks == names[2:]
+    assert not os.path.exists(names[0])
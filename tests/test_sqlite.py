@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# filename: test_sqlite.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import sqlite3
+
+from abstar.utils.sqlite import SQLITE_INDEXES, SQLITE_TABLE, merge_sqlite, sqlite_row, write_sqlite
+
+
+def record(i):
+    return {'seq_id': 'seq{}'.format(i),
+            'chain': 'heavy',
+            'v_gene': {'full': 'IGHV1-2*02', 'gene': 'IGHV1-2', 'score': 400 + i},
+            'j_gene': {'full': 'IGHJ4*02', 'gene': 'IGHJ4'},
+            'cdr3_aa': 'ARG' + 'Y' * (i % 5),
+            'cdr3_len': 3 + i % 5,
+            'nt_identity': {'v': 95.5},
+            'prod': 'yes'}
+
+
+def test_sqlite_row():
+    row = sqlite_row(record(1))
+    assert row[:4] == ('seq1', 'heavy', 'IGHV1-2*02', 'IGHV1-2')
+    # missing D-gene
+    assert row[4:6] == (None, None)
+    assert json.loads(row[-1])['v_gene']['score'] == 401
+
+
+def test_merge_sqlite(tmpdir):
+    job_files = []
+    for job in range(3):
+        db_file = str(tmpdir.join('job_{}.db'.format(job)))
+        write_sqlite([sqlite_row(record(job * 10 + i)) for i in range(10)], db_file)
+        job_files.append(db_file)
+    output = str(tmpdir.join('merged.db'))
+    # missing job databases (from failed jobs) are skipped
+    merge_sqlite(job_files + [str(tmpdir.join('missing.db'))], output)
+    conn = sqlite3.connect(output)
+    seq_ids = [r[0] for r in conn.execute('SELECT seq_id FROM {} ORDER BY rowid'.format(SQLITE_TABLE))]
+    assert seq_ids == ['seq{}'.format(i) for i in range(30)]
+    indexes = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert sorted(indexes) == sorted(['{}_{}'.format(SQLITE_TABLE, c) for c in SQLITE_INDEXES])
+    score = conn.execute("SELECT json_extract(data, '$.v_gene.score') FROM {} WHERE seq_id = 'seq25'".format(
+        SQLITE_TABLE)).fetchone()[0]
+    assert score == 425
+    conn.close()
+
+
+def test_merge_sqlite_overwrites_existing_output(tmpdir):
+    db_file = str(tmpdir.join('job_0.db'))
+    write_sqlite([sqlite_row(record(0))], db_file)
+    output = str(tmpdir.join('merged.db'))
+    merge_sqlite([db_file], output)
+    merge_sqlite([db_file], output)
+    conn = sqlite3.connect(output)
+    assert conn.execute('SELECT COUNT(*) FROM {}'.format(SQLITE_TABLE)).fetchone()[0] == 1
+    conn.close()
+    assert os.path.isfile(db_file)
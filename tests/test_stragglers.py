@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# filename: test_stragglers.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import time
+
+import pytest
+
+from abstar.core import abstar
+from abstar.utils.stragglers import SequenceTimeout, StragglerTracker, time_limit
+
+
+class FakeJob(object):
+    def __init__(self, seq_file, outcome, ready_at):
+        self.seq_file = seq_file
+        self.outcome = outcome
+        self.ready_at = ready_at
+
+
+class FakeRunner(object):
+    '''
+    Runs jobs on a simulated clock, which advances by one tick per call to ``wait()``.
+    ``plan`` maps each input file to ``(outcome, ticks)``, where ``outcome`` is ``'ok'``,
+    ``'fail'`` (the job returns ``None``, like ``run_abstar()``) or ``'error'`` (collecting
+    the result raises, like a failed Celery task) and ``ticks`` is the job's run time
+    (``None`` never finishes). Like the multiprocessing runner, every submitted job
+    (including re-dispatched jobs) reports its start.
+    '''
+    def __init__(self, plan, slow=()):
+        self.plan = plan
+        self.slow = set(slow)
+        self.capacity = None
+        self.tick = 0
+        self.cancelled = []
+        self.submitted = []
+        self.reported = set()
+
+    def submit(self, seq_file, output_dir, log_dir, file_format, arg_dict):
+        outcome, ticks = self.plan[seq_file]
+        ready_at = None if ticks is None else self.tick + ticks
+        self.submitted.append(seq_file)
+        return FakeJob(seq_file, outcome, ready_at)
+
+    def wait(self, timeout):
+        self.tick += 1
+        assert self.tick < 100, 'monitor_jobs did not finish'
+
+    def ready(self, job):
+        return job.ready_at is not None and self.tick >= job.ready_at
+
+    def get(self, job):
+        if job.outcome == 'fail':
+            return None
+        if job.outcome == 'error':
+            raise RuntimeError('{} failed'.format(job.seq_file))
+        return job.seq_file
+
+    def started(self, jobs):
+        # slow jobs are reported as having started long ago, so they're stragglers right away
+        starts = []
+        for seq_file in self.submitted:
+            if seq_file not in self.reported:
+                self.reported.add(seq_file)
+                start = time.time() - (1000 if seq_file in self.slow else 0)
+                starts.append((seq_file, start))
+        return starts
+
+    def cancel(self, job):
+        self.cancelled.append(job.seq_file)
+
+
+def fake_merge_job_results(seq_file, results, output_dir, log_dir, args):
+    # like merge_job_results(), fails unless every re-dispatched job succeeded
+    if any([r is None for r in results]):
+        raise ValueError('a re-dispatched job failed')
+    return 'merged:' + ','.join(results)
+
+
+class RecordingTracker(StragglerTracker):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingTracker, self).__init__(*args, **kwargs)
+        RecordingTracker.instances.append(self)
+
+
+@pytest.fixture
+def speculation(monkeypatch):
+    monkeypatch.setattr(abstar, 'logger', logging.getLogger('abstar'), raising=False)
+    monkeypatch.setattr(abstar, 'update_progress', lambda *a, **k: None)
+    monkeypatch.setattr(abstar, 'split_speculative_job', lambda f, fmt: [f + '.spec0', f + '.spec1'])
+    monkeypatch.setattr(abstar, 'merge_job_results', fake_merge_job_results)
+    monkeypatch.setattr(abstar, 'StragglerTracker', RecordingTracker)
+    RecordingTracker.instances = []
+
+
+def run(runner, files):
+    args = abstar.Args(chunk_timeout=60)
+    finished = []
+    results = abstar.monitor_jobs(runner, files, 'out', 'log', 'fasta', args,
+                                  callback=lambda f, r: finished.append(f), total=len(files))
+    return results, finished
+
+
+def test_time_limit():
+    with pytest.raises(SequenceTimeout):
+        with time_limit(0.05):
+            while True:
+                pass
+    with time_limit(0):
+        time.sleep(0.01)
+
+
+def test_tracker_flags_stragglers_once():
+    tracker = StragglerTracker(factor=2, min_finished=2)
+    for job, start, end in [('a', 0, 10), ('b', 0, 20)]:
+        tracker.started(job, start)
+        tracker.finished(job, end)
+    tracker.started('c', 0)
+    tracker.started('d', 20)
+    assert tracker.median == 15
+    assert tracker.stragglers(now=40) == ['c']
+    assert tracker.stragglers(now=41) == []
+
+
+def test_monitor_jobs_without_stragglers(speculation):
+    runner = FakeRunner({'a': ('ok', 1), 'b': ('fail', 2), 'c': ('ok', 3), 'd': ('error', 1)})
+    results, finished = run(runner, ['a', 'b', 'c', 'd'])
+    assert results == ['a', 'c']
+    assert finished == ['a', 'c']
+
+
+def test_redispatched_jobs_win(speculation):
+    runner = FakeRunner({'a': ('ok', None), 'a.spec0': ('ok', 1), 'a.spec1': ('ok', 2)}, slow=['a'])
+    results, finished = run(runner, ['a'])
+    assert results == ['merged:a.spec0,a.spec1']
+    assert runner.cancelled == ['a']
+
+
+def test_original_job_wins(speculation):
+    runner = FakeRunner({'a': ('ok', 2), 'a.spec0': ('ok', None), 'a.spec1': ('ok', 1)}, slow=['a'])
+    results, finished = run(runner, ['a'])
+    assert results == ['a']
+    assert sorted(runner.cancelled) == ['a.spec0', 'a.spec1']
+
+
+def test_failed_original_waits_for_redispatched_jobs(speculation):
+    runner = FakeRunner({'a': ('fail', 2), 'a.spec0': ('ok', 4), 'a.spec1': ('ok', 5)}, slow=['a'])
+    results, finished = run(runner, ['a'])
+    assert results == ['merged:a.spec0,a.spec1']
+    assert finished == ['a']
+
+
+def test_failed_redispatched_jobs_wait_for_original(speculation):
+    runner = FakeRunner({'a': ('ok', 5), 'a.spec0': ('fail', 1), 'a.spec1': ('ok', 1)}, slow=['a'])
+    results, finished = run(runner, ['a'])
+    assert results == ['a']
+
+
+def test_redispatched_job_that_returns_none_fails_the_merge(speculation):
+    runner = FakeRunner({'a': ('ok', 6), 'a.spec0': ('fail', 1), 'a.spec1': ('ok', 1)}, slow=['a'])
+    results, finished = run(runner, ['a'])
+    # the merge would be missing a.spec0's sequences, so the original job is used
+    assert results == ['a']
+    assert finished == ['a']
+
+
+def test_redispatched_jobs_are_finished_in_the_tracker(speculation):
+    runner = FakeRunner({'a': ('ok', None), 'a.spec0': ('ok', 1), 'a.spec1': ('ok', 2)}, slow=['a'])
+    run(runner, ['a'])
+    tracker = RecordingTracker.instances[0]
+    assert 'a.spec0' in tracker.durations and 'a.spec1' in tracker.durations
+
+
+def test_merge_job_results_fails_if_a_job_failed(tmpdir):
+    with pytest.raises(ValueError):
+        abstar.merge_job_results('a', [None, None], str(tmpdir), str(tmpdir), abstar.Args())
+
+
+def test_job_fails_when_original_and_redispatched_jobs_fail(speculation):
+    runner = FakeRunner({'a': ('fail', 2), 'a.spec0': ('fail', 4), 'a.spec1': ('ok', 4),
+                         'b': ('ok', 1)}, slow=['a'])
+    results, finished = run(runner, ['a', 'b'])
+    assert results == ['b']
+    assert finished == ['b']
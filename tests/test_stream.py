@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# filename: test_stream.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import pytest
+
+from abstar.core import abstar
+
+
+def annotate_chunk(sequences, arg_dict):
+    # stands in for germline assignment and annotation, which need BLASTn
+    return [{'seq_id': s[0], 'vdj_nt': s[1].upper()} for s in sequences]
+
+
+def failing_chunk(sequences, arg_dict):
+    if any([s[0] == 'seq13' for s in sequences]):
+        raise ValueError('chunk failed')
+    return annotate_chunk(sequences, arg_dict)
+
+
+def fake_process_sequences(sequences, args):
+    return annotate_chunk([[s.id, s.sequence] for s in sequences], None)
+
+
+class CountingIterator(object):
+    def __init__(self, n):
+        self.n = n
+        self.consumed = 0
+
+    def __iter__(self):
+        for i in range(self.n):
+            self.consumed += 1
+            yield ['seq{}'.format(i), 'acgt' * 10]
+
+
+def test_stream_single_process_preserves_input_order(monkeypatch):
+    monkeypatch.setattr(abstar, 'process_sequences', fake_process_sequences)
+    results = list(abstar.stream(CountingIterator(25), chunksize=4, processes=1))
+    assert [r['seq_id'] for r in results] == ['seq{}'.format(i) for i in range(25)]
+    assert results[0]['vdj_nt'] == 'ACGT' * 10
+
+
+def test_stream_returns_every_sequence_once(monkeypatch):
+    monkeypatch.setattr(abstar, '_process_sequence_chunk', annotate_chunk)
+    results = list(abstar.stream(CountingIterator(50), chunksize=3, processes=2))
+    assert sorted([r['seq_id'] for r in results]) == sorted(['seq{}'.format(i) for i in range(50)])
+
+
+def test_stream_consumes_input_lazily(monkeypatch):
+    monkeypatch.setattr(abstar, '_process_sequence_chunk', annotate_chunk)
+    sequences = CountingIterator(10000)
+    results = abstar.stream(sequences, chunksize=10, processes=2)
+    next(results)
+    # at most 2 chunks per process are in flight, plus the chunk being queued
+    assert sequences.consumed <= (2 * 2 + 1) * 10
+    results.close()
+
+
+def test_stream_raises_if_a_chunk_fails(monkeypatch):
+    monkeypatch.setattr(abstar, '_process_sequence_chunk', failing_chunk)
+    with pytest.raises(ValueError):
+        list(abstar.stream(CountingIterator(40), chunksize=5, processes=2))
+
+
+def failing_process_sequences(sequences, args):
+    if any([s.id == 'seq13' for s in sequences]):
+        raise ValueError('chunk failed')
+    return fake_process_sequences(sequences, args)
+
+
+def test_worker_exceptions_reach_the_stream(monkeypatch):
+    # the worker function itself doesn't swallow exceptions from annotation
+    monkeypatch.setattr(abstar, 'process_sequences', failing_process_sequences)
+    with pytest.raises(ValueError):
+        list(abstar.stream(CountingIterator(40), chunksize=5, processes=2))
+
+
+def test_invalid_sequence_raises_value_error(monkeypatch):
+    def sequence(s):
+        if s is None:
+            raise TypeError('not a sequence')
+        return real_sequence(s)
+    real_sequence = abstar.Sequence
+    monkeypatch.setattr(abstar, 'Sequence', sequence)
+    monkeypatch.setattr(abstar, 'process_sequences', fake_process_sequences)
+    with pytest.raises(ValueError):
+        list(abstar.stream([['seq1', 'ACGT'], None], chunksize=5, processes=1))
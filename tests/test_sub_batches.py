@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# filename: test_sub_batches.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import threading
+
+from abstar.core import abstar
+
+
+class FakeAssigner(object):
+    def __init__(self):
+        self.seq_file = None
+
+    def __call__(self, seq_file, file_format):
+        self.seq_file = seq_file
+        with open(seq_file) as f:
+            self.ids = [l[1:].strip() for l in f if l.startswith('>')]
+
+
+def write_fasta(path, n):
+    with open(path, 'w') as f:
+        for i in range(n):
+            f.write('>seq{}\nACGT\n'.format(i))
+    return path
+
+
+def test_assign_sub_batches_in_order(tmp_path):
+    seq_file = write_fasta(str(tmp_path / 'seqs.fasta'), 10)
+    assigners = list(abstar.assign_sub_batches(FakeAssigner, seq_file, 'fasta', sub_batch_size=3))
+    assert [len(a.ids) for a in assigners] == [3, 3, 3, 1]
+    assert [i for a in assigners for i in a.ids] == ['seq{}'.format(i) for i in range(10)]
+    assert not any(os.path.exists(a.seq_file) for a in assigners)
+
+
+def test_assign_sub_batches_early_stop(tmp_path):
+    seq_file = write_fasta(str(tmp_path / 'seqs.fasta'), 20)
+    before = threading.active_count()
+    batches = abstar.assign_sub_batches(FakeAssigner, seq_file, 'fasta', sub_batch_size=1)
+    first = next(batches)
+    assert first.ids == ['seq0']
+    # the producer fills the queue and would block on the next put
+    batches.close()
+    assert threading.active_count() == before
+    assert os.listdir(str(tmp_path)) == ['seqs.fasta']
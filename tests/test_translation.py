@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# filename: test_translation.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import random
+import warnings
+
+import pytest
+
+from Bio.Seq import Seq
+from Bio.Alphabet import generic_dna
+
+from abstar.utils.translation import ARRAY_TRANSLATION_MIN_LENGTH, translate
+
+from .conftest import germline_alignment
+
+
+def reference_translate(sequence):
+    # the previous translation, which also ignored a partial codon at the end (with a warning)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return str(Seq(sequence, generic_dna).translate())
+
+
+def random_sequence(length, alphabet, seed):
+    rng = random.Random(seed)
+    return ''.join([rng.choice(alphabet) for _ in range(length)])
+
+
+# short sequences use per-codon lookups, longer ones use an array lookup
+LENGTHS = [0, 1, 2, 3, 4, 5, 30, 31, ARRAY_TRANSLATION_MIN_LENGTH - 1, ARRAY_TRANSLATION_MIN_LENGTH,
+           ARRAY_TRANSLATION_MIN_LENGTH + 2, 400]
+
+
+@pytest.mark.parametrize('length', LENGTHS)
+@pytest.mark.parametrize('alphabet', ['ACGT', 'acgt', 'ACGTacgt', 'ACGTN', 'ACGTRYKMSWBDHVN', 'acgtnry'])
+def test_translate_matches_biopython(length, alphabet):
+    for seed in range(5):
+        sequence = random_sequence(length, alphabet, seed)
+        assert translate(sequence) == reference_translate(sequence)
+
+
+@pytest.mark.parametrize('codon', ['NNN', 'ATN', 'TAR', 'TRA', 'MGR', 'YTN', 'GGN', 'nnn', 'tar', 'atg'])
+@pytest.mark.parametrize('length', [30, ARRAY_TRANSLATION_MIN_LENGTH + 30])
+def test_ambiguous_codons(codon, length):
+    # the same ambiguous codon, repeated (to exercise the cache) in short and long sequences
+    sequence = random_sequence(length, 'ACGT', codon)
+    sequence = codon + sequence[3:length // 2] + codon + sequence[length // 2 + 3 - (length // 2) % 3:]
+    assert translate(sequence) == reference_translate(sequence)
+
+
+@pytest.mark.parametrize('length', [30, ARRAY_TRANSLATION_MIN_LENGTH + 30])
+def test_gapped_codons_are_rejected(length):
+    # gaps aren't valid nucleotides, so translation fails just as it did with Biopython
+    sequence = random_sequence(length, 'ACGT', length)
+    sequence = sequence[:12] + 'A-G' + sequence[15:]
+    with pytest.raises(Exception) as expected:
+        reference_translate(sequence)
+    with pytest.raises(type(expected.value)):
+        translate(sequence)
+
+
+@pytest.mark.parametrize('gene', ['IGHV1-2*02', 'IGKV1-39*01', 'IGLV2-14*01', 'IGHJ4*02'])
+@pytest.mark.parametrize('frame', [0, 1, 2])
+def test_translate_germlines(gene, frame):
+    sequence = germline_alignment(gene)[frame:]
+    assert translate(sequence) == reference_translate(sequence)
+    assert translate(sequence.lower()) == reference_translate(sequence.lower())
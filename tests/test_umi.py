@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# filename: test_umi.py
+
+#
+# Copyright (c) 2017 Bryan Briney
+# License: The MIT license (http://opensource.org/licenses/MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software
+# and associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from Bio import SeqIO
+
+from abstar.utils.umi import build_umi_consensus, consensus, parse_umi_count
+
+
+def write_fastq(path, reads):
+    with open(path, 'w') as f:
+        for seq_id, seq, qual in reads:
+            f.write('@{}\n{}\n+\n{}\n'.format(seq_id, seq, qual))
+    return path
+
+
+def test_consensus_majority_vote():
+    assert consensus(['ACGT', 'ACGT', 'ACCT']) == 'ACGT'
+    # ambiguous bases don't outvote real bases
+    assert consensus(['ANGT', 'ANGT', 'ACGT']) == 'ACGT'
+    assert consensus(['ANGT', 'ANGT']) == 'ANGT'
+
+
+def test_consensus_uses_quality_weights():
+    assert consensus(['ACGT', 'ACGT', 'ACCT'], qualities=[[30, 30, 5, 30], [30, 30, 5, 30], [30, 30, 40, 30]]) == 'ACCT'
+
+
+def test_consensus_ignores_reads_with_a_different_length():
+    assert consensus(['ACGT', 'ACGT', 'TTTTT']) == 'ACGT'
+
+
+def test_parse_umi_count():
+    assert parse_umi_count('read1;size=12') == ('read1', 12)
+    assert parse_umi_count('read1') == ('read1', None)
+
+
+def test_build_umi_consensus(tmpdir):
+    reads = [('r1', 'AAAAACGTACGTACGT', 'I' * 16),
+             ('r2', 'AAAAACGTACGTACGT', 'I' * 16),
+             ('r3', 'AAAAACGTACCTACGT', 'I' * 16),
+             ('r4', 'CCCCCTTTTGGGG', 'I' * 13),
+             # too long, so it doesn't contribute to the AAAAA consensus
+             ('r5', 'AAAAACGTACGTACGTTTT', 'I' * 19)]
+    seq_file = write_fastq(str(tmpdir.join('reads.fastq')), reads)
+    consensus_file, read_count, consensus_count, dropped_count = build_umi_consensus(seq_file, 'fastq', 5,
+                                                                                     str(tmpdir), buckets=4)
+    assert (read_count, consensus_count, dropped_count) == (5, 2, 1)
+    records = {}
+    with open(consensus_file) as f:
+        for s in SeqIO.parse(f, 'fasta'):
+            seq_id, count = parse_umi_count(s.id)
+            records[seq_id] = (count, str(s.seq))
+    assert records['r1'] == (3, 'AAAAACGTACGTACGT')
+    assert records['r4'] == (1, 'CCCCCTTTTGGGG')
+    # bucket files are removed
+    assert sorted([p.basename for p in tmpdir.listdir()]) == ['reads.fastq', 'reads.fastq.umi_consensus']